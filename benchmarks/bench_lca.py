@@ -0,0 +1,230 @@
+"""
+Benchmarks of the functions run for each model, scenario and year (see `pathways.lca`).
+"""
+
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+
+from pathways.lca import (
+    _calculate_year,
+    create_demand_tensor,
+    flag_demands_below_cutoff,
+    get_matrix_filepaths,
+    load_matrix_and_index,
+    process_region,
+)
+from pathways.utils import (
+    _group_technosphere_indices,
+    create_lca_results_array,
+    fetch_inventories_locations,
+    get_location_fallbacks,
+    harmonize_units,
+    read_indices_csv,
+    resolve_breakdown,
+)
+
+from .synthetic import get_datapackage, temporary_cache
+
+SIZES = ["small", "medium"]
+
+
+def get_year_args(p, use_distributions: int = 0) -> tuple:
+    """
+    Arguments of `_calculate_year` for the first model, scenario and year
+    of a Pathways object, for all its regions, variables and LCIA methods,
+    as built by `Pathways.calculate`.
+    """
+    model = p.scenarios.coords["model"].values[0]
+    scenario = p.scenarios.coords["pathway"].values[0]
+    year = int(p.scenarios.coords["year"].values[0])
+    regions = p.scenarios.coords["region"].values.tolist()
+    variables = [str(v) for v in p.scenarios.coords["variables"].values]
+    methods = p.lcia_methods
+
+    scenario_data = harmonize_units(p.scenarios, variables)
+    demand_tensor = create_demand_tensor(
+        scenarios=scenario_data,
+        model=model,
+        scenario=scenario,
+        regions=regions,
+        years=[year],
+        variables=variables,
+        mapping=p.mapping,
+        units_map=p.units,
+    )
+    skip = flag_demands_below_cutoff(demand_tensor["demand"], 0)
+
+    fps = get_matrix_filepaths(p.filepaths, model, scenario, year)
+    technosphere_indices = read_indices_csv(fps["technosphere_index"])
+    locations = fetch_inventories_locations(technosphere_indices)
+    lca_results = create_lca_results_array(
+        methods=methods,
+        years=[year],
+        regions=regions,
+        locations=locations,
+        models=[model],
+        scenarios=[scenario],
+        classifications=p.classifications,
+        mapping={v: None for v in variables},
+        use_distributions=use_distributions > 0,
+    )
+
+    return (
+        model,
+        scenario,
+        year,
+        regions,
+        variables,
+        methods,
+        0,
+        p.filepaths,
+        p.mapping,
+        {
+            "demand": demand_tensor["demand"][..., 0],
+            "skip": skip[..., 0],
+            "unit vector": demand_tensor["unit vector"],
+        },
+        lca_results,
+        p.classifications,
+        p.reverse_classifications,
+        {loc: loc for loc in locations},
+        False,
+        use_distributions,
+        None,
+        None,
+        [],
+        False,
+        0,
+        None,
+        get_location_fallbacks(model, regions),
+        resolve_breakdown("full"),
+    )
+
+
+class LoadMatrix:
+    params = [SIZES, ["technosphere_matrix", "biosphere_matrix"]]
+    param_names = ["size", "matrix"]
+
+    def setup(self, size, matrix):
+        from pathways import Pathways
+
+        p = Pathways(str(get_datapackage(size)))
+        self.filepath = get_matrix_filepaths(
+            p.filepaths,
+            p.scenarios.coords["model"].values[0],
+            p.scenarios.coords["pathway"].values[0],
+            int(p.scenarios.coords["year"].values[0]),
+        )[matrix]
+
+    def time_load_matrix_and_index(self, size, matrix):
+        load_matrix_and_index(self.filepath)
+
+
+class GroupTechnosphereIndices:
+    params = [SIZES]
+    param_names = ["size"]
+
+    def setup(self, size):
+        from pathways import Pathways
+
+        self.p = Pathways(str(get_datapackage(size)))
+        fps = get_matrix_filepaths(
+            self.p.filepaths,
+            self.p.scenarios.coords["model"].values[0],
+            self.p.scenarios.coords["pathway"].values[0],
+            int(self.p.scenarios.coords["year"].values[0]),
+        )
+        self.technosphere_indices = read_indices_csv(fps["technosphere_index"])
+        self.categories = sorted(set(self.p.classifications.values()))
+        self.locations = fetch_inventories_locations(self.technosphere_indices)
+
+    def time_group_by_category(self, size):
+        _group_technosphere_indices(
+            technosphere_indices=self.technosphere_indices,
+            group_by=lambda x: self.p.classifications.get(x[:3], "unclassified"),
+            group_values=self.categories,
+        )
+
+    def time_group_by_location(self, size):
+        _group_technosphere_indices(
+            technosphere_indices=self.technosphere_indices,
+            group_by=lambda x: x[-1],
+            group_values=self.locations,
+            mapping={loc: loc for loc in self.locations},
+        )
+
+
+class ProcessRegion:
+    # (distinct activities, variables, methods, categories, locations)
+    params = [[(50, 20, 3, 50, 10), (500, 150, 10, 200, 30)]]
+    param_names = ["shape"]
+
+    def setup(self, shape):
+        n_activities, n_variables, n_methods, n_categories, n_locations = shape
+        rng = np.random.default_rng(0)
+        unit_results = rng.random((n_activities, n_methods, n_categories, n_locations))
+        # most (category, location) cells are empty
+        unit_results[unit_results < 0.9] = 0
+        variables = [f"variable {v}" for v in range(n_variables)]
+        fus_details = {
+            v: {"id": int(i), "demand": float(d)}
+            for v, i, d in zip(
+                variables,
+                rng.integers(0, n_activities, n_variables),
+                rng.random(n_variables),
+            )
+        }
+        self.data = (
+            "model",
+            "scenario",
+            2030,
+            "region",
+            variables,
+            fus_details,
+            unit_results,
+            {i: i for i in range(n_activities)},
+            False,
+            False,
+        )
+
+    def time_process_region(self, shape):
+        Path(process_region(self.data)).unlink()
+
+
+class CalculateYear:
+    params = [SIZES, [0, 10]]
+    param_names = ["size", "use_distributions"]
+    timeout = 600
+    number = 1
+
+    def setup(self, size, use_distributions):
+        from pathways import Pathways
+
+        # unit-demand results are cached across runs
+        self.cache = ExitStack()
+        self.cache.enter_context(temporary_cache())
+
+        p = Pathways(str(get_datapackage(size)))
+        self.args = get_year_args(p, use_distributions)
+
+    def teardown(self, size, use_distributions):
+        self.cache.close()
+
+    def time_calculate_year(self, size, use_distributions):
+        results = _calculate_year(self.args)
+        # Monte Carlo files are shared by regions
+        filepaths = {
+            filepath
+            for region in results.values()
+            for key in (
+                "iterations_results",
+                "uncertainty_params",
+                "iterations_param_vals",
+                "technosphere_indices",
+            )
+            for filepath in region.get(key, [])
+        }
+        for filepath in filepaths:
+            Path(filepath).unlink()
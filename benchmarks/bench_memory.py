@@ -0,0 +1,225 @@
+"""
+Memory benchmarks of `Pathways.calculate`: peak resident memory (RSS)
+of the main process and all its workers, and size of the main components
+held in memory (results array, matrices, index dictionaries, Monte Carlo buffers...).
+
+The measurements can be checked against the thresholds of `memory_thresholds.json`:
+
+    python -m benchmarks.bench_memory small-deterministic small-monte-carlo
+
+exits with an error if any of them is exceeded. Thresholds depend on the machine
+(e.g., number of workers): update them with `--update` after an intended change.
+"""
+
+import argparse
+import json
+import math
+import pickle
+import sys
+from pathlib import Path
+
+from pathways import Pathways
+from pathways.instrumentation import track_peak_memory
+from pathways.lca import get_matrix_filepaths, load_matrix_and_index
+from pathways.utils import read_indices_csv
+
+from .bench_lca import get_year_args
+from .synthetic import get_datapackage, remove_stats_files, temporary_cache
+
+# name: (datapackage size, number of Monte Carlo iterations)
+CASES = {
+    "small-deterministic": ("small", 0),
+    "small-monte-carlo": ("small", 10),
+    "medium-deterministic": ("medium", 0),
+    "medium-monte-carlo": ("medium", 10),
+}
+
+COMPONENTS = [
+    "results array",
+    "matrices",
+    "index dicts",
+    "classifications",
+    "worker arguments",
+    "monte carlo buffers",
+]
+
+METRICS = ["peak rss", "rss increase", *COMPONENTS]
+
+THRESHOLDS = Path(__file__).parent / "memory_thresholds.json"
+
+
+def deep_sizeof(obj, seen: set = None) -> int:
+    """
+    Size of an object and of the objects it contains, in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    return size
+
+
+def memory_breakdown(p: Pathways, use_distributions: int = 0) -> dict:
+    """
+    Memory used by the main components of a calculation, in MB,
+    once `p.calculate` has run. Matrices, index dictionaries, worker arguments
+    and Monte Carlo buffers are given per (model, scenario, year),
+    that is, per worker.
+
+    :param p: Pathways object, with LCA results.
+    :param use_distributions: Number of Monte Carlo iterations of the calculation.
+    :return: Dictionary of {component: MB}.
+    """
+    results = p.lca_results
+    model, scenario, year = (
+        results.coords["model"].values[0],
+        results.coords["scenario"].values[0],
+        int(results.coords["year"].values[0]),
+    )
+    fps = get_matrix_filepaths(p.filepaths, model, scenario, year)
+
+    breakdown = {
+        "results array": results.nbytes
+        + (p._computed.nbytes if p._computed is not None else 0),
+        "matrices": sum(
+            array.nbytes
+            for matrix in ("technosphere_matrix", "biosphere_matrix")
+            for array in load_matrix_and_index(fps[matrix])
+        ),
+        "index dicts": sum(
+            deep_sizeof(read_indices_csv(fps[index]))
+            for index in ("technosphere_index", "biosphere_index")
+        ),
+        "classifications": deep_sizeof(p.classifications)
+        + deep_sizeof(p.reverse_classifications),
+        "worker arguments": len(pickle.dumps(get_year_args(p, use_distributions))),
+        # the results of all iterations are stacked before quantiles are taken
+        "monte carlo buffers": use_distributions
+        * 8
+        * results.sizes["region"]
+        * results.sizes["variable"]
+        * results.sizes["impact_category"]
+        * results.sizes["act_category"]
+        * results.sizes["location"],
+    }
+
+    return {component: size / 1024**2 for component, size in breakdown.items()}
+
+
+def measure(case: str, multiprocessing: bool = True) -> dict:
+    """
+    Run `Pathways.calculate` on the synthetic datapackage of a case,
+    and measure its memory use.
+
+    :param case: Key of `CASES`.
+    :param multiprocessing: Whether to run the calculation with worker processes.
+    :return: Dictionary of {metric: MB} (see `METRICS`).
+    """
+    size, use_distributions = CASES[case]
+    # unit-demand results are cached across runs
+    with temporary_cache():
+        p = Pathways(str(get_datapackage(size)))
+
+        with track_peak_memory() as memory:
+            p.calculate(
+                demand_cutoff=0,
+                use_distributions=use_distributions,
+                multiprocessing=multiprocessing,
+            )
+    remove_stats_files()
+
+    return {
+        "peak rss": memory["peak"],
+        "rss increase": memory["peak"] - memory["baseline"],
+        **memory_breakdown(p, use_distributions),
+    }
+
+
+def check_thresholds(measurements: dict, thresholds: dict) -> list:
+    """
+    Compare measurements to thresholds.
+
+    :param measurements: Dictionary of {case: {metric: MB}}.
+    :param thresholds: Dictionary of {case: {metric: MB}}.
+    :return: List of (case, metric, measured, threshold) exceeding their threshold.
+    """
+    return [
+        (case, metric, value, thresholds[case][metric])
+        for case, values in measurements.items()
+        for metric, value in values.items()
+        if metric in thresholds.get(case, {}) and value > thresholds[case][metric]
+    ]
+
+
+class Memory:
+    params = [list(CASES), METRICS]
+    param_names = ["case", "metric"]
+    unit = "MB"
+    timeout = 3600
+
+    def setup_cache(self):
+        # each calculation is run once, for all metrics
+        return {case: measure(case) for case in CASES}
+
+    def track_memory(self, measurements, case, metric):
+        return measurements[case][metric]
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure the memory use of Pathways.calculate "
+        "and check it against thresholds."
+    )
+    parser.add_argument(
+        "cases", nargs="*", default=["small-deterministic", "small-monte-carlo"]
+    )
+    parser.add_argument("--no-multiprocessing", action="store_true")
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Set the thresholds of the cases to the measurements, plus a margin.",
+    )
+    parser.add_argument("--margin", type=float, default=0.25)
+    args = parser.parse_args(args)
+
+    measurements = {
+        case: measure(case, multiprocessing=not args.no_multiprocessing)
+        for case in args.cases
+    }
+
+    for case, values in measurements.items():
+        print(f"{case}:")
+        for metric, value in values.items():
+            print(f"    {metric:<20} {value:10.1f} MB")
+
+    thresholds = {}
+    if THRESHOLDS.exists():
+        with open(THRESHOLDS) as f:
+            thresholds = json.load(f)
+
+    if args.update:
+        for case, values in measurements.items():
+            thresholds[case] = {
+                metric: math.ceil(value * (1 + args.margin) * 10) / 10
+                for metric, value in values.items()
+            }
+        with open(THRESHOLDS, "w") as f:
+            json.dump(thresholds, f, indent=4)
+        print(f"Thresholds updated in {THRESHOLDS}")
+        return 0
+
+    exceeded = check_thresholds(measurements, thresholds)
+    for case, metric, value, threshold in exceeded:
+        print(f"{case}: {metric} of {value:.1f} MB exceeds {threshold:.1f} MB")
+
+    return 1 if exceeded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Benchmarks of the Pathways class, end to end.
+"""
+
+import shutil
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+
+from pathways import Pathways
+from pathways.utils import extend_lca_results
+
+from .synthetic import get_datapackage, remove_stats_files, temporary_cache
+
+SIZES = ["small", "medium"]
+
+
+class Calculate:
+    params = [SIZES, [0, 10]]
+    param_names = ["size", "use_distributions"]
+    timeout = 1800
+    number = 1
+
+    def setup(self, size, use_distributions):
+        # unit-demand results are cached across runs
+        self.cache = ExitStack()
+        self.cache.enter_context(temporary_cache())
+        self.p = Pathways(str(get_datapackage(size)))
+
+    def teardown(self, size, use_distributions):
+        self.cache.close()
+        remove_stats_files()
+
+    def time_calculate(self, size, use_distributions):
+        self.p.calculate(
+            demand_cutoff=0,
+            use_distributions=use_distributions,
+            multiprocessing=False,
+        )
+
+
+def random_results(p, density: float = 0.05):
+    """
+    LCA results of the shape `Pathways.calculate` gives for all the scenarios
+    and LCIA methods of a Pathways object, with a share `density` of random non-zero values.
+    """
+    p.calculate(
+        years=p.scenarios.coords["year"].values[:1],
+        regions=p.scenarios.coords["region"].values[:1],
+        variables=[str(v) for v in p.scenarios.coords["variables"].values[:1]],
+        multiprocessing=False,
+    )
+    # extend the results to every coordinate, without computing them
+    p.lca_results = extend_lca_results(
+        p.lca_results,
+        {
+            "year": p.scenarios.coords["year"].values.tolist(),
+            "region": p.scenarios.coords["region"].values.tolist(),
+            "variable": [str(v) for v in p.scenarios.coords["variables"].values],
+            "scenario": p.scenarios.coords["pathway"].values.tolist(),
+        },
+    )
+
+    rng = np.random.default_rng(0)
+    values = rng.random(p.lca_results.shape)
+    values[values > density] = 0
+    p.lca_results.values[:] = values
+
+    return p.lca_results
+
+
+class ExportResults:
+    params = [SIZES, ["parquet", "zarr", "netcdf", "arrow"]]
+    param_names = ["size", "format"]
+    timeout = 600
+    number = 1
+
+    def setup(self, size, format):
+        self.p = Pathways(str(get_datapackage(size)))
+        random_results(self.p)
+        self.directory = Path(tempfile.mkdtemp())
+
+    def teardown(self, size, format):
+        shutil.rmtree(self.directory)
+
+    def time_export_results(self, size, format):
+        self.p.export_results(str(self.directory / "results"), format=format)
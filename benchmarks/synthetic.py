@@ -0,0 +1,514 @@
+"""
+This module generates synthetic premise-style datapackages, of configurable
+size, to benchmark Pathways without the (private) datapackages used in production.
+
+Each (model, scenario, year) gets its own technosphere and biosphere matrices,
+in the same CSV format as the datapackages generated by premise, along with
+scenario data, a mapping of the scenario variables to LCA datasets,
+activity classifications and an LCIA methods file.
+"""
+
+import csv
+import json
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import yaml
+
+# number of elements of each dimension of the generated datapackages
+SIZES = {
+    "small": dict(
+        n_activities=100,
+        technosphere_nnz=500,
+        n_biosphere=20,
+        n_regions=3,
+        n_years=2,
+        n_scenarios=1,
+        n_variables=5,
+        uncertain_share=0.2,
+    ),
+    "medium": dict(
+        n_activities=2_000,
+        technosphere_nnz=20_000,
+        n_biosphere=500,
+        n_regions=12,
+        n_years=4,
+        n_scenarios=2,
+        n_variables=40,
+        uncertain_share=0.3,
+    ),
+    "large": dict(
+        n_activities=20_000,
+        technosphere_nnz=300_000,
+        n_biosphere=2_000,
+        n_regions=21,
+        n_years=6,
+        n_scenarios=3,
+        n_variables=150,
+        uncertain_share=0.5,
+    ),
+}
+
+MODEL = "synthetic"
+UNIT = "kilogram"
+
+MATRIX_HEADER = [
+    "value",
+    "uncertainty type",
+    "loc",
+    "scale",
+    "shape",
+    "minimum",
+    "maximum",
+    "negative",
+    "flip",
+]
+
+
+def _fields(names: list, types: list) -> dict:
+    return {
+        "fields": [
+            {"name": name, "type": type_, "format": "default"}
+            for name, type_ in zip(names, types)
+        ],
+        "missingValues": [""],
+    }
+
+
+def _matrix_schema(index_of: str) -> dict:
+    return _fields(
+        ["index of activity", index_of, *MATRIX_HEADER],
+        ["integer", "integer", "number", "integer"] + ["number"] * 5 + ["boolean"] * 2,
+    )
+
+
+SCHEMAS = {
+    "scenario_data": _fields(
+        ["region", "variables", "year", "value", "unit", "model", "pathway"],
+        ["string", "string", "integer", "number", "string", "string", "string"],
+    ),
+    "a_matrix": _matrix_schema("index of product"),
+    "a_matrix_index": _fields(
+        ["activity", "product", "unit", "location", "value"],
+        ["string"] * 4 + ["integer"],
+    ),
+    "b_matrix": _matrix_schema("index of biosphere flow"),
+    "b_matrix_index": _fields(
+        ["name", "category", "sub category", "unit", "value"],
+        ["string"] * 4 + ["integer"],
+    ),
+}
+
+
+def _csv_resource(name: str, path: Path) -> dict:
+    return {
+        "path": path.as_posix(),
+        "profile": "tabular-data-resource",
+        "name": name,
+        "format": "csv",
+        "mediatype": "text/csv",
+        "encoding": "utf-8",
+        "schema": SCHEMAS[name],
+    }
+
+
+def _yaml_resource(name: str, path: Path) -> dict:
+    return {
+        "path": path.as_posix(),
+        "profile": "data-resource",
+        "name": name,
+        "format": "yaml",
+        "mediatype": "text/yaml",
+        "encoding": "utf-8",
+    }
+
+
+def _write_csv(filepath: Path, rows, header: list = None):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=";")
+        if header:
+            writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _exchange_rows(
+    rng: np.random.Generator,
+    cols: np.ndarray,
+    rows: np.ndarray,
+    values: np.ndarray,
+    uncertain: np.ndarray,
+    flip: np.ndarray,
+) -> list:
+    """
+    Rows of a matrix file. Uncertain exchanges follow
+    a triangular distribution (type 5) around their value.
+    """
+    spread = rng.uniform(0.05, 0.3, size=len(values))
+    return [
+        (
+            [col, row, value, 5, value, "", "", value * (1 - s), value * (1 + s)]
+            if unc
+            else [col, row, value, 0, value, "", "", "", ""]
+        )
+        + [0, int(f)]
+        for col, row, value, unc, s, f in zip(
+            cols.tolist(),
+            rows.tolist(),
+            values.tolist(),
+            uncertain.tolist(),
+            spread.tolist(),
+            flip.tolist(),
+        )
+    ]
+
+
+def _technosphere(
+    rng: np.random.Generator, n_activities: int, nnz: int, uncertain_share: float
+) -> list:
+    """
+    Rows of a technosphere matrix with a unit production on the diagonal,
+    and `nnz` - `n_activities` inputs whose sum per activity is below one,
+    so that the matrix is diagonally dominant, hence invertible.
+    """
+    n_inputs = max(nnz - n_activities, 0)
+    cols = rng.integers(0, n_activities, size=n_inputs)
+    rows = rng.integers(0, n_activities, size=n_inputs)
+    # no input of an activity to itself
+    rows = np.where(rows == cols, (rows + 1) % n_activities, rows)
+    per_column = np.bincount(cols, minlength=n_activities)
+    values = rng.uniform(0.1, 0.9, size=n_inputs) / np.maximum(per_column[cols], 1)
+
+    diagonal = np.arange(n_activities)
+    return _exchange_rows(
+        rng,
+        cols=np.concatenate([diagonal, cols]),
+        rows=np.concatenate([diagonal, rows]),
+        values=np.concatenate([np.ones(n_activities), values]),
+        uncertain=np.concatenate(
+            [
+                np.zeros(n_activities, dtype=bool),
+                rng.random(n_inputs) < uncertain_share,
+            ]
+        ),
+        flip=np.concatenate(
+            [np.zeros(n_activities, dtype=bool), np.ones(n_inputs, dtype=bool)]
+        ),
+    )
+
+
+def _biosphere(
+    rng: np.random.Generator,
+    n_activities: int,
+    n_biosphere: int,
+    flows_per_activity: int,
+    uncertain_share: float,
+) -> list:
+    """
+    Rows of a biosphere matrix with `flows_per_activity` emissions per activity.
+    """
+    flows_per_activity = min(flows_per_activity, n_biosphere)
+    cols = np.repeat(np.arange(n_activities), flows_per_activity)
+    rows = np.concatenate(
+        [
+            rng.choice(n_biosphere, size=flows_per_activity, replace=False)
+            for _ in range(n_activities)
+        ]
+    )
+    return _exchange_rows(
+        rng,
+        cols=cols,
+        rows=rows,
+        values=rng.lognormal(mean=-3, sigma=2, size=len(cols)),
+        uncertain=rng.random(len(cols)) < uncertain_share,
+        flip=np.zeros(len(cols), dtype=bool),
+    )
+
+
+def get_activities(n_activities: int, regions: list) -> list:
+    """
+    Activities of the technosphere matrix, as (name, product, unit, location) tuples.
+    Each product is supplied by a regional activity for each region,
+    and by a global one, like premise's regionalized datasets.
+    """
+    locations = [*regions, "GLO"]
+    n_products = max(n_activities // len(locations), 1)
+
+    activities = []
+    for i in range(n_activities):
+        product, location = divmod(i, len(locations))
+        product = product % n_products
+        activities.append(
+            (
+                f"market for product {product:05d}",
+                f"product {product:05d}",
+                UNIT,
+                # activities beyond the last full product are global
+                locations[location] if i < n_products * len(locations) else "RoW",
+            )
+        )
+
+    return list(dict.fromkeys(activities))
+
+
+def get_biosphere_flows(n_biosphere: int) -> list:
+    """
+    Biosphere flows, as (name, category, sub category, unit) tuples.
+    """
+    compartments = [("air", "unspecified"), ("water", "unspecified"), ("soil", "")]
+    return [
+        (
+            f"flow {i:05d}",
+            compartments[i % len(compartments)][0],
+            compartments[i % len(compartments)][1] or "unspecified",
+            UNIT,
+        )
+        for i in range(n_biosphere)
+    ]
+
+
+def generate_lcia_methods(
+    filepath: Union[str, Path],
+    biosphere_flows: list,
+    n_methods: int = 3,
+    seed: int = 0,
+) -> Path:
+    """
+    Write an LCIA methods file, in the format of `pathways.lcia.LCIA_METHODS`,
+    with characterization factors for a random half of the biosphere flows.
+
+    :param filepath: Path to the JSON file.
+    :param biosphere_flows: Biosphere flows (see `get_biosphere_flows`).
+    :param n_methods: Number of LCIA methods.
+    :param seed: Seed of the random number generator.
+    :return: Path to the JSON file.
+    """
+    rng = np.random.default_rng(seed)
+    methods = []
+    for m in range(n_methods):
+        flows = rng.choice(
+            len(biosphere_flows), size=max(len(biosphere_flows) // 2, 1), replace=False
+        )
+        methods.append(
+            {
+                "name": ["Synthetic", "impact category", f"method {m:02d}"],
+                "unit": "unit",
+                "exchanges": [
+                    {
+                        "name": biosphere_flows[f][0],
+                        "categories": list(biosphere_flows[f][1:3]),
+                        "amount": float(rng.lognormal(0, 1)),
+                    }
+                    for f in sorted(flows.tolist())
+                ],
+            }
+        )
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w") as f:
+        json.dump(methods, f)
+
+    return filepath
+
+
+def generate_datapackage(
+    directory: Union[str, Path],
+    n_activities: int = 100,
+    technosphere_nnz: int = 500,
+    n_biosphere: int = 20,
+    flows_per_activity: int = 5,
+    n_regions: int = 3,
+    n_years: int = 2,
+    n_scenarios: int = 1,
+    n_variables: int = 5,
+    uncertain_share: float = 0.2,
+    n_categories: int = 10,
+    n_methods: int = 3,
+    seed: int = 0,
+) -> Path:
+    """
+    Generate a synthetic datapackage, along with an LCIA methods file
+    (`lcia.json`, to assign to `pathways.lcia.LCIA_METHODS`) covering its biosphere flows.
+
+    :param directory: Directory to write the datapackage to.
+    :param n_activities: Number of activities (rows and columns) of the technosphere matrices.
+    :param technosphere_nnz: Number of non-zero exchanges of the technosphere matrices.
+    :param n_biosphere: Number of biosphere flows.
+    :param flows_per_activity: Number of biosphere flows emitted by each activity.
+    :param n_regions: Number of regions.
+    :param n_years: Number of years, from 2020 onwards every ten years.
+    :param n_scenarios: Number of scenarios.
+    :param n_variables: Number of scenario variables.
+    :param uncertain_share: Share of the exchanges (outside the diagonal) which are uncertain.
+    :param n_categories: Number of activity categories.
+    :param n_methods: Number of LCIA methods.
+    :param seed: Seed of the random number generator.
+    :return: Path to the datapackage.json file.
+    """
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # zero-padded, so that no name is contained in another one
+    regions = [f"R{r:02d}" for r in range(n_regions)]
+    years = [2020 + 10 * y for y in range(n_years)]
+    scenarios = [f"scenario {s:02d}" for s in range(n_scenarios)]
+
+    activities = get_activities(n_activities, regions)
+    n_activities = len(activities)
+    biosphere_flows = get_biosphere_flows(n_biosphere)
+
+    resources = []
+
+    # one set of matrices per scenario and year
+    technosphere_index = [[*act, i] for i, act in enumerate(activities)]
+    biosphere_index = [[*flow, i] for i, flow in enumerate(biosphere_flows)]
+    for scenario in scenarios:
+        for year in years:
+            folder = Path("inventories") / MODEL / scenario / str(year)
+            for name, filename, rows, header in [
+                (
+                    "a_matrix",
+                    "A_matrix.csv",
+                    _technosphere(rng, n_activities, technosphere_nnz, uncertain_share),
+                    ["index of activity", "index of product", *MATRIX_HEADER],
+                ),
+                ("a_matrix_index", "A_matrix_index.csv", technosphere_index, None),
+                (
+                    "b_matrix",
+                    "B_matrix.csv",
+                    _biosphere(
+                        rng,
+                        n_activities,
+                        n_biosphere,
+                        flows_per_activity,
+                        uncertain_share,
+                    ),
+                    ["index of activity", "index of biosphere flow", *MATRIX_HEADER],
+                ),
+                ("b_matrix_index", "B_matrix_index.csv", biosphere_index, None),
+            ]:
+                _write_csv(directory / folder / filename, rows, header)
+                resources.append(_csv_resource(name, folder / filename))
+
+    # scenario variables are mapped to the regionalized products
+    products = list(dict.fromkeys((act[0], act[1]) for act in activities))
+    variables = [f"variable {v:03d}" for v in range(n_variables)]
+    mapping = {
+        variable: {
+            "dataset": [
+                {
+                    "name": products[v % len(products)][0],
+                    "reference product": products[v % len(products)][1],
+                    "unit": UNIT,
+                }
+            ],
+            "scenario variable": variable,
+        }
+        for v, variable in enumerate(variables)
+    }
+
+    scenario_data = [
+        [region, variable, year, float(rng.lognormal(5, 2)), UNIT, MODEL, scenario]
+        for scenario in scenarios
+        for region in regions
+        for variable in variables
+        for year in years
+    ]
+    # the scenario data file is comma-separated
+    (directory / "scenario_data").mkdir(exist_ok=True)
+    with open(directory / "scenario_data" / "scenario_data.csv", "w", newline="") as f:
+        csv.writer(f).writerows(
+            [["region", "variables", "year", "value", "unit", "model", "pathway"]]
+            + scenario_data
+        )
+    resources.insert(
+        0, _csv_resource("scenario_data", Path("scenario_data/scenario_data.csv"))
+    )
+
+    classifications = {
+        act[:3]: f"synthetic category {i % n_categories:02d}"
+        for i, act in enumerate(activities)
+    }
+
+    for name, content in [("mapping", mapping), ("classifications", classifications)]:
+        filepath = directory / name / f"{name}.yaml"
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, "w") as f:
+            yaml.dump(content, f)
+        resources.append(_yaml_resource(name, Path(name) / f"{name}.yaml"))
+
+    generate_lcia_methods(
+        directory / "lcia.json", biosphere_flows, n_methods=n_methods, seed=seed
+    )
+
+    descriptor = {
+        "profile": "tabular-data-package",
+        "name": "synthetic",
+        "title": "synthetic-datapackage",
+        "description": "Synthetic datapackage generated to benchmark pathways.",
+        "scenarios": scenarios,
+        "contributors": [{"title": "pathways", "name": "pathways benchmarks"}],
+        "resources": resources,
+    }
+    with open(directory / "datapackage.json", "w") as f:
+        json.dump(descriptor, f, indent=4)
+
+    return directory / "datapackage.json"
+
+
+def get_datapackage(size: str, directory: Union[str, Path] = None) -> Path:
+    """
+    Return the synthetic datapackage of a given size (see `SIZES`),
+    generated on the first call only, and use its LCIA methods file.
+
+    :param size: Key of `SIZES`.
+    :param directory: Directory to generate the datapackages in.
+        Defaults to a `pathways-benchmarks` folder in the temporary directory.
+    :return: Path to the datapackage.json file.
+    """
+    import pathways.lcia
+
+    directory = Path(directory or Path(tempfile.gettempdir()) / "pathways-benchmarks")
+    filepath = directory / size / "datapackage.json"
+    if not filepath.exists():
+        filepath = generate_datapackage(directory / size, **SIZES[size])
+
+    pathways.lcia.LCIA_METHODS = filepath.parent / "lcia.json"
+
+    return filepath
+
+
+@contextmanager
+def temporary_cache():
+    """
+    Point the cache of Pathways (see `pathways.cache.get_cache`) to an empty
+    temporary directory within the context, so that benchmarks start without
+    cached results, and leave the cache of the user untouched.
+    """
+    import pathways.cache
+
+    previous = pathways.cache.DIR_CACHED_DB
+    with tempfile.TemporaryDirectory() as directory:
+        pathways.cache.DIR_CACHED_DB = Path(directory)
+        pathways.cache.get_cache.cache_clear()
+        try:
+            yield
+        finally:
+            pathways.cache.DIR_CACHED_DB = previous
+            pathways.cache.get_cache.cache_clear()
+
+
+def remove_stats_files():
+    """
+    Remove the Monte Carlo reports written for the synthetic datapackages
+    (see `pathways.stats.log_mc_parameters_to_excel`).
+    """
+    from pathways.filesystem_constants import STATS_DIR
+
+    for filepath in STATS_DIR.glob(f"{MODEL}_*.xlsx"):
+        filepath.unlink()
@@ -1,6 +1,8 @@
 __version__ = (1, 0, 0)
-__all__ = ("__version__", "Pathways", "run_gsa")
+__all__ = ("__version__", "Pathways", "run_gsa", "configure_logging", "merge_shards")
 
 
+from .logs import configure_logging
 from .pathways import Pathways
+from .shards import merge_shards
 from .stats import run_gsa
@@ -0,0 +1,271 @@
+"""
+This module contains a content-addressed, size-bounded cache for intermediate results
+(parsed matrices, characterization matrices, LCA results, etc.), stored in DIR_CACHED_DB.
+
+Entries are keyed by a hash of the input files and of the parameters used to compute them,
+so that they can be reused across runs and shared by concurrent processes.
+When the cache grows beyond its size budget, the least recently used entries are evicted.
+Hits and misses are counted by each process, and added to the statistics shared
+by all processes when they are flushed (e.g., once a calculation of a year completes).
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from .filesystem_constants import DIR_CACHED_DB, VARIABLES
+
+# default size budget of the cache, in bytes
+DEFAULT_CACHE_SIZE = int(VARIABLES.get("CACHE_MAX_SIZE", 5 * 1024**3))
+
+_FILE_DIGESTS = {}
+_MISSING = object()
+
+
+def file_digest(filepath: [str, Path]) -> str:
+    """
+    Return the sha256 digest of a file.
+    Digests are memoized by path, size and modification time,
+    so that a given file is only read once per process.
+    :param filepath: Path to the file.
+    :return: Hexadecimal digest.
+    """
+    filepath = Path(filepath)
+    stat = filepath.stat()
+    memo_key = (str(filepath.resolve()), stat.st_size, stat.st_mtime_ns)
+
+    if memo_key not in _FILE_DIGESTS:
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        _FILE_DIGESTS[memo_key] = digest.hexdigest()
+
+    return _FILE_DIGESTS[memo_key]
+
+
+def make_key(*params: Any, files: Iterable[[str, Path]] = ()) -> str:
+    """
+    Build a cache key from the content of input files and from parameters.
+    Parameters must have a stable `repr` (strings, numbers, and lists, tuples
+    or sorted dictionaries of those).
+    :param params: Parameters the cached value depends on.
+    :param files: Input files the cached value depends on.
+    :return: Hexadecimal key.
+    """
+    digest = hashlib.sha256()
+    for filepath in files:
+        digest.update(file_digest(filepath).encode())
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
+
+
+class Cache:
+    """
+    A content-addressed cache of pickled values, stored on disk.
+
+    :param directory: Directory where the entries are stored.
+    :type directory: Path
+    :param max_size: Size budget of the cache, in bytes.
+    :type max_size: int
+    """
+
+    def __init__(self, directory: [str, Path], max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        # hits and misses of this process, not flushed yet
+        self._counts = {"hits": 0, "misses": 0}
+        self._counts_lock = threading.Lock()
+        # size of the entries, as of the last scan, plus those written since
+        self._size = None
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pkl"
+
+    def _entries(self) -> list:
+        return list(self.directory.glob("*/*.pkl"))
+
+    def _scan(self) -> list:
+        """Return the (modification time, size, path) of each entry."""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @contextmanager
+    def lock(self, timeout: float = 60):
+        """
+        Acquire an exclusive lock on the cache, shared by all processes.
+        A lock older than `timeout` seconds is considered stale and is broken.
+        """
+        lock_path = self.directory / ".lock"
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime > timeout:
+                        lock_path.unlink(missing_ok=True)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            lock_path.unlink(missing_ok=True)
+
+    def _record(self, event: str):
+        """Increment a hit/miss counter of this process."""
+        with self._counts_lock:
+            self._counts[event] += 1
+
+    def flush(self):
+        """
+        Add the hits and misses counted by this process since
+        the last flush to the statistics file shared by all processes.
+        """
+        with self._counts_lock:
+            counts, self._counts = self._counts, {"hits": 0, "misses": 0}
+        if not any(counts.values()):
+            return
+
+        stats_path = self.directory / "stats.json"
+        with self.lock():
+            try:
+                with open(stats_path, "r") as f:
+                    stats = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                stats = {}
+            for event, count in counts.items():
+                stats[event] = stats.get(event, 0) + count
+            with open(stats_path, "w") as f:
+                json.dump(stats, f)
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Return the value stored under `key`, or `default` if there is none.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # mark the entry as recently used
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._record("misses")
+            return default
+
+        self._record("hits")
+        return value
+
+    def set(self, key: str, value: Any):
+        """
+        Store `value` under `key`, then evict entries if the size budget is exceeded.
+        The entry is written to a temporary file first, so that
+        concurrent readers never see a partially written entry.
+        The size of the cache is scanned once, and then tracked, so that entries are
+        only scanned again when the budget is exceeded. It does not include the entries
+        written by other processes since the last scan, which may exceed it meanwhile.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = tmp_path.stat().st_size
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        if self._size is None:
+            self._size = sum(entry[1] for entry in self._scan())
+        else:
+            self._size += size - replaced
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def get_or_compute(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Return the value stored under `key`, computing and storing it with `func` if needed.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its size budget.
+        """
+        with self.lock():
+            entries = self._scan()
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, path in sorted(entries, key=lambda x: x[0]):
+                if size <= self.max_size:
+                    break
+                path.unlink(missing_ok=True)
+                size -= entry_size
+            self._size = size
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._counts_lock:
+            self._counts = {"hits": 0, "misses": 0}
+        with self.lock():
+            for path in self._entries():
+                path.unlink(missing_ok=True)
+            (self.directory / "stats.json").unlink(missing_ok=True)
+            self._size = 0
+
+    def stats(self) -> dict:
+        """
+        Return the number of hits and misses recorded by all processes
+        (as of their last flush, and with those of this process),
+        as well as the number of entries and the size of the cache.
+        """
+        self.flush()
+        try:
+            with open(self.directory / "stats.json", "r") as f:
+                stats = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stats = {}
+
+        entries = self._scan()
+        return {
+            "hits": stats.get("hits", 0),
+            "misses": stats.get("misses", 0),
+            "entries": len(entries),
+            "size": sum(entry[1] for entry in entries),
+            "max_size": self.max_size,
+        }
+
+
+@lru_cache()
+def get_cache() -> Cache:
+    """
+    Return the cache used by Pathways, stored in DIR_CACHED_DB.
+    """
+    return Cache(DIR_CACHED_DB / "store")
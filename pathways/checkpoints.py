@@ -0,0 +1,120 @@
+"""
+This module contains the checkpoints of `Pathways.calculate`: the results of each
+completed (model, scenario, year) are saved in a checkpoint directory, so that
+a calculation interrupted by a crash or a pre-emption can be resumed
+(see `calculate(resume=True)`) without computing them again.
+
+Checkpoints live in DIR_CHECKPOINTS, outside of the cache directory,
+and are removed once a calculation completes.
+"""
+
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import xarray as xr
+
+from .cache import make_key
+from .filesystem_constants import DIR_CHECKPOINTS
+
+# dimensions of the results of a (model, scenario, year), in order
+DIMS = ["act_category", "variable", "region", "location", "impact_category"]
+
+
+def get_checkpoint_directory(*params, files=()) -> Path:
+    """
+    Directory of the checkpoints of a calculation.
+    :param params: Parameters the results depend on (see `pathways.cache.make_key`).
+    :param files: Input files the results depend on.
+    :return: Path to the directory, which may not exist yet.
+    """
+    return DIR_CHECKPOINTS / make_key(*params, files=files)
+
+
+def _get_checkpoint_filepath(
+    directory: Path, model: str, scenario: str, year: int
+) -> Path:
+    # scenario names are not always valid filenames
+    return Path(directory) / f"{make_key(model, scenario, int(year))}.npz"
+
+
+def save_checkpoint(
+    directory: [str, Path],
+    model: str,
+    scenario: str,
+    year: int,
+    results: xr.DataArray,
+):
+    """
+    Save the results of a (model, scenario, year). The file is written
+    under a temporary name first, so that it is either complete or missing.
+    :param directory: Checkpoint directory.
+    :param model: The name of the model.
+    :param scenario: The name of the scenario.
+    :param year: The year of the scenario.
+    :param results: Results, with the dimensions of `DIMS` (and "quantile").
+    """
+    filepath = _get_checkpoint_filepath(directory, model, scenario, year)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    temporary = filepath.with_suffix(".tmp.npz")
+
+    np.savez(
+        temporary,
+        model=model,
+        scenario=scenario,
+        year=int(year),
+        values=results.values,
+        dims=np.array(results.dims),
+        **{f"coords_{dim}": results.coords[dim].values for dim in results.dims},
+    )
+    os.replace(temporary, filepath)
+
+
+def _read_checkpoint(filepath: Path) -> Tuple[str, str, int, xr.DataArray]:
+    with np.load(filepath) as data:
+        dims = data["dims"].tolist()
+        return (
+            str(data["model"]),
+            str(data["scenario"]),
+            int(data["year"]),
+            xr.DataArray(
+                data["values"],
+                dims=dims,
+                coords={dim: data[f"coords_{dim}"] for dim in dims},
+            ),
+        )
+
+
+def load_checkpoint(
+    directory: [str, Path], model: str, scenario: str, year: int
+) -> Optional[xr.DataArray]:
+    """
+    Load the results of a (model, scenario, year) saved by `save_checkpoint`.
+    :return: xr.DataArray, or None if there is no checkpoint.
+    """
+    filepath = _get_checkpoint_filepath(directory, model, scenario, year)
+    if not filepath.exists():
+        return None
+
+    return _read_checkpoint(filepath)[-1]
+
+
+def iter_checkpoints(
+    directory: [str, Path],
+) -> Iterator[Tuple[str, str, int, xr.DataArray]]:
+    """
+    Iterate over the checkpoints of a directory.
+    :return: Iterator of (model, scenario, year, results).
+    """
+    for filepath in sorted(Path(directory).glob("*.npz")):
+        if not filepath.name.endswith(".tmp.npz"):
+            yield _read_checkpoint(filepath)
+
+
+def remove_checkpoints(directory: [str, Path]):
+    """
+    Remove a checkpoint directory and its checkpoints.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
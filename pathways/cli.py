@@ -0,0 +1,176 @@
+"""
+This module contains the command line interface of Pathways:
+
+    pathways calculate datapackage.zip --scenarios SSP2-Base --output results
+    pathways calculate datapackage.zip --shard 0 --num-shards 4 --shard-directory shared/
+    pathways merge shared/ --output results
+    pathways serve --port 8765 --datapackages datapackage.zip
+
+Each shard can run on a different node, as long as they share the shard directory.
+"""
+
+import argparse
+import sys
+
+from .filesystem_constants import STATS_DIR
+from .server import DEFAULT_PORT
+from .utils import BREAKDOWN_DIMS, export_results
+
+FORMATS = ["parquet", "zarr", "netcdf", "arrow"]
+
+
+def _calculate(args: argparse.Namespace):
+    from .pathways import Pathways
+
+    p = Pathways(args.datapackage, debug=args.debug)
+    p.calculate(
+        methods=args.methods,
+        models=args.models,
+        scenarios=args.scenarios,
+        regions=args.regions,
+        years=args.years,
+        variables=args.variables,
+        demand_cutoff=args.demand_cutoff,
+        use_distributions=args.use_distributions,
+        seed=args.seed,
+        multiprocessing=not args.no_multiprocessing,
+        max_memory=args.max_memory,
+        resume=args.resume,
+        retries=args.retries,
+        shard=args.shard,
+        num_shards=args.num_shards,
+        shard_directory=args.shard_directory,
+        breakdown=(
+            args.breakdown[0]
+            if args.breakdown in (["full"], ["totals"])
+            else args.breakdown
+        ),
+    )
+
+    if args.output is not None:
+        export_results(p.lca_results, args.output, format=args.format)
+
+
+def _merge(args: argparse.Namespace):
+    from .shards import merge_shards
+
+    lca_results = merge_shards(args.directory, stats_directory=args.stats_directory)
+    export_results(lca_results, args.output, format=args.format)
+
+
+def _serve(args: argparse.Namespace):
+    from .server import serve
+
+    serve(
+        host=args.host,
+        port=args.port,
+        max_datapackages=args.max_datapackages,
+        datapackages=args.datapackages,
+        max_matrices=args.max_matrices,
+    )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """
+    Parser of the command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="pathways",
+        description="Scenario-level LCA of energy systems and transition pathways.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    calculate = subparsers.add_parser(
+        "calculate",
+        help="Calculate LCA results (see Pathways.calculate).",
+        description="Calculate LCA results, or a shard of them. "
+        "Arguments left out default to all the available values.",
+    )
+    calculate.add_argument("datapackage", help="Path to the datapackage.")
+    for name in ("methods", "models", "scenarios", "regions", "variables"):
+        calculate.add_argument(f"--{name}", nargs="+")
+    calculate.add_argument("--years", nargs="+", type=int)
+    calculate.add_argument("--demand-cutoff", type=float, default=1e-3)
+    calculate.add_argument(
+        "--use-distributions",
+        type=int,
+        default=0,
+        help="Number of Monte Carlo iterations.",
+    )
+    calculate.add_argument("--seed", type=int, default=0)
+    calculate.add_argument("--no-multiprocessing", action="store_true")
+    calculate.add_argument("--max-memory", type=float, help="Memory available, in MB.")
+    calculate.add_argument("--resume", action="store_true")
+    calculate.add_argument("--retries", type=int, default=1)
+    calculate.add_argument("--shard", type=int, help="Index of the shard.")
+    calculate.add_argument("--num-shards", type=int, default=1)
+    calculate.add_argument("--shard-directory", help="Directory shared by the shards.")
+    calculate.add_argument(
+        "--breakdown",
+        nargs="+",
+        default=["full"],
+        choices=["full", "totals", *BREAKDOWN_DIMS],
+        help="Dimensions to break the results down by, or 'full' for all of them, "
+        "or 'totals' for the variables only. The results are summed over the others.",
+    )
+    calculate.add_argument(
+        "--output", help="File to export the results to, without extension."
+    )
+    calculate.add_argument("--format", default="parquet", choices=FORMATS)
+    calculate.add_argument("--debug", action="store_true")
+    calculate.set_defaults(func=_calculate)
+
+    merge = subparsers.add_parser(
+        "merge",
+        help="Merge the results of shards.",
+        description="Assemble the results and Monte Carlo statistics "
+        "written by all the shards of a calculation.",
+    )
+    merge.add_argument("directory", help="Directory shared by the shards.")
+    merge.add_argument(
+        "--output", help="File to export the results to, without extension."
+    )
+    merge.add_argument("--format", default="parquet", choices=FORMATS)
+    merge.add_argument(
+        "--stats-directory",
+        default=STATS_DIR,
+        help="Directory to write the Monte Carlo statistics to.",
+    )
+    merge.set_defaults(func=_merge)
+
+    serve = subparsers.add_parser(
+        "serve",
+        help="Run a calculation server (see pathways.server).",
+        description="Answer calculation and result queries over HTTP, "
+        "keeping the datapackages used last in memory.",
+    )
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument(
+        "--max-datapackages",
+        type=int,
+        default=4,
+        help="Number of datapackages kept in memory.",
+    )
+    serve.add_argument(
+        "--max-matrices",
+        type=int,
+        default=8,
+        help="Number of (model, scenario, year) whose matrices are kept in memory.",
+    )
+    serve.add_argument(
+        "--datapackages", nargs="+", default=[], help="Datapackages to load right away."
+    )
+    serve.set_defaults(func=_serve)
+
+    return parser
+
+
+def main(args=None) -> int:
+    args = get_parser().parse_args(args)
+    try:
+        args.func(args)
+    except (FileNotFoundError, ValueError, MemoryError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
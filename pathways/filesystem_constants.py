@@ -42,6 +42,18 @@ else:
     DIR_CACHED_DB = USER_DATA_BASE_DIR / "cache"
 DIR_CACHED_DB.mkdir(parents=True, exist_ok=True)
 
+if "DIR_CHECKPOINTS" in VARIABLES:
+    DIR_CHECKPOINTS = Path(VARIABLES.get("DIR_CHECKPOINTS"))
+else:
+    DIR_CHECKPOINTS = USER_DATA_BASE_DIR / "checkpoints"
+DIR_CHECKPOINTS.mkdir(parents=True, exist_ok=True)
+
+if "DIR_GEOMAP" in VARIABLES:
+    DIR_GEOMAP = Path(VARIABLES.get("DIR_GEOMAP"))
+else:
+    DIR_GEOMAP = USER_DATA_BASE_DIR / "geomap"
+DIR_GEOMAP.mkdir(parents=True, exist_ok=True)
+
 if "USER_LOGS_DIR" in VARIABLES:
     USER_LOGS_DIR = Path(VARIABLES["USER_LOGS_DIR"])
 else:
@@ -0,0 +1,238 @@
+"""
+This module contains the instrumentation of Pathways: the wall time, CPU time
+and peak resident memory (RSS) of each stage of a calculation are recorded,
+for each model, scenario, year and region they apply to.
+
+Records are collected by `Pathways.timings`, can be exported as a JSON trace
+(see `export_trace`), and are passed to the hooks registered with `add_hook`.
+The peak memory of a calculation, workers included, is measured with `track_peak_memory`.
+
+Collectors are specific to each thread (and asyncio task), so that calculations
+run at the same time in several threads (e.g., by a server) do not mix their records.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# stages of a calculation, in the order they are run
+STAGES = [
+    "validation",
+    "scenario ingest",
+    "matrix load",
+    "indexing",
+    "solve",
+    "characterization",
+    "aggregation",
+    "result write",
+    "export",
+]
+
+CONTEXT = ["model", "scenario", "year", "region"]
+
+COLUMNS = ["stage", *CONTEXT, "pid", "start", "wall", "cpu", "peak_rss"]
+
+_HOOKS: List[Callable[[dict], None]] = []
+# active collectors, innermost last, and number of them suspending the hooks
+_COLLECTORS = contextvars.ContextVar("collectors", default=())
+_HOOKS_SUSPENDED = contextvars.ContextVar("hooks_suspended", default=0)
+
+
+def add_hook(hook: Callable[[dict], None]):
+    """
+    Register a function called with each record, once its stage is completed.
+    Records are dictionaries with the keys listed in `COLUMNS`.
+    Records of stages run in worker processes are passed to the hooks
+    of the main process once the worker returns.
+    :param hook: Function taking a record as argument.
+    """
+    _HOOKS.append(hook)
+
+
+def remove_hook(hook: Callable[[dict], None]):
+    """
+    Unregister a function registered with `add_hook`.
+    """
+    _HOOKS.remove(hook)
+
+
+def get_peak_rss() -> [float, None]:
+    """
+    Return the peak resident memory of the current process, in MB,
+    or None if it cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    return _maxrss_to_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _maxrss_to_mb(maxrss: int) -> float:
+    # kilobytes on Linux, bytes on macOS
+    return maxrss / 1024**2 if os.uname().sysname == "Darwin" else maxrss / 1024
+
+
+def get_total_rss() -> [float, None]:
+    """
+    Return the resident memory of the current process and
+    of all its children (e.g., worker processes), in MB,
+    or None if psutil is not installed.
+    Pages shared by several processes are counted once per process.
+    """
+    if psutil is None:
+        return None
+    process = psutil.Process()
+    total = 0
+    for proc in [process, *process.children(recursive=True)]:
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:  # the process ended in the meantime
+            pass
+    return total / 1024**2
+
+
+@contextmanager
+def track_peak_memory(interval: float = 0.01):
+    """
+    Track the peak resident memory of the current process and all its children,
+    summed, while the code within the context runs.
+    The memory is sampled every `interval` seconds with psutil. Without psutil,
+    the largest of the peaks of the current process and of its largest child
+    is reported instead (see `resource.getrusage`).
+    :param interval: Sampling interval, in seconds.
+    :return: Dictionary with the "baseline" and "peak" resident memory, in MB,
+    filled once the context exits.
+    """
+    memory = {"baseline": get_total_rss() or get_peak_rss(), "peak": None}
+
+    if psutil is None:
+        try:
+            yield memory
+        finally:
+            peaks = [get_peak_rss()]
+            if resource is not None:
+                children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+                peaks.append(_maxrss_to_mb(children))
+            memory["peak"] = max([p for p in peaks if p is not None], default=None)
+        return
+
+    peak = [memory["baseline"]]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            peak[0] = max(peak[0], get_total_rss())
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        yield memory
+    finally:
+        done.set()
+        thread.join()
+        memory["peak"] = max(peak[0], get_total_rss())
+
+
+def emit(record: dict):
+    """
+    Add a record to the innermost active collector, and pass it to the hooks.
+    """
+    collectors = _COLLECTORS.get()
+    if collectors:
+        collectors[-1].append(record)
+
+    if not _HOOKS_SUSPENDED.get():
+        for hook in _HOOKS:
+            hook(record)
+
+
+@contextmanager
+def collect_timings(call_hooks: bool = True):
+    """
+    Collect the records of the stages run within the context.
+    :param call_hooks: If False, records are not passed to the hooks
+    (e.g., in worker processes, whose records are emitted again by the main process).
+    :return: List of records, filled as stages complete.
+    """
+    records = []
+    _COLLECTORS.set((*_COLLECTORS.get(), records))
+    if not call_hooks:
+        _HOOKS_SUSPENDED.set(_HOOKS_SUSPENDED.get() + 1)
+    try:
+        yield records
+    finally:
+        # by identity, as contexts may exit in any order within generators
+        _COLLECTORS.set(tuple(c for c in _COLLECTORS.get() if c is not records))
+        if not call_hooks:
+            _HOOKS_SUSPENDED.set(_HOOKS_SUSPENDED.get() - 1)
+
+
+@contextmanager
+def stage(name: str, **context):
+    """
+    Record the wall time, CPU time and peak RSS of the code run within the context.
+    :param name: Name of the stage (see `STAGES`).
+    :param context: Model, scenario, year and/or region the stage applies to.
+    """
+    start = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        emit(
+            {
+                "stage": name,
+                **{key: context.get(key) for key in CONTEXT},
+                "pid": os.getpid(),
+                "start": start,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.process_time() - cpu,
+                "peak_rss": get_peak_rss(),
+            }
+        )
+
+
+def export_trace(records: List[dict], filepath: [str, Path]) -> Path:
+    """
+    Export records as a JSON trace, in the Trace Event Format
+    read by chrome://tracing and https://ui.perfetto.dev.
+    :param records: List of records.
+    :param filepath: Path to the JSON file.
+    :return: Path to the JSON file.
+    """
+    events = [
+        {
+            "name": record["stage"],
+            "ph": "X",
+            "ts": record["start"] * 1e6,
+            "dur": record["wall"] * 1e6,
+            "pid": record["pid"],
+            "tid": record["pid"],
+            "args": {
+                key: record[key]
+                for key in [*CONTEXT, "cpu", "peak_rss"]
+                if record[key] is not None
+            },
+        }
+        for record in records
+    ]
+
+    filepath = Path(filepath)
+    with open(filepath, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    return filepath
@@ -3,11 +3,15 @@ This module contains functions to calculate the Life Cycle Assessment (LCA) resu
 
 """
 
+import contextvars
 import logging
 import pickle
+import threading
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import bw2calc as bc
 import bw_processing as bwp
@@ -17,8 +21,12 @@ import sparse as sp
 from bw_processing import Datapackage
 from premise.geomap import Geomap
 from scipy import sparse
+from scipy.sparse.linalg import splu
 
-from .filesystem_constants import DIR_CACHED_DB, USER_LOGS_DIR
+from .cache import get_cache, make_key
+from .filesystem_constants import DIR_CACHED_DB
+from .instrumentation import collect_timings, stage
+from . import lcia
 from .lcia import fill_characterization_factors_matrices
 from .subshares import (
     adjust_matrix_based_on_shares,
@@ -26,10 +34,13 @@ from .subshares import (
     get_subshares_matrix,
 )
 from .utils import (
+    TOTAL,
     CustomFilter,
     _group_technosphere_indices,
     check_unclassified_activities,
     fetch_indices,
+    get_dense_values,
+    get_geomap,
     get_unit_conversion_factors,
     read_indices_csv,
     apply_filters,
@@ -37,13 +48,55 @@ from .utils import (
     read_categories_from_yaml,
 )
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename=USER_LOGS_DIR / "pathways.log",  # Log file to save the entries
-    filemode="a",  # Append to the log file if it exists, 'w' to overwrite
-    format="%(asctime)s - %(levelname)s - %(module)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+logger = logging.getLogger(__name__)
+
+# matrices of the (model, scenario, year) calculated last, kept in memory (see `keep_matrices`)
+_KEPT_MATRICES = contextvars.ContextVar("kept_matrices", default=None)
+_KEPT_MATRICES_LOCK = threading.Lock()
+
+
+@contextmanager
+def keep_matrices(matrices: OrderedDict, max_matrices: int):
+    """
+    Keep the matrices of the `max_matrices` (model, scenario, year) calculated last
+    in `matrices`, for the deterministic calculations run in this thread within the context
+    (e.g., by a long-running server): their technosphere matrix is then loaded and
+    factorized once, and their characterization matrices are built once.
+    Calculations run in other processes do not use them.
+
+    :param matrices: Matrices kept, from the least to the most recently used.
+        They are shared by the contexts given the same dictionary.
+    :param max_matrices: Number of (model, scenario, year) whose matrices are kept.
+    """
+    token = _KEPT_MATRICES.set((matrices, max_matrices))
+    try:
+        yield
+    finally:
+        _KEPT_MATRICES.reset(token)
+
+
+def _get_kept_matrices(key: str, load: Callable[[], dict]) -> Optional[dict]:
+    """
+    Return the matrices kept under `key` (see `keep_matrices`), loading them with `load`
+    if needed, or None outside of `keep_matrices`.
+    """
+    kept = _KEPT_MATRICES.get()
+    if kept is None:
+        return None
+    matrices, max_matrices = kept
+
+    with _KEPT_MATRICES_LOCK:
+        if key in matrices:
+            matrices.move_to_end(key)
+            return matrices[key]
+
+    value = load()
+    with _KEPT_MATRICES_LOCK:
+        matrices[key] = value
+        while len(matrices) > max_matrices:
+            matrices.popitem(last=False)
+
+    return value
 
 
 def load_matrix_and_index(
@@ -89,35 +142,19 @@ def load_matrix_and_index(
     return data_array, indices_array, flip_array, distributions_array
 
 
-def get_lca_matrices(
-    filepaths: list,
-    model: str,
-    scenario: str,
-    year: int,
-    mapping: Dict = None,
-    regions: List[str] = None,
-    variables: List[str] = None,
-    geo: Geomap = None,
-    remove_uncertainty: bool = False,
-) -> tuple[
-    Datapackage,
-    dict[tuple[str, str, str, str], int],
-    dict[tuple, int],
-    list[tuple[int, int]],
-    [dict, None],
-]:
+def get_matrix_filepaths(
+    filepaths: list, model: str, scenario: str, year: int
+) -> Dict[str, Path]:
     """
-    Retrieve Life Cycle Assessment (LCA) matrices from disk.
+    Find the technosphere and biosphere matrices, and their indices,
+    of a given model, scenario and year among the datapackage filepaths.
 
     :param filepaths: A list of filepaths containing the LCA matrices.
-    :type filepaths: List[str]
     :param model: The name of the model.
-    :type model: str
     :param scenario: The name of the scenario.
-    :type scenario: str
     :param year: The year of the scenario.
-    :type year: int
-    :rtype: Tuple[sparse.csr_matrix, sparse.csr_matrix, Dict, Dict, List]
+    :return: A dictionary with the paths to "technosphere_matrix", "technosphere_index",
+        "biosphere_matrix" and "biosphere_index".
     """
 
     # find the correct filepaths in filepaths
@@ -142,49 +179,110 @@ def get_lca_matrices(
     if len(fps) != 4:
         raise ValueError(f"Expected 4 filepaths, got {len(fps)}")
 
-    fp_technosphere_inds = select_filepath("A_matrix_index", fps)
-    fp_biosphere_inds = select_filepath("B_matrix_index", fps)
-    technosphere_inds = read_indices_csv(fp_technosphere_inds)
-    biosphere_inds = read_indices_csv(fp_biosphere_inds)
-    # remove the last element of the tuple, which is the index
-    biosphere_inds = {k[:-1]: v for k, v in biosphere_inds.items()}
+    matrices = [fp for fp in fps if "index" not in fp.name]
 
-    # Fetch indices
-    if geo is not None:
-        vars_info = fetch_indices(mapping, regions, variables, technosphere_inds, geo)
-    else:
-        vars_info = None
+    return {
+        "technosphere_matrix": select_filepath("A_matrix", matrices),
+        "technosphere_index": select_filepath("A_matrix_index", fps),
+        "biosphere_matrix": select_filepath("B_matrix", matrices),
+        "biosphere_index": select_filepath("B_matrix_index", fps),
+    }
 
-    dp = bwp.create_datapackage()
 
-    fp_A = select_filepath("A_matrix", [fp for fp in fps if "index" not in fp.name])
-    fp_B = select_filepath("B_matrix", [fp for fp in fps if "index" not in fp.name])
+def get_lca_matrices(
+    filepaths: list,
+    model: str,
+    scenario: str,
+    year: int,
+    mapping: Dict = None,
+    regions: List[str] = None,
+    variables: List[str] = None,
+    geo: Geomap = None,
+    remove_uncertainty: bool = False,
+    location_fallbacks: Dict[str, List[str]] = None,
+) -> tuple[
+    Datapackage,
+    dict[tuple[str, str, str, str], int],
+    dict[tuple, int],
+    list[tuple[int, int]],
+    [dict, None],
+]:
+    """
+    Retrieve Life Cycle Assessment (LCA) matrices from disk.
 
-    # Load matrices and add them to the datapackage
-    uncertain_parameters = None
-    for matrix_name, fp in [("technosphere_matrix", fp_A), ("biosphere_matrix", fp_B)]:
-        data, indices, sign, distributions = load_matrix_and_index(fp)
+    :param filepaths: A list of filepaths containing the LCA matrices.
+    :type filepaths: List[str]
+    :param model: The name of the model.
+    :type model: str
+    :param scenario: The name of the scenario.
+    :type scenario: str
+    :param year: The year of the scenario.
+    :type year: int
+    :param location_fallbacks: Locations to look activities up for, per region (see `get_location_fallbacks`).
+    :type location_fallbacks: dict
+    :rtype: Tuple[sparse.csr_matrix, sparse.csr_matrix, Dict, Dict, List]
+    """
 
-        # remove uncertainty data
-        if remove_uncertainty is True:
-            distributions = np.array(
-                [
-                    (0, None, None, None, None, None, False)
-                    for _ in range(len(distributions))
-                ],
-                dtype=bwp.UNCERTAINTY_DTYPE,
+    fps = get_matrix_filepaths(filepaths, model, scenario, year)
+    cache = get_cache()
+
+    with stage("matrix load", model=model, scenario=scenario, year=year):
+        technosphere_inds = cache.get_or_compute(
+            make_key("read_indices_csv", files=[fps["technosphere_index"]]),
+            lambda: read_indices_csv(fps["technosphere_index"]),
+        )
+        biosphere_inds = cache.get_or_compute(
+            make_key("read_indices_csv", files=[fps["biosphere_index"]]),
+            lambda: read_indices_csv(fps["biosphere_index"]),
+        )
+        # remove the last element of the tuple, which is the index
+        biosphere_inds = {k[:-1]: v for k, v in biosphere_inds.items()}
+
+        dp = bwp.create_datapackage()
+
+        # Load matrices and add them to the datapackage
+        uncertain_parameters = None
+        for matrix_name in ["technosphere_matrix", "biosphere_matrix"]:
+            fp = fps[matrix_name]
+            data, indices, sign, distributions = cache.get_or_compute(
+                make_key("load_matrix_and_index", files=[fp]),
+                lambda: load_matrix_and_index(fp),
             )
 
-        if matrix_name == "technosphere_matrix":
-            uncertain_parameters = find_uncertain_parameters(distributions, indices)
+            # remove uncertainty data
+            if remove_uncertainty is True:
+                distributions = np.array(
+                    [
+                        (0, None, None, None, None, None, False)
+                        for _ in range(len(distributions))
+                    ],
+                    dtype=bwp.UNCERTAINTY_DTYPE,
+                )
 
-        dp.add_persistent_vector(
-            matrix=matrix_name,
-            indices_array=indices,
-            data_array=data,
-            flip_array=sign if matrix_name == "technosphere_matrix" else None,
-            distributions_array=distributions,
-        )
+            if matrix_name == "technosphere_matrix":
+                uncertain_parameters = find_uncertain_parameters(distributions, indices)
+
+            dp.add_persistent_vector(
+                matrix=matrix_name,
+                indices_array=indices,
+                data_array=data,
+                flip_array=sign if matrix_name == "technosphere_matrix" else None,
+                distributions_array=distributions,
+            )
+
+    # Fetch indices
+    with stage("indexing", model=model, scenario=scenario, year=year):
+        if geo is not None or location_fallbacks is not None:
+            vars_info = fetch_indices(
+                mapping,
+                regions,
+                variables,
+                technosphere_inds,
+                geo=geo,
+                location_fallbacks=location_fallbacks,
+            )
+        else:
+            vars_info = None
 
     return dp, technosphere_inds, biosphere_inds, uncertain_parameters, vars_info
 
@@ -231,66 +329,111 @@ def remove_double_counting(
     return technosphere_matrix.tocsr()
 
 
-def create_functional_units(
+def create_demand_tensor(
     scenarios,
-    region,
-    model,
-    scenario,
-    year,
-    variables,
-    vars_idx,
-    units_map,
-) -> [dict, dict]:
-    variables_demand = {}
+    model: str,
+    scenario: str,
+    regions: List[str],
+    years: List[int],
+    variables: List[str],
+    mapping: dict,
+    units_map: dict,
+) -> dict:
+    """
+    Turn the scenario data of a given model and scenario into a numpy demand tensor
+    of shape (variables, regions, years), expressed in the units of the LCA datasets.
+    Demand vectors for a given region and year are then simple views of that tensor.
 
-    total_demand = (
-        scenarios.sel(
-            region=region,
-            model=model,
-            pathway=scenario,
-            year=year,
-        )
-        .sum(dim="variables")
-        .values
+    :param scenarios: xr.DataArray with scenario data (dense or sparse).
+    :param model: The name of the model.
+    :param scenario: The name of the scenario.
+    :param regions: List of regions.
+    :param years: List of years.
+    :param variables: List of variables.
+    :param mapping: Mapping of scenario variables to LCA datasets.
+    :param units_map: Units conversion mapping.
+    :return: A dictionary with the demand tensor, the unit conversion factor of each variable,
+        and the variables, regions and years of its dimensions.
+    """
+
+    # select one dimension at a time, as
+    # sparse arrays do not support outer indexing
+    data = (
+        scenarios.sel(model=model, pathway=scenario)
+        .sel(variables=variables)
+        .sel(region=regions)
+        .sel(year=years)
+        .transpose("variables", "region", "year")
     )
 
-    if total_demand == 0:
-        logging.info(
-            f"Total demand for {region}, {model}, {scenario}, {year} is zero. "
-            f"Skipping."
-        )
+    # one conversion factor per variable, from the scenario unit
+    # to the unit of the LCA dataset the variable is mapped to
+    unit_vector = np.array(
+        [
+            get_unit_conversion_factors(
+                scenarios.attrs["units"][variable],
+                mapping[variable]["dataset"][0]["unit"],
+                units_map,
+            )
+            .astype(float)
+            .item()
+            for variable in variables
+        ]
+    )
+
+    # missing values are considered as no demand
+    demand = np.nan_to_num(get_dense_values(data).astype(float))
+    demand *= unit_vector[:, np.newaxis, np.newaxis]
+
+    return {
+        "demand": demand,
+        "unit vector": unit_vector,
+        "variables": list(variables),
+        "regions": list(regions),
+        "years": list(years),
+    }
+
+
+def flag_demands_below_cutoff(demand: np.ndarray, demand_cutoff: float) -> np.ndarray:
+    """
+    Flag the demands that are zero or whose absolute value is below
+    `demand_cutoff`, so that their calculation can be skipped.
+
+    :param demand: Demand tensor (see `create_demand_tensor`).
+    :param demand_cutoff: Demand cutoff.
+    :return: A boolean array of the same shape, True where the calculation can be skipped.
+    """
+    demand = np.abs(demand)
+    return (demand == 0) | (demand < demand_cutoff)
+
+
+def create_functional_units(
+    demand: np.ndarray,
+    variables: List[str],
+    vars_idx: dict,
+    unit_vector: np.ndarray,
+) -> [dict, dict]:
+    """
+    Create the functional units for a given region and year.
+
+    :param demand: Demand vector of the region and year, one value per variable,
+        already converted to the units of the LCA datasets (see `create_demand_tensor`).
+    :param variables: List of variables.
+    :param vars_idx: Indices and datasets of the variables in the technosphere matrix.
+    :param unit_vector: Unit conversion factor of each variable.
+    :return: A dictionary of functional units and a dictionary with their details.
+    """
+    variables_demand = {}
 
     for v, variable in enumerate(variables):
         idx, dataset = vars_idx[variable]["idx"], vars_idx[variable]["dataset"]
-        # Compute the unit conversion vector for the given activities
-        dataset_unit = dataset[2]
-
-        # check if we need units conversion
-        unit_vector = get_unit_conversion_factors(
-            scenarios.attrs["units"][variable],
-            dataset_unit,
-            units_map,
-        ).astype(float)
-
-        # Fetch the demand for the given
-        # region, model, pathway, and year
-        demand = (
-            scenarios.sel(
-                variables=variable,
-                region=region,
-                model=model,
-                pathway=scenario,
-                year=year,
-            ).values
-            * unit_vector
-        )
 
         variables_demand[variable] = {
             "id": idx,
-            "demand": demand,
-            "fu": {idx: demand},
+            "demand": demand[v],
+            "fu": {idx: demand[v]},
             "dataset": dataset,
-            "unit vector": unit_vector,
+            "unit vector": unit_vector[v],
         }
 
     return {
@@ -298,42 +441,21 @@ def create_functional_units(
     }, variables_demand
 
 
-def process_region(data: Tuple) -> Dict[str, str | List[str] | List[int]]:
-    """
-    Process the region data.
-    :param data: Tuple containing the model, scenario, year, region, variables, vars_idx, scenarios, units_map,
-                    demand_cutoff, lca, characterization_matrix, debug, use_distributions, uncertain_parameters.
-    :return: Dictionary containing the region data.
+def get_loc_cat_indices(
+    acts_category_idx_dict: dict, acts_location_idx_dict: dict
+) -> Dict[Tuple[int, int], np.ndarray]:
     """
-    (
-        model,
-        scenario,
-        year,
-        region,
-        variables,
-        fus_details,
-        scenarios,
-        units_map,
-        demand_cutoff,
-        lca,
-        characterization_matrix,
-        methods,
-        debug,
-        use_distributions,
-        uncertain_parameters,
-    ) = data
-
-    id_uncertainty_indices_filepath = None
-    id_technosphere_indices_filepath = None
-    iter_results_files = []
-    iter_param_vals_filepath = None
+    Find the technosphere indices belonging to each
+    (activity category, location) combination.
 
+    :param acts_category_idx_dict: Technosphere indices grouped by activity category.
+    :param acts_location_idx_dict: Technosphere indices grouped by location.
+    :return: A dictionary mapping (category position, location position) to arrays of indices.
+    """
     dict_loc_cat = {}
 
-    cat_counter = 0
-    for cat, act_cat_idx in lca.acts_category_idx_dict.items():
-        loc_counter = 0
-        for loc, act_loc_idx in lca.acts_location_idx_dict.items():
+    for cat_counter, act_cat_idx in enumerate(acts_category_idx_dict.values()):
+        for loc_counter, act_loc_idx in enumerate(acts_location_idx_dict.values()):
             # Find the intersection of indices
             idx = np.intersect1d(act_cat_idx, act_loc_idx)
             # Filter out any -1 indices
@@ -344,160 +466,174 @@ def process_region(data: Tuple) -> Dict[str, str | List[str] | List[int]]:
                 # to the dict_loc_cat with (cat, loc) as key
                 dict_loc_cat[(cat_counter, loc_counter)] = filtered_idx
 
-            loc_counter += 1
-        cat_counter += 1
-
-    if use_distributions == 0:
-        # Regular LCA calculations
-        with CustomFilter("(almost) singular matrix"):
-            lca.lci()
-
-        if debug:
-            logging.info(f"Iterations no.: {use_distributions}.")
+    return dict_loc_cat
 
-        # Create a numpy array with the results
-        inventory_results = np.array(
-            [
-                (characterization_matrix @ value).toarray()
-                for value in lca.inventories.values()
-            ]
-        )
-
-        if debug:
-            logging.info(f"Shape of inventory_results: {inventory_results.shape}")
 
-        if debug:
-            for fu, inventory in lca.inventories.items():
-                logging.info(
-                    f"Functional unit: {fu}. Impact: {(characterization_matrix @ inventory).sum()}"
-                )
+def characterize_inventories(
+    lca: bc.MultiLCA,
+    characterization_matrix: sparse.csr_matrix,
+    dict_loc_cat: Dict[Tuple[int, int], np.ndarray],
+    shape: Tuple[int, int],
+) -> np.ndarray:
+    """
+    Characterize the inventories of a solved MultiLCA object and
+    aggregate them by activity category and location.
+
+    :param lca: Solved bw2calc.MultiLCA object.
+    :param characterization_matrix: Characterization matrix (methods x biosphere flows).
+    :param dict_loc_cat: Output of `get_loc_cat_indices`.
+    :param shape: Number of activity categories and of locations.
+    :return: An array of shape (functional units, methods, categories, locations).
+    """
+    # Create a numpy array with the results
+    inventory_results = np.array(
+        [
+            (characterization_matrix @ value).toarray()
+            for value in lca.inventories.values()
+        ]
+    )
 
-        iter_results = np.zeros(
-            (
-                inventory_results.shape[0],
-                inventory_results.shape[1],
-                len(lca.acts_category_idx_dict),
-                len(lca.acts_location_idx_dict),
-            )
+    results = np.zeros(
+        (
+            inventory_results.shape[0],
+            inventory_results.shape[1],
+            *shape,
         )
+    )
 
-        if debug:
-            logging.info(f"Shape of iter_results: {iter_results.shape}")
+    for (cat, loc), idx in dict_loc_cat.items():
+        results[:, :, cat, loc] = inventory_results[:, :, idx].sum(axis=2)
 
-        for (cat, loc), idx in dict_loc_cat.items():
-            iter_results[:, :, cat, loc] = inventory_results[:, :, idx].sum(axis=2)
+    return results
 
-        if debug:
-            for f, fu in enumerate(lca.inventories.keys()):
-                logging.info(f"Functional unit: {fu}. Impact: {iter_results[f].sum()}")
-
-        # Save iteration results to disk
-        iter_results_filepath = DIR_CACHED_DB / f"iter_results_{uuid.uuid4()}.npz"
-        sp.save_npz(
-            filename=iter_results_filepath,
-            matrix=sp.COO(iter_results),
-            compressed=True,
-        )
-        iter_results_files.append(iter_results_filepath)
 
+def characterize_intensities(
+    lca: bc.MultiLCA,
+    characterization_matrix: sparse.csr_matrix,
+    activities: list,
+    factors=None,
+) -> np.ndarray:
+    """
+    Total impacts of a unit demand of the given activities, without their inventories.
+    Impacts are C.B.A^-1.f, so solving the transposed technosphere system once per method
+    gives the impact of a unit demand of every activity (adjoint formulation):
+    the number of solves is the number of methods, whatever the number of activities.
+
+    :param lca: bw2calc.MultiLCA object, whose matrices are loaded.
+    :param characterization_matrix: Characterization matrix (methods x biosphere flows).
+    :param activities: Indices of the activities in the technosphere matrix.
+    :param factors: LU factorization of the technosphere matrix (see `keep_matrices`), if any.
+    :return: An array of shape (activities, methods, 1, 1).
+    """
+    characterized = (characterization_matrix @ lca.biosphere_matrix).T.toarray()
+    if factors is not None:
+        intensities = factors.solve(characterized, trans="T")
     else:
-        # Use distributions for LCA calculations
-        iter_param_vals = []
-        with CustomFilter("(almost) singular matrix"):
-            for iteration in range(use_distributions):
-                next(lca)
-                lca.lci()
-
-                # Create a numpy array with the results
-                inventory_results = np.array(
-                    [
-                        (characterization_matrix @ value).toarray()
-                        for value in lca.inventories.values()
-                    ]
-                )
-                iter_param_vals.append(
-                    [
-                        -lca.technosphere_matrix[index]
-                        for index in lca.uncertain_parameters
-                    ]
-                )
+        intensities = bc.spsolve(lca.technosphere_matrix.T.tocsc(), characterized)
+    intensities = intensities.reshape(characterized.shape)
 
-                iter_results = np.zeros(
-                    (
-                        inventory_results.shape[0],
-                        inventory_results.shape[1],
-                        len(lca.acts_category_idx_dict),
-                        len(lca.acts_location_idx_dict),
-                    )
-                )
+    rows = [lca.dicts.product[idx] for idx in activities]
+    return intensities[rows][:, :, None, None]
 
-                for (cat, loc), idx in dict_loc_cat.items():
-                    iter_results[:, :, cat, loc] = inventory_results[:, :, idx].sum(
-                        axis=2
-                    )
 
-                # Save iteration results to disk
-                iter_results_filepath = (
-                    DIR_CACHED_DB / f"iter_results_{uuid.uuid4()}.npz"
-                )
-                sp.save_npz(
-                    filename=iter_results_filepath,
-                    matrix=sp.COO(iter_results),
-                    compressed=True,
-                )
-                iter_results_files.append(iter_results_filepath)
+def solve_inventories(lca: bc.MultiLCA, factors, demands: dict):
+    """
+    Calculate the inventories of the given demands, as `lca.lci()` does,
+    with the LU factorization of its technosphere matrix (see `keep_matrices`).
 
-        # Save iteration parameter values to disk
-        iter_param_vals_filepath = DIR_CACHED_DB / f"iter_param_vals_{uuid.uuid4()}.npy"
-        np.save(file=iter_param_vals_filepath, arr=np.stack(iter_param_vals, axis=-1))
+    :param lca: bw2calc.MultiLCA object, whose matrices are loaded.
+    :param factors: LU factorization of the technosphere matrix.
+    :param demands: Demands, as those of bw2calc.MultiLCA.
+    """
+    lca.demands = demands
+    lca.build_demand_array()
+    supply = factors.solve(np.vstack(list(lca.demand_arrays.values())).T)
+
+    count = len(lca.dicts.activity)
+    lca.supply_arrays = dict(zip(demands, supply.T))
+    lca.inventories = {
+        name: lca.biosphere_matrix @ sparse.spdiags([arr], [0], count, count)
+        for name, arr in lca.supply_arrays.items()
+    }
 
-        # Save the uncertainty indices to disk
-        id_uncertainty_indices_filepath = (
-            DIR_CACHED_DB / f"mc_indices_{uuid.uuid4()}.npy"
-        )
-        np.save(
-            file=id_uncertainty_indices_filepath,
-            arr=lca.uncertain_parameters,
-        )
 
-        # Save the technosphere indices to disk
-        id_technosphere_indices_filepath = (
-            DIR_CACHED_DB / f"tech_indices_{uuid.uuid4()}.pkl"
-        )
-        pickle.dump(
-            lca.technosphere_indices,
-            open(id_technosphere_indices_filepath, "wb"),
-        )
+def process_region(data: Tuple) -> Path:
+    """
+    Process the region data: scale the results of the unit demands of a given year
+    by the demand of each variable of the region, and save them to disk.
+    :param data: Tuple containing the model, scenario, year, region, variables, fus_details,
+                    unit_results, unit_positions, debug and sum_variables.
+    :return: Path to the file containing the results of the region,
+                of shape (variables, methods, categories, locations),
+                or (1, methods, categories, locations) if the variables are summed.
+    """
+    (
+        model,
+        scenario,
+        year,
+        region,
+        variables,
+        fus_details,
+        unit_results,
+        unit_positions,
+        debug,
+        sum_variables,
+    ) = data
 
-    # Returning a dictionary containing the id_array and the variables
-    # to be able to fetch them back later
-    d = {
-        "iterations_results": iter_results_files,
-        "variables": {k: v["demand"] for k, v in fus_details.items()},
-    }
+    # impacts are linear in demand
+    positions = [unit_positions[fus_details[v]["id"]] for v in variables]
+    demand = np.array([fus_details[v]["demand"] for v in variables], dtype=float)
+    if sum_variables:
+        iter_results = np.tensordot(demand, unit_results[positions], axes=1)[None]
+        variables = [TOTAL]
+    else:
+        iter_results = unit_results[positions] * demand[:, None, None, None]
 
     if debug:
-        logging.info(f"d: {d}")
-        logging.info(f"FUs: {list(lca.inventories.keys())}")
+        for v, variable in enumerate(variables):
+            logger.debug(
+                "%s, %s, %s, %s, %s. Impact: %s",
+                model,
+                scenario,
+                year,
+                region,
+                variable,
+                iter_results[v].sum(),
+            )
 
-    if use_distributions > 0:
-        d["uncertainty_params"] = [
-            str(id_uncertainty_indices_filepath),
-        ]
-        d["technosphere_indices"] = [
-            str(id_technosphere_indices_filepath),
-        ]
-        d["iterations_param_vals"] = [
-            str(iter_param_vals_filepath),
-        ]
+    # Save iteration results to disk
+    iter_results_filepath = DIR_CACHED_DB / f"iter_results_{uuid.uuid4()}.npz"
+    sp.save_npz(
+        filename=iter_results_filepath,
+        matrix=sp.COO(iter_results),
+        compressed=True,
+    )
+
+    return iter_results_filepath
 
-    return d
+
+def _calculate_year_with_timings(args: tuple) -> tuple:
+    """
+    Run `_calculate_year` and return its results along with
+    the records of its stages (see `pathways.instrumentation`).
+    """
+    try:
+        with collect_timings(call_hooks=False) as records:
+            results = _calculate_year(args)
+    finally:
+        # hits and misses are shared once per year, rather than on each access
+        get_cache().flush()
+    return results, records
 
 
 def _calculate_year(args: tuple):
     """
-    Prepares the data for the calculation of LCA results for a given year
-    and calls the process_region function to calculate the results for each region.
+    Prepares the data for the calculation of LCA results for a given year.
+    The distinct activities demanded across regions are solved once for a unit
+    demand, and process_region scales the results for each region.
+    `demands` holds the (variables, regions) slice of the demand tensor
+    for that year (see `create_demand_tensor`), as well as a mask of the
+    demands to skip (see `flag_demands_below_cutoff`).
     """
     (
         model,
@@ -509,10 +645,9 @@ def _calculate_year(args: tuple):
         demand_cutoff,
         filepaths,
         mapping,
-        units,
+        demands,
         lca_results,
         classifications,
-        scenarios,
         reverse_classifications,
         geography_mapping,
         debug,
@@ -523,24 +658,25 @@ def _calculate_year(args: tuple):
         remove_uncertainty,
         seed,
         double_accounting,
+        location_fallbacks,
+        breakdown,
     ) = args
 
+    # without a breakdown by activity category and location,
+    # total impacts need one solve per method (see `characterize_intensities`)
+    totals = "act_category" not in breakdown and "location" not in breakdown
+
     print(f"------ Calculating LCA results for {year}...")
     if debug:
-        logging.info(
-            f"############################### "
-            f"{model}, {scenario}, {year} "
-            f"###############################"
+        logger.info(
+            "############################### %s, %s, %s ###############################",
+            model,
+            scenario,
+            year,
         )
 
-    try:
-        geo = Geomap(model=model)
-    except FileNotFoundError:
-        from constructive_geometries import Geomatcher
-
-        geo = Geomatcher()
-        geo.model = model
-        geo.geo = geo
+    # cached per model and worker process
+    geo = get_geomap(model)
 
     # Try to load LCA matrices for
     # the given model, scenario, and year
@@ -562,13 +698,14 @@ def _calculate_year(args: tuple):
             variables=variables,
             geo=geo,
             remove_uncertainty=remove_uncertainty,
+            location_fallbacks=location_fallbacks,
         )
 
     except FileNotFoundError:
         # If LCA matrices can't be loaded, skip to the next iteration
         if debug:
-            logging.warning(
-                f"Skipping {model}, {scenario}, {year}, " f"as data not found."
+            logger.warning(
+                "Skipping %s, %s, %s, as data not found.", model, scenario, year
             )
         return
 
@@ -579,77 +716,223 @@ def _calculate_year(args: tuple):
 
     if missing_classifications:
         if debug:
-            logging.warning(
-                f"{len(missing_classifications)} activities are not found "
-                f"in the classifications."
-                "See missing_classifications.csv for more details."
+            logger.warning(
+                "%s activities are not found in the classifications. "
+                "See missing_classifications.csv for more details.",
+                len(missing_classifications),
             )
 
-    results = {}
+    with stage("indexing", model=model, scenario=scenario, year=year):
+        if totals:
+            dict_loc_cat, shape = None, (1, 1)
+        else:
+            acts_category_idx_dict = _group_technosphere_indices(
+                technosphere_indices=technosphere_indices,
+                group_by=(
+                    (lambda x: classifications.get(x[:3], "unclassified"))
+                    if "act_category" in breakdown
+                    else (lambda x: TOTAL)
+                ),
+                group_values=lca_results.coords["act_category"].values.tolist(),
+            )
 
-    acts_category_idx_dict = _group_technosphere_indices(
-        technosphere_indices=technosphere_indices,
-        group_by=lambda x: classifications.get(x[:3], "unclassified"),
-        group_values=lca_results.coords["act_category"].values.tolist(),
-    )
+            # reorder keys of acts_category_idx_dict based on lca_results.coords["act_category"].values
+            acts_category_idx_dict = {
+                k: acts_category_idx_dict[k]
+                for k in lca_results.coords["act_category"].values.tolist()
+            }
+
+            if "location" in breakdown:
+                acts_location_idx_dict = _group_technosphere_indices(
+                    technosphere_indices=technosphere_indices,
+                    group_by=lambda x: x[-1],
+                    group_values=list(
+                        set([x[-1] for x in technosphere_indices.keys()])
+                    ),
+                    mapping=geography_mapping,
+                )
+            else:
+                acts_location_idx_dict = _group_technosphere_indices(
+                    technosphere_indices=technosphere_indices,
+                    group_by=lambda x: TOTAL,
+                    group_values=[TOTAL],
+                )
 
-    # reorder keys of acts_category_idx_dict based on lca_results.coords["act_category"].values
-    acts_category_idx_dict = {
-        k: acts_category_idx_dict[k]
-        for k in lca_results.coords["act_category"].values.tolist()
-    }
+            # reorder keys of acts_location_idx_dict based on lca_results.coords["location"].values
+            acts_location_idx_dict = {
+                k: acts_location_idx_dict[k]
+                for k in lca_results.coords["location"].values.tolist()
+            }
 
-    acts_location_idx_dict = _group_technosphere_indices(
-        technosphere_indices=technosphere_indices,
-        group_by=lambda x: x[-1],
-        group_values=list(set([x[-1] for x in technosphere_indices.keys()])),
-        mapping=geography_mapping,
-    )
+            dict_loc_cat = get_loc_cat_indices(
+                acts_category_idx_dict, acts_location_idx_dict
+            )
+            shape = (len(acts_category_idx_dict), len(acts_location_idx_dict))
+
+        # Create the functional units of each region
+        regions_fus_details = {}
+        for r, region in enumerate(regions):
+            keep = ~demands["skip"][:, r]
+            if not keep.any():
+                logger.info(
+                    "Total demand for %s, %s, %s, %s is zero or below cutoff. Skipping.",
+                    region,
+                    model,
+                    scenario,
+                    year,
+                )
+                continue
 
-    # reorder keys of acts_location_idx_dict based on lca_results.coords["location"].values
-    acts_location_idx_dict = {
-        k: acts_location_idx_dict[k]
-        for k in lca_results.coords["location"].values.tolist()
-    }
+            region_variables = [v for v, k in zip(variables, keep) if k]
 
-    bar = pyprind.ProgBar(len(regions))
-    for region in regions:
-        fus, fus_details = create_functional_units(
-            scenarios=scenarios,
-            region=regions[0],
-            model=model,
-            scenario=scenario,
-            year=year,
-            variables=variables,
-            vars_idx=vars_info[region],
-            units_map=units,
-        )
-
-        if debug:
-            logging.info(
-                f"Functional units created. " f"Total number of activities: {len(fus)}"
+            fus, fus_details = create_functional_units(
+                demand=demands["demand"][keep, r],
+                variables=region_variables,
+                vars_idx=vars_info[region],
+                unit_vector=demands["unit vector"][keep],
             )
-            for fu in fus:
-                logging.info(
-                    f"Functional unit: {fu}, demand: {fus[fu]}. Details: {fus_details[fu]}"
+
+            # drop the variables for which no activity was found
+            fus_details = {k: v for k, v in fus_details.items() if v["id"] is not None}
+            if not fus_details:
+                continue
+
+            if debug:
+                logger.info(
+                    "Functional units created. Total number of activities: %s",
+                    len(fus),
+                )
+                for fu in fus:
+                    logger.debug(
+                        "Functional unit: %s, demand: %s. Details: %s",
+                        fu,
+                        fus[fu],
+                        fus_details.get(fu),
+                    )
+                logger.debug("variables: %s", region_variables)
+
+            regions_fus_details[region] = fus_details
+
+        if not regions_fus_details:
+            return {}
+
+        # Many regions demand the same activities (e.g., RoW or GLO datasets),
+        # and impacts are linear in demand: we solve each distinct activity once,
+        # for a unit demand, and scale the results for each region.
+        unit_positions = {
+            idx: i
+            for i, idx in enumerate(
+                sorted(
+                    {
+                        details["id"]
+                        for fus_details in regions_fus_details.values()
+                        for details in fus_details.values()
+                    }
                 )
-            logging.info(f"variables: {variables}")
+            )
+        }
+    # Deterministic results of unit demands do not depend on the demand,
+    # so they are cached per LCIA method and reused by later runs:
+    # only the missing (activity, method) combinations are solved.
+    fps = get_matrix_filepaths(filepaths, model, scenario, year)
+    cache = get_cache()
+    use_cache = use_distributions == 0 and not shares
+    solve_idxs, solve_methods = list(unit_positions), list(methods)
+    cached_results = {}
+    if use_cache:
+        context = make_key(
+            "unit_results",
+            model,
+            scenario,
+            year,
+            lca_results.coords["act_category"].values.tolist(),
+            lca_results.coords["location"].values.tolist(),
+            sorted(classifications.items()),
+            sorted((geography_mapping or {}).items()),
+            double_accounting,
+            remove_uncertainty,
+            files=[*fps.values(), lcia.LCIA_METHODS],
+        )
+        cache_keys = {method: make_key(context, method) for method in methods}
+        cached_results = {
+            method: cache.get(key, {}) for method, key in cache_keys.items()
+        }
+        solve_idxs = [
+            idx
+            for idx in unit_positions
+            if any(idx not in cached_results[method] for method in methods)
+        ]
+        solve_methods = [
+            method
+            for method in methods
+            if any(idx not in cached_results[method] for idx in unit_positions)
+        ]
+
+    unit_fus = {str(idx): {idx: 1.0} for idx in solve_idxs}
+
+    logger.debug(
+        "%s of %s distinct activities to solve for %s of %s methods "
+        "and %s regions (the rest is cached).",
+        len(solve_idxs),
+        len(unit_positions),
+        len(solve_methods),
+        len(methods),
+        len(regions_fus_details),
+    )
 
+    def _load_matrices() -> dict:
         lca = bc.MultiLCA(
-            demands=fus,
+            demands=unit_fus,
             method_config={"impact_categories": []},
-            data_objs=[
-                bw_datapackage,
-            ],
-            use_distributions=True if use_distributions > 0 else False,
-            seed_override=seed,
+            data_objs=[bw_datapackage],
         )
+        lca.load_lci_data()
+        return {
+            "lca": lca,
+            "factors": splu(lca.technosphere_matrix.tocsc()),
+            "characterization matrices": {},
+        }
 
-        with CustomFilter("(almost) singular matrix"):
-            lca.lci()
+    # matrices kept in memory by the caller, if any (see `keep_matrices`)
+    kept = None
+    if use_cache and solve_idxs:
+        kept = _get_kept_matrices(
+            make_key(
+                "matrices",
+                sorted(str(fp) for fp in fps.values()),
+                remove_uncertainty,
+                files=[*fps.values(), lcia.LCIA_METHODS],
+            ),
+            _load_matrices,
+        )
+
+    with stage("solve", model=model, scenario=scenario, year=year):
+        if kept is not None:
+            lca = kept["lca"]
+            if not totals:
+                solve_inventories(lca, kept["factors"], unit_fus)
+        elif solve_idxs:
+            lca = bc.MultiLCA(
+                demands=unit_fus,
+                method_config={"impact_categories": []},
+                data_objs=[
+                    bw_datapackage,
+                ],
+                use_distributions=True if use_distributions > 0 else False,
+                seed_override=seed,
+            )
+
+            with CustomFilter("(almost) singular matrix"):
+                if totals:
+                    # the matrices are enough to solve the transposed system
+                    lca.load_lci_data()
+                else:
+                    lca.lci()
 
         if shares:
-            shares_indices = find_technology_indices(regions, technosphere_indices, geo, shares_filepath)
+            shares_indices = find_technology_indices(
+                regions, technosphere_indices, geo, shares_filepath
+            )
             correlated_arrays = adjust_matrix_based_on_shares(
                 lca=lca,
                 shares_dict=shares_indices,
@@ -659,7 +942,7 @@ def _calculate_year(args: tuple):
             bw_correlated = get_subshares_matrix(correlated_arrays)
 
             lca = bc.MultiLCA(
-                demands=fus,
+                demands=unit_fus,
                 method_config={"impact_categories": []},
                 data_objs=[bw_datapackage, bw_correlated],
                 use_distributions=True if use_distributions > 0 else False,
@@ -667,52 +950,179 @@ def _calculate_year(args: tuple):
             )
 
             with CustomFilter("(almost) singular matrix"):
-                lca.lci()
-
-        lca.uncertain_parameters = uncertain_parameters
-        lca.technosphere_indices = technosphere_indices
-        lca.acts_category_idx_dict = acts_category_idx_dict
-        lca.acts_location_idx_dict = acts_location_idx_dict
-
-        lca.technosphere_indices = {
-            k: v
-            for k, v in lca.technosphere_indices.items()
-            if v in {value for tup in lca.uncertain_parameters for value in tup}
-        }
+                if totals:
+                    # the matrices are enough to solve the transposed system
+                    lca.load_lci_data()
+                else:
+                    lca.lci()
+
+    technosphere_indices = {
+        k: v
+        for k, v in technosphere_indices.items()
+        if v in {value for tup in uncertain_parameters for value in tup}
+    }
 
-        characterization_matrix = fill_characterization_factors_matrices(
-            methods=methods,
+    def _characterization_matrix():
+        return fill_characterization_factors_matrices(
+            methods=solve_methods,
             biosphere_matrix_dict=lca.dicts.biosphere,
             biosphere_dict=biosphere_indices,
             debug=debug,
         )
 
-        if debug:
-            logging.info(
-                f"Characterization matrix created. "
-                f"Shape: {characterization_matrix.shape}"
+    with stage("characterization", model=model, scenario=scenario, year=year):
+        if not solve_idxs:
+            characterization_matrix = None
+        elif debug:
+            # build it anew, so that the characterization factors are logged
+            characterization_matrix = _characterization_matrix()
+        elif kept is not None:
+            characterization_matrices = kept["characterization matrices"]
+            if tuple(solve_methods) not in characterization_matrices:
+                characterization_matrices[tuple(solve_methods)] = (
+                    _characterization_matrix()
+                )
+            characterization_matrix = characterization_matrices[tuple(solve_methods)]
+        else:
+            characterization_matrix = cache.get_or_compute(
+                make_key(
+                    "characterization_matrix",
+                    solve_methods,
+                    files=[
+                        lcia.LCIA_METHODS,
+                        fps["biosphere_index"],
+                        fps["biosphere_matrix"],
+                    ],
+                ),
+                _characterization_matrix,
             )
 
-        bar.update()
-        # Iterate over each region
-        results[region] = process_region(
-            (
-                model,
-                scenario,
-                year,
-                region,
-                variables,
-                fus_details,
-                scenarios,
-                units,
-                demand_cutoff,
-                lca,
-                characterization_matrix,
-                methods,
-                debug,
-                use_distributions,
-                uncertain_parameters,
-            )
+    if debug and characterization_matrix is not None:
+        logger.info(
+            "Characterization matrix created. Shape: %s",
+            characterization_matrix.shape,
         )
 
+    iter_results_files = {region: [] for region in regions_fus_details}
+    iter_param_vals = []
+
+    bar = pyprind.ProgBar(max(use_distributions, 1))
+    with CustomFilter("(almost) singular matrix"):
+        for iteration in range(max(use_distributions, 1)):
+            # the deterministic case is already solved
+            if use_distributions > 0:
+                with stage("solve", model=model, scenario=scenario, year=year):
+                    next(lca)
+                    iter_param_vals.append(
+                        [
+                            -lca.technosphere_matrix[index]
+                            for index in uncertain_parameters
+                        ]
+                    )
+                    if not totals:
+                        lca.lci()
+
+            if solve_idxs and totals:
+                with stage("solve", model=model, scenario=scenario, year=year):
+                    unit_results = characterize_intensities(
+                        lca,
+                        characterization_matrix,
+                        solve_idxs,
+                        None if kept is None else kept["factors"],
+                    )
+            elif solve_idxs:
+                with stage(
+                    "characterization", model=model, scenario=scenario, year=year
+                ):
+                    unit_results = characterize_inventories(
+                        lca, characterization_matrix, dict_loc_cat, shape
+                    )
+
+            if use_cache:
+                for m, method in enumerate(solve_methods):
+                    cached_results[method].update(
+                        {idx: unit_results[i, m] for i, idx in enumerate(solve_idxs)}
+                    )
+                    cache.set(cache_keys[method], cached_results[method])
+
+                unit_results = np.array(
+                    [
+                        [cached_results[method][idx] for method in methods]
+                        for idx in unit_positions
+                    ]
+                )
+
+            for region, fus_details in regions_fus_details.items():
+                with stage(
+                    "aggregation",
+                    model=model,
+                    scenario=scenario,
+                    year=year,
+                    region=region,
+                ):
+                    iter_results_files[region].append(
+                        process_region(
+                            (
+                                model,
+                                scenario,
+                                year,
+                                region,
+                                list(fus_details.keys()),
+                                fus_details,
+                                unit_results,
+                                unit_positions,
+                                debug,
+                                "variable" not in breakdown,
+                            )
+                        )
+                    )
+            bar.update()
+
+    # Returning a dictionary containing the id_array and the variables
+    # to be able to fetch them back later
+    results = {
+        region: {
+            "iterations_results": iter_results_files[region],
+            "variables": (
+                {k: v["demand"] for k, v in fus_details.items()}
+                if "variable" in breakdown
+                else {TOTAL: sum(v["demand"] for v in fus_details.values())}
+            ),
+        }
+        for region, fus_details in regions_fus_details.items()
+    }
+
+    if use_distributions > 0:
+        # Save iteration parameter values to disk
+        iter_param_vals_filepath = DIR_CACHED_DB / f"iter_param_vals_{uuid.uuid4()}.npy"
+        np.save(file=iter_param_vals_filepath, arr=np.stack(iter_param_vals, axis=-1))
+
+        # Save the uncertainty indices to disk
+        id_uncertainty_indices_filepath = (
+            DIR_CACHED_DB / f"mc_indices_{uuid.uuid4()}.npy"
+        )
+        np.save(
+            file=id_uncertainty_indices_filepath,
+            arr=uncertain_parameters,
+        )
+
+        # Save the technosphere indices to disk
+        id_technosphere_indices_filepath = (
+            DIR_CACHED_DB / f"tech_indices_{uuid.uuid4()}.pkl"
+        )
+        with open(id_technosphere_indices_filepath, "wb") as f:
+            pickle.dump(technosphere_indices, f)
+
+        # these are shared by all regions
+        for region in results:
+            results[region]["uncertainty_params"] = [
+                str(id_uncertainty_indices_filepath),
+            ]
+            results[region]["technosphere_indices"] = [
+                str(id_technosphere_indices_filepath),
+            ]
+            results[region]["iterations_param_vals"] = [
+                str(iter_param_vals_filepath),
+            ]
+
     return results
@@ -13,6 +13,8 @@ from .filesystem_constants import DATA_DIR
 
 LCIA_METHODS = DATA_DIR / "lcia_ei310.json"
 
+logger = logging.getLogger(__name__)
+
 
 def get_lcia_method_names():
     """Get a list of available LCIA methods."""
@@ -96,8 +98,12 @@ def fill_characterization_factors_matrices(
         cfs = sorted(cfs, key=lambda x: (x[0], x[1]))
         for x in cfs:
             method, flow, f, value = x
-            logging.info(
-                f"LCIA method: {method}, Flow: {flow}, Index: {f}, Value: {value}"
+            logger.debug(
+                "LCIA method: %s, Flow: %s, Index: %s, Value: %s",
+                method,
+                flow,
+                f,
+                value,
             )
 
     return matrix
@@ -0,0 +1,96 @@
+"""
+This module contains the logging configuration of Pathways.
+
+Each module logs to its own logger (e.g., `pathways.lca`), under the `pathways` logger.
+Nothing is written unless logging is configured, either by the application
+or with `configure_logging`. Records emitted in worker processes are sent
+back to the main process through a queue (see `worker_logging`).
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+from .filesystem_constants import USER_LOGS_DIR
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(processName)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+logger = logging.getLogger("pathways")
+logger.addHandler(logging.NullHandler())
+
+
+def configure_logging(
+    level: Union[int, str] = logging.INFO,
+    filename: Union[str, Path, None] = USER_LOGS_DIR / "pathways.log",
+    console: bool = False,
+) -> logging.Logger:
+    """
+    Configure the `pathways` logger. Calling it again replaces the previous configuration.
+
+    :param level: Logging level, e.g. logging.DEBUG or "DEBUG".
+    :param filename: File to append the log entries to. None to disable.
+    :param console: Whether to also log to the console (stderr).
+    :return: The `pathways` logger.
+    """
+    for handler in logger.handlers[:]:
+        if not isinstance(handler, logging.NullHandler):
+            logger.removeHandler(handler)
+            handler.close()
+
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+    handlers = []
+    if filename is not None:
+        handlers.append(logging.FileHandler(filename, mode="a", encoding="utf-8"))
+    if console:
+        handlers.append(logging.StreamHandler())
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+    logger.setLevel(level)
+
+    return logger
+
+
+def _configure_worker_logging(queue: multiprocessing.Queue, level: int):
+    """
+    Send the records of a worker process to the main process through `queue`.
+    """
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(queue))
+    logger.setLevel(level)
+    # the records are handled by the main process
+    logger.propagate = False
+
+
+@contextmanager
+def worker_logging():
+    """
+    Forward the records of worker processes to the handlers of the main process.
+    Yields the `initializer` and `initargs` arguments to pass to `multiprocessing.Pool`.
+    If logging is not configured, nothing is forwarded and no initializer is needed.
+    """
+    handlers = [
+        handler
+        for handler in logger.handlers
+        if not isinstance(handler, logging.NullHandler)
+    ]
+    if not handlers:
+        yield None, ()
+        return
+
+    queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(
+        queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    try:
+        yield _configure_worker_logging, (queue, logger.getEffectiveLevel())
+    finally:
+        listener.stop()
@@ -4,12 +4,20 @@ that contains scenario data, mapping between scenario variables and
 LCA datasets, and LCA matrices.
 """
 
+import asyncio
+import contextvars
+import itertools
 import logging
 import pickle
-from collections import defaultdict
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Executor
+from contextlib import contextmanager, nullcontext
+from functools import wraps
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Callable, Iterator, List, NamedTuple, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -17,27 +25,65 @@ import sparse as sp
 import xarray as xr
 import yaml
 
+from .checkpoints import (
+    get_checkpoint_directory,
+    load_checkpoint,
+    remove_checkpoints,
+    save_checkpoint,
+)
 from .data_validation import validate_datapackage
-from .filesystem_constants import DATA_DIR, USER_LOGS_DIR
-from .lca import _calculate_year, get_lca_matrices
+from .filesystem_constants import DATA_DIR, DIR_CACHED_DB, STATS_DIR, USER_LOGS_DIR
+from .instrumentation import COLUMNS, collect_timings, emit, export_trace, stage
+from .lca import (
+    _calculate_year_with_timings,
+    create_demand_tensor,
+    flag_demands_below_cutoff,
+    get_lca_matrices,
+    get_matrix_filepaths,
+)
 from .lcia import get_lcia_method_names
+from .logs import configure_logging, worker_logging
+from .planning import (
+    estimate_work_item,
+    get_matrix_sizes,
+    get_peak_memory,
+    get_results_array_size,
+    summarize_plan,
+)
+from .scheduler import budgeted_imap, get_memory_budget, limit_threads
+from .shards import get_shard, get_shard_directory, write_manifest
 from .stats import log_mc_parameters_to_excel
 from .subshares import generate_samples
 from .utils import (
+    BREAKDOWN_DIMS,
+    TOTAL,
     _get_mapping,
     _read_datapackage,
     clean_cache_directory,
     create_lca_results_array,
     display_results,
-    export_results_to_parquet,
+    export_results,
+    extend_lca_results,
     fetch_inventories_locations,
+    get_harmonization_factors,
+    get_location_fallbacks,
+    get_results_template,
     harmonize_units,
     load_classifications,
     load_mapping,
+    load_results,
     load_units_conversion,
+    read_indices_csv,
     resize_scenario_data,
+    resolve_breakdown,
 )
 
+logger = logging.getLogger(__name__)
+
+# number of (model, scenario, year, region) whose impacts
+# of a unit demand are kept in memory by `evaluate_demand`
+MAX_INTENSITIES = 32
+
 
 def _fill_in_result_array(
     coords: tuple,
@@ -45,7 +91,17 @@ def _fill_in_result_array(
     use_distributions: int,
     shares: [None, dict],
     methods: list,
+    regions: list,
+    variables: list,
+    stats_directory: [str, Path] = STATS_DIR,
 ) -> np.ndarray:
+    """
+    Assemble the results of a given model, scenario and year into an array
+    of shape (act_category, variable, region, location, impact_category[, quantile]).
+    Regions and variables which were not calculated (e.g., below the demand cutoff)
+    are left to zero. Monte Carlo parameters are logged in `stats_directory`.
+    """
+
     def _load_array(filepath):
         if len(filepath) == 1:
             if Path(filepath[0]).suffix == ".npy":
@@ -68,7 +124,7 @@ def _fill_in_result_array(
 
     model, scenario, year = coords
 
-    results = []
+    results = None
 
     for region, data_ in result.items():
 
@@ -82,7 +138,14 @@ def _fill_in_result_array(
         else:
             array = array.transpose(2, 0, 3, 1)
 
-        results.append(array)
+        if results is None:
+            shape = list(array.shape)
+            shape[1] = len(variables)
+            shape.insert(2, len(regions))
+            results = np.zeros(shape)
+
+        variables_idx = [variables.index(v) for v in data_["variables"]]
+        results[:, variables_idx, regions.index(region)] = array
 
     if use_distributions > 0:
         uncertainty_parameters = {
@@ -111,9 +174,177 @@ def _fill_in_result_array(
             tehnosphere_indices=tehnosphere_indices,
             iteration_results=iteration_results,
             shares=shares,
+            directory=stats_directory,
         )
 
-    return np.stack(results, axis=2)
+    # the files written by the workers are not needed anymore
+    for data in result.values():
+        for key in (
+            "iterations_results",
+            "uncertainty_params",
+            "iterations_param_vals",
+            "technosphere_indices",
+        ):
+            for filepath in data.get(key, []):
+                Path(filepath).unlink(missing_ok=True)
+
+    return results
+
+
+def _calculate_block(
+    args: tuple,
+    use_distributions: int,
+    shares: [None, dict],
+    stats_directory: [str, Path] = STATS_DIR,
+) -> tuple:
+    """
+    Calculate the results of a given model, scenario and year, and assemble them
+    (see `_fill_in_result_array`) in the same task, so that they can be used
+    as soon as the task completes.
+    :param args: Arguments of `_calculate_year`.
+    :return: tuple of the results array (None if there are no results)
+        and of the records of its stages.
+    """
+    model, scenario, year, regions, variables, methods = args[:6]
+    if "variable" not in args[-1]:
+        # the workers sum the results over the variables
+        variables = [TOTAL]
+
+    result, records = _calculate_year_with_timings(args)
+    if result is None:
+        return None, records
+
+    with collect_timings(call_hooks=False) as aggregation_records:
+        with stage("aggregation", model=model, scenario=scenario, year=year):
+            array = _fill_in_result_array(
+                (model, scenario, year),
+                result,
+                use_distributions,
+                shares,
+                methods,
+                regions,
+                variables,
+                stats_directory,
+            )
+
+    return array, records + aggregation_records
+
+
+def _get_footprints(plan: dict) -> dict:
+    """
+    Estimated memory of the solve and of the aggregation
+    of each (model, scenario, year) of a plan, in MB.
+    """
+    return {
+        (item["model"], item["scenario"], item["year"]): (
+            (item["matrices"] + item["inventories"] + item["monte carlo buffers"])
+            / 1024**2,
+            item["aggregation"] / 1024**2,
+        )
+        for item in plan["work items"].to_dict("records")
+    }
+
+
+def _report_failures(failed: list, hint: str = ""):
+    """
+    Log the (model, scenario, year) combinations whose calculation failed.
+    :param failed: list of (model, scenario, year) tuples, with their error.
+    :param hint: What becomes of their results, and how to calculate them again.
+    """
+    for (model, scenario, year), error in failed:
+        logger.error(
+            "Calculation failed for %s, %s, %s: %r",
+            model,
+            scenario,
+            year,
+            error,
+        )
+    logger.warning(
+        "The calculation failed for %s (model, scenario, year) combinations: %s. %s",
+        len(failed),
+        ", ".join(str(coords) for coords, _ in failed),
+        hint,
+    )
+
+
+class _Settings(NamedTuple):
+    """
+    Settings the results of a calculation depend on, besides its coordinates
+    (see `_get_settings`). They are part of the key of its checkpoints.
+    """
+
+    use_distributions: int = 0
+    demand_cutoff: float = 0
+    subshares: bool = False
+    shares_filepath: Optional[str] = None
+    remove_uncertainty: bool = False
+    seed: int = 0
+    double_accounting: Optional[List[str]] = None
+    breakdown: tuple = tuple(BREAKDOWN_DIMS)
+    # results summed over the variables depend on which ones are summed
+    summed_variables: Optional[tuple] = None
+
+
+def _get_settings(
+    variables: list, breakdown: Union[str, List[str]] = "full", **kwargs
+) -> _Settings:
+    """
+    Settings of a calculation of the given variables (see `Pathways.calculate`).
+    :param kwargs: Other settings (see `_Settings`), which otherwise keep their default.
+    """
+    breakdown = resolve_breakdown(breakdown)
+    return _Settings(
+        breakdown=breakdown,
+        summed_variables=None if "variable" in breakdown else tuple(variables),
+        **kwargs,
+    )
+
+
+def _initialize_worker(log_initializer, log_initargs, threads: int):
+    """
+    Set up a worker process: forward its log records
+    and limit the threads of its BLAS and OpenMP libraries.
+    """
+    if log_initializer is not None:
+        log_initializer(*log_initargs)
+    limit_threads(threads)
+
+
+@contextmanager
+def _worker_pool(processes: Optional[int] = None):
+    """
+    Pool of worker processes, whose log records are
+    handled by the main process (see `pathways.logs`).
+    The cores are shared between the workers, to avoid
+    oversubscribing them with BLAS and OpenMP threads.
+    :param processes: Number of workers. Defaults to the number of cores.
+    """
+    processes = processes or cpu_count()
+    with worker_logging() as (initializer, initargs):
+        with Pool(
+            processes,
+            maxtasksperchild=1000,
+            initializer=_initialize_worker,
+            initargs=(initializer, initargs, max(cpu_count() // processes, 1)),
+        ) as pool:
+            yield pool
+
+
+def _record_timings(method):
+    """
+    Store the records of the stages run by a method of Pathways
+    (see `pathways.instrumentation`) in its `_timings` attribute.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with collect_timings() as records:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.__dict__.setdefault("_timings", []).extend(records)
+
+    return wrapper
 
 
 class Pathways:
@@ -122,27 +353,35 @@ class Pathways:
 
     :param datapackage: Path to the datapackage.zip file.
     :type datapackage: str
+    :param sparse_scenarios: If True, store the scenario data as a sparse (COO-backed) array.
+        Recommended for wide IAM scenario files where most cells are empty.
+    :type sparse_scenarios: bool
 
     """
 
+    @_record_timings
     def __init__(
         self,
         datapackage,
         geography_mapping: [dict, str] = None,
         activities_mapping: [dict, str] = None,
         debug=False,
+        sparse_scenarios: bool = False,
     ):
         self.datapackage = datapackage
-        self.data, dataframe, self.filepaths = validate_datapackage(
-            _read_datapackage(datapackage)
-        )
+        self.sparse_scenarios = sparse_scenarios
+        with stage("validation"):
+            self.data, dataframe, self.filepaths = validate_datapackage(
+                _read_datapackage(datapackage)
+            )
         self.mapping = _get_mapping(self.data)
         try:
             self.mapping.update(self._get_final_energy_mapping())
         except KeyError:
             pass
         self.debug = debug
-        self.scenarios = self._get_scenarios(dataframe)
+        with stage("scenario ingest"):
+            self.scenarios = self._get_scenarios(dataframe)
         self.classifications = load_classifications()
 
         if self.data.get_resource("classifications"):
@@ -151,6 +390,14 @@ class Pathways:
             )
 
         self.lca_results = None
+        # cells of lca_results computed so far, and the settings used
+        self._computed = None
+        self._results_settings = None
+        # memory-mapped file of lca_results, if stored on disk
+        self._results_filepath = None
+        # impacts of a unit demand of each variable, for the
+        # MAX_INTENSITIES (model, scenario, year, region) used last
+        self._intensities = OrderedDict()
         self.lcia_methods = get_lcia_method_names()
         self.units = load_units_conversion()
         self.lcia_matrix = None
@@ -162,6 +409,7 @@ class Pathways:
             self.geography_mapping = load_mapping(geography_mapping)
         else:
             self.geography_mapping = None
+        self._identity_geography_mapping = False
 
         if activities_mapping:
             mapping = load_mapping(activities_mapping)
@@ -174,18 +422,13 @@ class Pathways:
         for k, v in self.classifications.items():
             self.reverse_classifications[v].append(k)
 
-        clean_cache_directory()
+        # remove the temporary files left by runs older than a day
+        clean_cache_directory(max_age=24 * 3600)
 
         if self.debug:
-            logging.basicConfig(
-                level=logging.DEBUG,
-                filename=USER_LOGS_DIR / "pathways.log",  # Log file to save the entries
-                filemode="a",  # Append to the log file if it exists, 'w' to overwrite
-                format="%(asctime)s - %(levelname)s - %(module)s - %(message)s",
-                datefmt="%Y-%m-%d %H:%M:%S",
-            )
-            logging.info("#" * 600)
-            logging.info(f"Pathways initialized with datapackage: {datapackage}")
+            configure_logging(level=logging.DEBUG)
+            logger.info("#" * 600)
+            logger.info("Pathways initialized with datapackage: %s", datapackage)
             print(f"Log file: {USER_LOGS_DIR / 'pathways.log'}")
 
     def _get_final_energy_mapping(self):
@@ -250,6 +493,8 @@ class Pathways:
         """
         Load scenarios from filepaths as pandas DataFrame.
         Concatenate them into an xarray DataArray.
+        If `self.sparse_scenarios` is True, the DataArray is backed by
+        a sparse COO array, in which missing cells are treated as zero.
         :param scenario_data: pd.DataFrame
         :return: xr.DataArray
         """
@@ -260,7 +505,7 @@ class Pathways:
         for var in mapping_vars:
             if var not in scenario_data["variables"].values:
                 if self.debug:
-                    logging.warning(f"Variable {var} not found in scenario data.")
+                    logger.warning("Variable %s not found in scenario data.", var)
 
         # remove rows which do not have a value under the `variable`
         # column that correspond to any value in self.mapping for `scenario variable`
@@ -271,13 +516,23 @@ class Pathways:
         scenario_data.loc[:, "year"] = scenario_data["year"].astype(int)
 
         # Convert to xarray DataArray
-        data = (
-            scenario_data.groupby(["model", "pathway", "variables", "region", "year"])[
-                "value"
-            ]
-            .mean()
-            .to_xarray()
-        )
+        data = scenario_data.groupby(
+            ["model", "pathway", "variables", "region", "year"]
+        )["value"].mean()
+
+        if self.sparse_scenarios:
+            data = xr.DataArray.from_series(data, sparse=True)
+            # empty cells are stored as zeros rather than NaNs
+            data = data.copy(
+                data=sp.COO(
+                    data.data.coords,
+                    data.data.data.astype(float),
+                    shape=data.shape,
+                    fill_value=0.0,
+                )
+            )
+        else:
+            data = data.to_xarray()
 
         # convert values under "model" column to lower case
         data.coords["model"] = [x.lower() for x in data.coords["model"].values]
@@ -302,6 +557,79 @@ class Pathways:
 
         return data
 
+    def _resolve_arguments(
+        self,
+        methods: Optional[List[str]],
+        models: Optional[List[str]],
+        scenarios: Optional[List[str]],
+        regions: Optional[List[str]],
+        years: Optional[List[int]],
+        variables: Optional[List[str]],
+    ) -> tuple:
+        """
+        Replace the arguments of `calculate` left to None by all the available values.
+        :return: tuple of lists of methods, models, scenarios, regions, years and variables.
+        """
+        # if no methods are provided, use all those available
+        methods = methods or get_lcia_method_names()
+        if self.debug:
+            logger.info("Using the following LCIA methods: %s", methods)
+
+        if models is None:
+            models = self.scenarios.coords["model"].values
+            models = [m.lower() for m in models]
+            if self.debug:
+                logger.info("Using the following models: %s", models)
+        if scenarios is None:
+            scenarios = self.scenarios.coords["pathway"].values
+            if self.debug:
+                logger.info("Using the following scenarios: %s", scenarios)
+        if regions is None:
+            regions = self.scenarios.coords["region"].values
+            if self.debug:
+                logger.info("Using the following regions: %s", regions)
+        if years is None:
+            years = self.scenarios.coords["year"].values
+            if self.debug:
+                logger.info("Using the following years: %s", years)
+        if variables is None:
+            variables = self.scenarios.coords["variables"].values
+            variables = [str(v) for v in variables]
+            if self.debug:
+                logger.info("Using the following variables: %s", variables)
+
+        return (
+            list(methods),
+            list(models),
+            list(scenarios),
+            list(regions),
+            [int(y) for y in years],
+            list(variables),
+        )
+
+    def _get_scenario_data(
+        self,
+        models: list,
+        scenarios: list,
+        regions: list,
+        years: list,
+        variables: list,
+    ) -> tuple:
+        """
+        Select the scenario data to fit the given arguments,
+        leaving self.scenarios untouched for later calls.
+        :return: tuple of the scenario data and of the mapping of its variables.
+        """
+        scenario_data = resize_scenario_data(
+            self.scenarios, models, scenarios, regions, years, variables
+        )
+        scenario_data = harmonize_units(scenario_data, variables)
+
+        mapping = {k: self.mapping[k] for k in scenario_data.coords["variables"].values}
+
+        return scenario_data, mapping
+
+    @_record_timings
     def calculate(
         self,
         methods: Optional[List[str]] = None,
@@ -318,6 +646,14 @@ class Pathways:
         seed: int = 0,
         multiprocessing: bool = True,
         double_accounting: Optional[List[str]] = None,
+        max_memory: Optional[float] = None,
+        out_of_memory: str = "disk",
+        resume: bool = False,
+        retries: int = 1,
+        shard: Optional[int] = None,
+        num_shards: int = 1,
+        shard_directory: Optional[str] = None,
+        breakdown: Union[str, List[str]] = "full",
     ) -> None:
         """
         Calculate Life Cycle Assessment (LCA) results for given methods, models, scenarios, regions, and years.
@@ -328,6 +664,10 @@ class Pathways:
         This function processes each combination of model, scenario, and year in parallel
         and stores the results in the `lca_results` attribute.
 
+        Successive calls extend `lca_results` with any new method, model, scenario,
+        region, year or variable, and only compute the cells which were not
+        computed by a previous call with the same settings.
+
         :param methods: List of impact assessment methods. If None, all available methods will be used.
         :type methods: Optional[List[str]], default is None
         :param models: List of models. If None, all available models will be used.
@@ -340,7 +680,8 @@ class Pathways:
         :type years: Optional[List[int]], default is None
         :param variables: List of variables. If None, all available variables will be used.
         :type variables: Optional[List[str]], default is None
-        :param demand_cutoff: Float. If the total demand for a given variable is less than this value, the variable is skipped.
+        :param demand_cutoff: Float. If the demand for a given variable, region and year is zero or its absolute value
+            is less than this value, the calculation is skipped and its results are left to zero.
         :type demand_cutoff: float, default is 1e-3
         :param use_distributions: Integer. If non-zero, use distributions for LCA calculations.
         :type use_distributions: int, default is 0
@@ -354,50 +695,615 @@ class Pathways:
         :type seed: int, default is 0
         :param double_accounting: List. List of variables for which double accounting processing should be performed.
         :type double_accounting: Optional[List[str]], default is None
+        :param max_memory: Float. Memory available to the calculation, in MB. If the estimated peak memory
+            (see `plan`) exceeds it, the calculation is handled according to `out_of_memory`. With multiprocessing,
+            the number of workers running at the same time is also limited to fit in it (and in the memory
+            available on the machine), based on the memory measured for the tasks already completed.
+        :type max_memory: Optional[float], default is None
+        :param out_of_memory: "disk" to store the results array in a memory-mapped file if it is then enough
+            to fit in `max_memory` (a MemoryError is raised otherwise), or "raise" to always raise a MemoryError.
+        :type out_of_memory: str, default is "disk"
+        :param resume: Bool. If True, the results of each (model, scenario, year) combination are saved in checkpoints
+            as they complete, and those saved by an interrupted or partly failed calculation with `resume=True`
+            and the same datapackage and settings are not calculated again.
+            Checkpoints are removed once the calculation completes. Without it, nothing is saved.
+        :type resume: bool, default is False
+        :param retries: Int. Number of times a failing (model, scenario, year) combination is calculated again.
+            If it still fails, the others are calculated nonetheless, and its results are left to zero.
+        :type retries: int, default is 1
+        :param shard: Int. Index of the shard to calculate, from 0 to `num_shards` - 1. The (model, scenario, year, region)
+            combinations are split in `num_shards` parts, each calculated by one shard (e.g., on different nodes),
+            which writes its results in `shard_directory`. The results of all shards are assembled by `merge_shards`.
+        :type shard: Optional[int], default is None
+        :param num_shards: Int. Number of shards the calculation is split in.
+        :type num_shards: int, default is 1
+        :param shard_directory: Str. Directory shared by the shards, to write their results to.
+        :type shard_directory: Optional[str], default is None
+        :param breakdown: Dimensions to break the results down by, among "act_category", "location"
+            and "variable": the results are summed over the others in the workers, which then have
+            the single coordinate "total". "full" keeps them all, and "totals" only keeps "variable".
+            Without act_category and location, total impacts need one solve per method and year
+            rather than one per activity demanded.
+        :type breakdown: Union[str, List[str]], default is "full"
         """
 
-        self.scenarios = harmonize_units(self.scenarios, variables)
+        if shard is not None and shard_directory is None:
+            raise ValueError("A shard_directory is needed to calculate a shard.")
+        breakdown = resolve_breakdown(breakdown)
 
-        # if no methods are provided, use all those available
-        methods = methods or get_lcia_method_names()
-        if self.debug:
-            logging.info(f"Using the following LCIA methods: {methods}")
+        methods, models, scenarios, regions, years, variables = self._resolve_arguments(
+            methods, models, scenarios, regions, years, variables
+        )
+        scenario_data, mapping = self._get_scenario_data(
+            models, scenarios, regions, years, variables
+        )
+        settings = _get_settings(
+            variables,
+            breakdown,
+            use_distributions=use_distributions,
+            demand_cutoff=demand_cutoff,
+            subshares=subshares,
+            shares_filepath=shares_filepath,
+            remove_uncertainty=remove_uncertainty,
+            seed=seed,
+            double_accounting=double_accounting,
+        )
 
-        if models is None:
-            models = self.scenarios.coords["model"].values
-            models = [m.lower() for m in models]
-            if self.debug:
-                logging.info(f"Using the following models: {models}")
-        if scenarios is None:
-            scenarios = self.scenarios.coords["pathway"].values
-            if self.debug:
-                logging.info(f"Using the following scenarios: {scenarios}")
-        if regions is None:
-            regions = self.scenarios.coords["region"].values
-            if self.debug:
-                logging.info(f"Using the following regions: {regions}")
-        if years is None:
-            years = self.scenarios.coords["year"].values
-            if self.debug:
-                logging.info(f"Using the following years: {years}")
-        if variables is None:
-            variables = self.scenarios.coords["variables"].values
-            variables = [str(v) for v in variables]
-            if self.debug:
-                logging.info(f"Using the following variables: {variables}")
+        prepared = self._prepare_calculation(models, scenarios, years)
+        if prepared is None:
+            return
+        locations, uncertain_parameters = prepared
+        result_variables = variables if "variable" in breakdown else [TOTAL]
+
+        # estimates of the memory needed, to check it against max_memory
+        # and to size the number of workers running at the same time.
+        # Without max_memory, the workers are sized on the memory they are measured to use.
+        memory_budget = get_memory_budget(max_memory) if multiprocessing else None
+        plan, disk = None, False
+        if max_memory is not None:
+            plan = self._make_plan(
+                methods,
+                models,
+                scenarios,
+                regions,
+                years,
+                variables,
+                scenario_data,
+                settings,
+                multiprocessing,
+            )
+            disk = self._check_memory(plan, max_memory, out_of_memory)
 
-        # resize self.scenarios array to fit the given arguments
-        self.scenarios = resize_scenario_data(
-            self.scenarios, models, scenarios, regions, years, variables
+        self._update_lca_results(
+            methods=methods,
+            models=models,
+            scenarios=scenarios,
+            regions=regions,
+            years=years,
+            locations=locations,
+            variables=result_variables,
+            settings=settings,
+            disk=disk,
         )
 
-        # refresh self.mapping,
-        # remove keys that are not
-        # in self.scenarios.variable.values
-        self.mapping = {
-            k: self.mapping[k] for k in self.scenarios.coords["variables"].values
-        }
+        footprints = None
+        if memory_budget is not None:
+            # the results array is held by this process
+            if self._results_filepath is None:
+                memory_budget = max(
+                    memory_budget - self.lca_results.nbytes / 1024**2, 0
+                )
+            if plan is not None:
+                footprints = _get_footprints(plan)
+
+        # with resume=True, or for a shard, the results of each completed
+        # (model, scenario, year) are saved, for an interrupted calculation to be resumed
+        checkpoints = None
+        stats_directory = STATS_DIR
+        shard_cells = None
+        if shard is not None:
+            # the results of a shard are its checkpoints
+            checkpoints = get_shard_directory(shard_directory, shard, num_shards)
+            stats_directory = checkpoints / "stats"
+            shard_cells = set(
+                get_shard(
+                    list(itertools.product(models, scenarios, years, regions)),
+                    shard,
+                    num_shards,
+                )
+            )
+            logger.info(
+                "Calculating shard %s of %s: %s (model, scenario, year, region) combinations.",
+                shard,
+                num_shards,
+                len(shard_cells),
+            )
+            if not resume:
+                remove_checkpoints(checkpoints)
+        elif resume:
+            checkpoints = get_checkpoint_directory(
+                str(self.datapackage),
+                settings,
+                sorted(self.geography_mapping.items()),
+                files=[self.datapackage] if Path(self.datapackage).is_file() else [],
+            )
+
+        counts = {"already computed": 0, "resumed": 0}
+
+        def select(model: str, scenario: str, year: int) -> Optional[tuple]:
+            year_regions = regions
+            if shard_cells is not None:
+                year_regions = [
+                    region
+                    for region in regions
+                    if (model, scenario, year, region) in shard_cells
+                ]
+                if not year_regions:
+                    return None
+
+            # only the cells which were not computed by a previous call
+            year_regions, year_methods = self._get_pending_cells(
+                model, scenario, year, year_regions, result_variables, methods
+            )
+            if not year_regions:
+                counts["already computed"] += 1
+                return None
+            if resume and self._load_checkpoint(
+                checkpoints,
+                model,
+                scenario,
+                year,
+                year_regions,
+                result_variables,
+                year_methods,
+            ):
+                counts["resumed"] += 1
+                return None
+
+            return year_regions, year_methods
+
+        failed = []
+        for (
+            (model, scenario, year),
+            year_regions,
+            year_methods,
+            array,
+        ) in self._iter_blocks(
+            models,
+            scenarios,
+            regions,
+            years,
+            variables,
+            scenario_data,
+            mapping,
+            settings,
+            select,
+            get_results_template(self.lca_results),
+            uncertain_parameters,
+            footprints,
+            memory_budget,
+            multiprocessing,
+            retries,
+            stats_directory,
+        ):
+            if isinstance(array, Exception):
+                failed.append(((model, scenario, year), array))
+                continue
+
+            cells = dict(
+                model=model,
+                scenario=scenario,
+                year=year,
+                region=year_regions,
+                variable=result_variables,
+                impact_category=year_methods,
+            )
+            with stage("result write", model=model, scenario=scenario, year=year):
+                # cells without any result (e.g., below the demand cutoff) are zero
+                self.lca_results.loc[cells] = 0 if array is None else array
+                self._computed.loc[cells] = True
+                if checkpoints is not None:
+                    save_checkpoint(
+                        checkpoints,
+                        model,
+                        scenario,
+                        year,
+                        self.lca_results.loc[cells].drop_vars(
+                            ["model", "scenario", "year"]
+                        ),
+                    )
+
+        if counts["already computed"] > 0:
+            logger.info(
+                "%s (model, scenario, year) combinations were already computed and were reused.",
+                counts["already computed"],
+            )
+        if counts["resumed"] > 0:
+            logger.info(
+                "%s (model, scenario, year) combinations were resumed from checkpoints, in %s.",
+                counts["resumed"],
+                checkpoints,
+            )
+
+        if failed:
+            _report_failures(
+                failed,
+                "Their results are left to zero. Call `calculate` again "
+                + ("with `resume=True` " if resume or shard is not None else "")
+                + "to calculate them without calculating the others again.",
+            )
+        elif shard is None and resume:
+            remove_checkpoints(checkpoints)
+
+        if shard is not None:
+            write_manifest(
+                checkpoints, shard, num_shards, self.lca_results, complete=not failed
+            )
+            logger.info(
+                "Results of shard %s of %s written to %s.",
+                shard,
+                num_shards,
+                checkpoints,
+            )
+
+    def iter_calculate(
+        self,
+        methods: Optional[List[str]] = None,
+        models: Optional[List[str]] = None,
+        scenarios: Optional[List[str]] = None,
+        regions: Optional[List[str]] = None,
+        years: Optional[List[int]] = None,
+        variables: Optional[List[str]] = None,
+        demand_cutoff: float = 1e-3,
+        use_distributions: int = 0,
+        subshares: bool = False,
+        shares_filepath: Optional[str] = None,
+        remove_uncertainty: bool = False,
+        seed: int = 0,
+        multiprocessing: bool = True,
+        double_accounting: Optional[List[str]] = None,
+        max_memory: Optional[float] = None,
+        retries: int = 1,
+        executor: Optional[Executor] = None,
+        cancel: Optional[threading.Event] = None,
+        breakdown: Union[str, List[str]] = "full",
+    ) -> Iterator[xr.DataArray]:
+        """
+        Calculate LCA results as `calculate` does, but yield the results of each
+        (model, scenario, year) as soon as they are calculated, in the order they complete,
+        rather than storing them in `lca_results`. Only the results being calculated
+        are held in memory, so that they can be written or displayed progressively.
+
+        Stopping the iteration stops the calculation.
+
+        The arguments are those of `calculate`, and:
+        :param executor: concurrent.futures.Executor to run the calculation of each
+            (model, scenario, year) in, rather than a pool of workers of Pathways.
+        :type executor: Optional[concurrent.futures.Executor], default is None
+        :param cancel: Event which, once set (e.g., from another thread), stops the calculation.
+        :type cancel: Optional[threading.Event], default is None
+        :return: Iterator of xr.DataArray, of dimensions (act_category, variable, region,
+            location, impact_category[, quantile]), with scalar model, scenario and year
+            coordinates. Combinations whose calculation failed are reported, and not yielded.
+        """
+        breakdown = resolve_breakdown(breakdown)
+        methods, models, scenarios, regions, years, variables = self._resolve_arguments(
+            methods, models, scenarios, regions, years, variables
+        )
+        scenario_data, mapping = self._get_scenario_data(
+            models, scenarios, regions, years, variables
+        )
+        settings = _get_settings(
+            variables,
+            breakdown,
+            use_distributions=use_distributions,
+            demand_cutoff=demand_cutoff,
+            subshares=subshares,
+            shares_filepath=shares_filepath,
+            remove_uncertainty=remove_uncertainty,
+            seed=seed,
+            double_accounting=double_accounting,
+        )
+
+        prepared = self._prepare_calculation(models, scenarios, years)
+        if prepared is None:
+            return
+        locations, uncertain_parameters = prepared
+        result_variables = variables if "variable" in breakdown else [TOTAL]
+
+        memory_budget = get_memory_budget(max_memory) if multiprocessing else None
+        footprints = None
+        if memory_budget is not None and max_memory is not None:
+            footprints = _get_footprints(
+                self._make_plan(
+                    methods,
+                    models,
+                    scenarios,
+                    regions,
+                    years,
+                    variables,
+                    scenario_data,
+                    settings,
+                    multiprocessing,
+                )
+            )
+
+        # coordinates shared by all the blocks
+        layout = create_lca_results_array(
+            methods=methods[:1],
+            years=years[:1],
+            regions=regions[:1],
+            locations=locations,
+            models=models[:1],
+            scenarios=scenarios[:1],
+            classifications=self.classifications,
+            mapping={v: None for v in variables[:1]},
+            use_distributions=use_distributions > 0,
+            breakdown=breakdown,
+        )
+        dims = [dim for dim in layout.dims if dim not in ("model", "scenario", "year")]
+
+        failed = []
+        for (
+            (model, scenario, year),
+            year_regions,
+            year_methods,
+            array,
+        ) in self._iter_blocks(
+            models,
+            scenarios,
+            regions,
+            years,
+            variables,
+            scenario_data,
+            mapping,
+            settings,
+            lambda model, scenario, year: (regions, methods),
+            get_results_template(layout),
+            uncertain_parameters,
+            footprints,
+            memory_budget,
+            multiprocessing,
+            retries,
+            STATS_DIR,
+            executor=executor,
+            cancel=cancel,
+        ):
+            if isinstance(array, Exception):
+                failed.append(((model, scenario, year), array))
+                continue
+
+            coords = {
+                **{dim: layout.coords[dim].values for dim in dims},
+                "variable": result_variables,
+                "region": year_regions,
+                "impact_category": year_methods,
+            }
+            yield xr.DataArray(
+                (
+                    np.zeros([len(coords[dim]) for dim in dims])
+                    if array is None
+                    else array
+                ),
+                coords=coords,
+                dims=dims,
+            ).assign_coords(model=model, scenario=scenario, year=year)
+
+        if failed:
+            _report_failures(failed)
+
+    async def calculate_async(
+        self, *args, executor: Optional[Executor] = None, **kwargs
+    ) -> AsyncIterator[xr.DataArray]:
+        """
+        Asynchronous version of `iter_calculate`, for asyncio applications:
+        the calculation runs in a thread (and its workers), without blocking the event loop,
+        and the results of each (model, scenario, year) are yielded as they are calculated.
+
+            async for block in p.calculate_async(scenarios=["SSP2-Base"]):
+                ...
+
+        Cancelling the task iterating over the results, or leaving the iteration,
+        cancels the calculation: no calculation is started anymore,
+        and the workers of Pathways are terminated.
+
+        The arguments are those of `iter_calculate`.
+        :param executor: concurrent.futures.Executor to run the calculation of each
+            (model, scenario, year) in, e.g., a ProcessPoolExecutor shared by the application,
+            or a ThreadPoolExecutor to calculate in this process.
+            By default, a pool of workers is created, as in `calculate`.
+        :return: Async iterator of xr.DataArray (see `iter_calculate`).
+        """
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        cancel = threading.Event()
+        done = object()
+
+        def produce():
+            blocks = self.iter_calculate(
+                *args, executor=executor, cancel=cancel, **kwargs
+            )
+            try:
+                for block in blocks:
+                    if cancel.is_set():
+                        break
+                    loop.call_soon_threadsafe(results.put_nowait, block)
+            except Exception as e:
+                loop.call_soon_threadsafe(results.put_nowait, e)
+            finally:
+                blocks.close()
+                loop.call_soon_threadsafe(results.put_nowait, done)
+
+        # the records of the calculation go to the collectors of the caller
+        thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(produce,), daemon=True
+        )
+        thread.start()
+        try:
+            while True:
+                block = await results.get()
+                if block is done:
+                    break
+                if isinstance(block, Exception):
+                    raise block
+                yield block
+        finally:
+            cancel.set()
+            # wait for the workers to stop
+            await loop.run_in_executor(None, thread.join)
+
+    def evaluate_demand(
+        self,
+        model: str,
+        scenario: str,
+        year: int,
+        region: str,
+        demand_overrides: Optional[dict] = None,
+        methods: Optional[List[str]] = None,
+        variables: Optional[List[str]] = None,
+    ) -> xr.DataArray:
+        """
+        Evaluate the LCA results of a given model, scenario, year and region
+        for a modified demand (e.g., +10% of a variable), without calculating them again.
+
+        Impacts are linear in demand: the impacts of a unit demand of each variable
+        are calculated once (from the cached results of `calculate`, if any)
+        and kept in memory for the last MAX_INTENSITIES (model, scenario, year, region)
+        evaluated, and the results of any demand are then their sum,
+        weighted by the demand of each variable. Results are deterministic.
+
+        :param model: The name of the model.
+        :param scenario: The name of the scenario.
+        :param year: The year.
+        :param region: The region.
+        :param demand_overrides: Demand of the variables to change, in the units
+            of the scenario data (`self.scenarios.attrs["units"]`), before they are harmonized.
+            The others keep their demand from the scenario data.
+        :type demand_overrides: Optional[dict], default is None
+        :param methods: List of impact assessment methods. If None, all available methods will be used.
+        :param variables: List of variables. If None, all available variables will be used.
+        :return: xr.DataArray of dimensions (act_category, variable, location, impact_category),
+            with scalar model, scenario, year and region coordinates.
+        """
+        methods, models, scenarios, regions, years, variables = self._resolve_arguments(
+            methods, [model], [scenario], [region], [year], variables
+        )
+        model, year = models[0], years[0]
+
+        key = (model, scenario, year, region, tuple(methods), tuple(variables))
+        if key in self._intensities:
+            self._intensities.move_to_end(key)
+        else:
+            self._intensities[key] = self._get_intensities(
+                model, scenario, year, region, methods, variables
+            )
+            while len(self._intensities) > MAX_INTENSITIES:
+                self._intensities.popitem(last=False)
+        intensities, demand, unit_vector = self._intensities[key]
+
+        demand = demand.copy()
+        for variable, value in (demand_overrides or {}).items():
+            if variable not in variables:
+                raise ValueError(f"Unknown variable: {variable}.")
+            demand[variables.index(variable)] = value
+
+        return intensities * xr.DataArray(demand * unit_vector, dims="variable")
+
+    def _get_intensities(
+        self,
+        model: str,
+        scenario: str,
+        year: int,
+        region: str,
+        methods: list,
+        variables: list,
+    ) -> tuple:
+        """
+        Calculate the impacts of a unit demand (in the units of the LCA datasets)
+        of each variable of a given model, scenario, year and region (see `evaluate_demand`).
+        :return: tuple of the impacts, of the demand of the variables in the scenario data,
+            and of the conversion factors of their units (before they are harmonized)
+            to those of the LCA datasets.
+        """
+        scenario_data, mapping = self._get_scenario_data(
+            [model], [scenario], [region], [year], variables
+        )
+        prepared = self._prepare_calculation([model], [scenario], [year])
+        if prepared is None:
+            raise FileNotFoundError(
+                f"No LCA matrices found for {model}, {scenario}, {year}."
+            )
+        locations, uncertain_parameters = prepared
+
+        demand_tensor = create_demand_tensor(
+            scenarios=scenario_data,
+            model=model,
+            scenario=scenario,
+            regions=[region],
+            years=[year],
+            variables=variables,
+            mapping=mapping,
+            units_map=self.units,
+        )
+        unit_vector = demand_tensor["unit vector"]
+
+        layout = create_lca_results_array(
+            methods=methods,
+            years=[year],
+            regions=[region],
+            locations=locations,
+            models=[model],
+            scenarios=[scenario],
+            classifications=self.classifications,
+            mapping={v: None for v in variables},
+        )
+        args = self._get_year_args(
+            model,
+            scenario,
+            year,
+            [region],
+            variables,
+            methods,
+            mapping,
+            {
+                "demand": np.ones((len(variables), 1)),
+                "skip": np.zeros((len(variables), 1), dtype=bool),
+                "unit vector": unit_vector,
+            },
+            _get_settings(variables),
+            get_results_template(layout),
+            None,
+            uncertain_parameters,
+            get_location_fallbacks(model, [region]),
+        )
+        array, records = _calculate_block(args, 0, None)
+        for record in records:
+            emit(record)
+
+        # results of a unit demand, or zero if no activity was found
+        intensities = layout.isel(model=0, scenario=0, year=0, region=0)
+        if array is not None:
+            intensities = intensities.copy(data=array[:, :, 0])
+
+        # demand in the units of self.scenarios, which are harmonized in scenario_data
+        unit_vector = unit_vector * get_harmonization_factors(
+            [self.scenarios.attrs["units"][variable] for variable in variables]
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            demand = np.nan_to_num(demand_tensor["demand"][:, 0, 0] / unit_vector)
 
+        return intensities, demand, unit_vector
+
+    def _prepare_calculation(
+        self, models: list, scenarios: list, years: list
+    ) -> Optional[tuple]:
+        """
+        Read the locations of the results and the uncertain parameters
+        from the matrices of the first model, scenario and year,
+        and complete the geography mapping with the locations.
+        :return: tuple of the locations and of the uncertain parameters,
+            or None if the matrices cannot be read.
+        """
         try:
             _, technosphere_index, _, uncertain_parameters, _ = get_lca_matrices(
                 filepaths=self.filepaths,
@@ -406,149 +1312,776 @@ class Pathways:
                 year=years[0],
             )
         except Exception as e:
-            logging.error(f"Error retrieving LCA matrices: {str(e)}")
-            return
+            logger.error("Error retrieving LCA matrices: %s", e)
+            return None
 
-        # Create xarray for storing LCA results if not already present
-        if self.lca_results is None:
-            locations = fetch_inventories_locations(technosphere_index)
+        locations = fetch_inventories_locations(technosphere_index)
 
-            # if geography mapping is provided, aggregate locations
-            if self.geography_mapping:
-                locations = list(set(list(self.geography_mapping.values())))
-            else:
-                self.geography_mapping = {loc: loc for loc in locations}
+        # if geography mapping is provided, aggregate locations
+        if self.geography_mapping is None or self._identity_geography_mapping:
+            self.geography_mapping = {
+                **(self.geography_mapping or {}),
+                **{loc: loc for loc in locations},
+            }
+            self._identity_geography_mapping = True
+        else:
+            locations = sorted(set(self.geography_mapping.values()))
 
-            self.lca_results = create_lca_results_array(
-                methods=methods,
-                years=years,
-                regions=regions,
-                locations=locations,
-                models=models,
-                scenarios=scenarios,
-                classifications=self.classifications,
-                mapping=self.mapping,
-                use_distributions=use_distributions > 0,
-            )
+        return locations, uncertain_parameters
+
+    def _iter_blocks(
+        self,
+        models: list,
+        scenarios: list,
+        regions: list,
+        years: list,
+        variables: list,
+        scenario_data: xr.DataArray,
+        mapping: dict,
+        settings: _Settings,
+        select: Callable,
+        results_template: xr.DataArray,
+        uncertain_parameters,
+        footprints: Optional[dict],
+        memory_budget: Optional[float],
+        multiprocessing: bool,
+        retries: int,
+        stats_directory: [str, Path] = STATS_DIR,
+        executor: Optional[Executor] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[tuple]:
+        """
+        Calculate the results of each (model, scenario, year) in a pool of workers,
+        within the memory budget (see `pathways.scheduler`), or in this process,
+        and yield them in the order they complete.
+        :param select: Function of the model, scenario and year, which returns
+            the regions and methods to calculate, or None to leave them out.
+        :param footprints: Estimated memory of the solve and of the aggregation,
+            per (model, scenario, year), in MB, or None to rely on the memory measured
+            for the tasks already completed.
+        :param executor: Executor to run the calculations in, rather than a pool of workers.
+        :param cancel: Event which, once set, stops the calculations (see `budgeted_imap`).
+        :return: Iterator of ((model, scenario, year), regions, methods, results),
+            where results is an array (see `_fill_in_result_array`), None if there
+            are no results (e.g., below the demand cutoff), or the error of a
+            calculation which failed all its attempts.
+        """
+        use_distributions, demand_cutoff = (
+            settings.use_distributions,
+            settings.demand_cutoff,
+        )
 
         # generate share of sub-technologies
         shares = None
-        if subshares is True:
+        if settings.subshares is True:
             shares = generate_samples(
-                years=self.scenarios.coords["year"].values.tolist(),
-                filepath=shares_filepath,
+                years=scenario_data.coords["year"].values.tolist(),
+                filepath=settings.shares_filepath,
                 iterations=use_distributions,
             )
 
         # Iterate over each combination of model, scenario, and year
-        results = {}
+        skipped, total, skipped_regions = 0, 0, 0
+        blocks, args = [], []
         for model in models:
             print(f"Calculating LCA results for {model}...")
+
+            # resolved once per model, and cached on disk
+            location_fallbacks = get_location_fallbacks(model, regions)
+
             for scenario in scenarios:
                 print(f"--- Calculating LCA results for {scenario}...")
 
-                args = [
-                    (
-                        model,
-                        scenario,
-                        year,
-                        regions,
-                        variables,
-                        methods,
-                        demand_cutoff,
-                        self.filepaths,
-                        self.mapping,
-                        self.units,
-                        self.lca_results,
-                        self.classifications,
-                        self.scenarios,
-                        self.reverse_classifications,
-                        self.geography_mapping,
-                        self.debug,
-                        use_distributions,
-                        shares,
-                        shares_filepath,
-                        uncertain_parameters,
-                        remove_uncertainty,
-                        seed,
-                        double_accounting,
-                    )
-                    for year in years
-                ]
+                # demand of all variables, regions and years at once
+                demand_tensor = create_demand_tensor(
+                    scenarios=scenario_data,
+                    model=model,
+                    scenario=scenario,
+                    regions=regions,
+                    years=years,
+                    variables=variables,
+                    mapping=mapping,
+                    units_map=self.units,
+                )
 
-                if multiprocessing:
-                    # Process each region in parallel
-                    with Pool(cpu_count(), maxtasksperchild=1000) as p:
-                        # store the results as a dictionary with years as keys
-                        results.update(
-                            {
-                                (model, scenario, year): result
-                                for year, result in zip(
-                                    years, p.map(_calculate_year, args)
-                                )
-                            }
+                # planning pass: prune the (variable, region, year) combinations
+                # with zero or below-cutoff demand before any matrix is loaded
+                skip = flag_demands_below_cutoff(demand_tensor["demand"], demand_cutoff)
+                skipped += int(skip.sum())
+                total += skip.size
+                skipped_regions += int(np.all(skip, axis=0).sum())
+
+                for y, year in enumerate(years):
+                    selected = select(model, scenario, year)
+                    if selected is None:
+                        continue
+                    year_regions, year_methods = selected
+
+                    regions_idx = [regions.index(r) for r in year_regions]
+                    if np.all(skip[:, regions_idx, y]):
+                        blocks.append(
+                            ((model, scenario, year), year_regions, year_methods, None)
+                        )
+                        continue
+
+                    args.append(
+                        (
+                            self._get_year_args(
+                                model,
+                                scenario,
+                                year,
+                                year_regions,
+                                variables,
+                                year_methods,
+                                mapping,
+                                {
+                                    "demand": demand_tensor["demand"][
+                                        :, regions_idx, y
+                                    ],
+                                    "skip": skip[:, regions_idx, y],
+                                    "unit vector": demand_tensor["unit vector"],
+                                },
+                                settings,
+                                results_template,
+                                shares,
+                                uncertain_parameters,
+                                location_fallbacks,
+                            ),
+                            use_distributions,
+                            shares,
+                            stats_directory,
                         )
-                else:
-                    for arg in args:
-                        results[(arg[0], arg[1], arg[2])] = _calculate_year(arg)
-
-        # remove None values in results
-        results = {k: v for k, v in results.items() if v is not None}
-
-        if multiprocessing:
-            with Pool(cpu_count(), maxtasksperchild=1000) as p:
-                args = [
-                    (
-                        coords,
-                        result,
-                        use_distributions,
-                        shares,
-                        methods,
                     )
-                    for coords, result in results.items()
-                ]
 
-                r = p.starmap(_fill_in_result_array, args)
+        if skipped > 0:
+            logger.info(
+                "%s out of %s (variable, region, year) combinations have a zero or "
+                "below-cutoff demand and were skipped (%s region solves avoided).",
+                skipped,
+                total,
+                skipped_regions,
+            )
 
-                for c, coord in enumerate([c[0] for c in args]):
-                    model, scenario, year = coord
-                    self.lca_results.loc[
-                        dict(
-                            model=model,
-                            scenario=scenario,
-                            year=year,
-                        )
-                    ] = r[c]
+        # combinations without any demand above the cutoff have no results
+        yield from blocks
 
+        workers = min(cpu_count(), len(args))
+        if executor is not None:
+            context = nullcontext(executor)
+        elif multiprocessing and workers:
+            context = _worker_pool(workers)
         else:
-            for coords, values in results.items():
-                model, scenario, year = coords
+            context = nullcontext()
+        with context as pool:
+            for i, output in budgeted_imap(
+                pool,
+                _calculate_block,
+                args,
+                workers=max(workers, 1),
+                footprints=(
+                    None
+                    if footprints is None
+                    else [max(footprints.get(arg[0][:3], (0, 0))) for arg in args]
+                ),
+                memory_budget=memory_budget,
+                star=True,
+                retries=retries,
+                errors="return",
+                cancel=cancel,
+            ):
+                model, scenario, year, year_regions, _, year_methods = args[i][0][:6]
+                if isinstance(output, Exception):
+                    yield (model, scenario, year), year_regions, year_methods, output
+                    continue
+
+                array, records = output
+                for record in records:
+                    emit(record)
+                yield (model, scenario, year), year_regions, year_methods, array
+
+    def _get_year_args(
+        self,
+        model: str,
+        scenario: str,
+        year: int,
+        regions: list,
+        variables: list,
+        methods: list,
+        mapping: dict,
+        demands: dict,
+        settings: _Settings,
+        results_template: xr.DataArray,
+        shares: [None, dict],
+        uncertain_parameters,
+        location_fallbacks: dict,
+    ) -> tuple:
+        """
+        Arguments of `_calculate_year` for a given model, scenario and year.
+        :param demands: Demand of the variables in each region, in the units of the LCA datasets,
+            the demands to skip, and the unit conversion factor of each variable.
+        """
+        (
+            use_distributions,
+            demand_cutoff,
+            _,
+            shares_filepath,
+            remove_uncertainty,
+            seed,
+            double_accounting,
+            breakdown,
+            _,
+        ) = settings
+
+        return (
+            model,
+            scenario,
+            year,
+            regions,
+            variables,
+            methods,
+            demand_cutoff,
+            self.filepaths,
+            mapping,
+            demands,
+            results_template,
+            self.classifications,
+            self.reverse_classifications,
+            self.geography_mapping,
+            self.debug,
+            use_distributions,
+            shares,
+            shares_filepath,
+            uncertain_parameters,
+            remove_uncertainty,
+            seed,
+            double_accounting,
+            location_fallbacks,
+            breakdown,
+        )
+
+    def _load_checkpoint(
+        self,
+        checkpoints: Path,
+        model: str,
+        scenario: str,
+        year: int,
+        regions: list,
+        variables: list,
+        methods: list,
+    ) -> bool:
+        """
+        Write the results of a (model, scenario, year) saved in the checkpoint directory
+        in `lca_results`, if they cover the given regions, variables and methods.
+        :return: True if the results were loaded.
+        """
+        checkpoint = load_checkpoint(checkpoints, model, scenario, year)
+        if checkpoint is None:
+            return False
+
+        covered = all(
+            set(values) <= set(checkpoint.coords[dim].values.tolist())
+            for dim, values in (
+                ("region", regions),
+                ("variable", variables),
+                ("impact_category", methods),
+            )
+        ) and all(
+            checkpoint.coords[dim].values.tolist()
+            == self.lca_results.coords[dim].values.tolist()
+            for dim in checkpoint.dims
+            if dim not in ("region", "variable", "impact_category")
+        )
+        if not covered:
+            return False
+
+        cells = dict(
+            model=model,
+            scenario=scenario,
+            year=year,
+            region=regions,
+            variable=variables,
+            impact_category=methods,
+        )
+        self.lca_results.loc[cells] = checkpoint.sel(
+            region=regions, variable=variables, impact_category=methods
+        ).values
+        self._computed.loc[cells] = True
+
+        return True
+
+    def plan(
+        self,
+        methods: Optional[List[str]] = None,
+        models: Optional[List[str]] = None,
+        scenarios: Optional[List[str]] = None,
+        regions: Optional[List[str]] = None,
+        years: Optional[List[int]] = None,
+        variables: Optional[List[str]] = None,
+        demand_cutoff: float = 1e-3,
+        use_distributions: int = 0,
+        subshares: bool = False,
+        shares_filepath: Optional[str] = None,
+        remove_uncertainty: bool = False,
+        seed: int = 0,
+        multiprocessing: bool = True,
+        double_accounting: Optional[List[str]] = None,
+        breakdown: Union[str, List[str]] = "full",
+    ) -> dict:
+        """
+        Estimate what `calculate` needs with the same arguments, without running it:
+        the (model, scenario, year) combinations to calculate, the size of the results
+        array and of the matrices, the Monte Carlo buffers, the peak memory and the runtime.
+        Matrices are not loaded: their size is read from the number of lines of their files,
+        and the runtime is extrapolated from a micro-benchmark of the solver.
+        Estimates are upper bounds of sorts, as every variable of a region
+        is assumed to need its own activity to be solved.
+
+        The arguments are those of `calculate`.
+        :return: dict with the "work items" (a DataFrame of the estimates of each
+            model, scenario and year), the number of "workers", the "results dims",
+            the largest "matrices", the "memory" (in bytes) and the "runtime" (in seconds).
+        """
+        breakdown = resolve_breakdown(breakdown)
+        methods, models, scenarios, regions, years, variables = self._resolve_arguments(
+            methods, models, scenarios, regions, years, variables
+        )
+        scenario_data, _ = self._get_scenario_data(
+            models, scenarios, regions, years, variables
+        )
+        plan = self._make_plan(
+            methods,
+            models,
+            scenarios,
+            regions,
+            years,
+            variables,
+            scenario_data,
+            _get_settings(
+                variables,
+                breakdown,
+                use_distributions=use_distributions,
+                demand_cutoff=demand_cutoff,
+                subshares=subshares,
+                shares_filepath=shares_filepath,
+                remove_uncertainty=remove_uncertainty,
+                seed=seed,
+                double_accounting=double_accounting,
+            ),
+            multiprocessing,
+        )
+        logger.info("Calculation plan:\n%s", summarize_plan(plan))
+
+        return plan
 
-                logging.info(
-                    f"Variables in lca_results: {self.lca_results.coords['variable'].values}"
+    def _make_plan(
+        self,
+        methods: list,
+        models: list,
+        scenarios: list,
+        regions: list,
+        years: list,
+        variables: list,
+        scenario_data: xr.DataArray,
+        settings: _Settings,
+        multiprocessing: bool,
+    ) -> dict:
+        """
+        Estimate the work items, memory and runtime of a calculation (see `plan`).
+        """
+        use_distributions, demand_cutoff = (
+            settings.use_distributions,
+            settings.demand_cutoff,
+        )
+        breakdown = settings.breakdown
+        totals = "act_category" not in breakdown and "location" not in breakdown
+        mapping = {k: self.mapping[k] for k in scenario_data.coords["variables"].values}
+
+        coords = {
+            "variable": variables if "variable" in breakdown else [TOTAL],
+            "year": years,
+            "region": regions,
+            "location": (
+                self._get_locations(models[0], scenarios[0], years[0])
+                if "location" in breakdown
+                else [TOTAL]
+            ),
+            "model": models,
+            "scenario": scenarios,
+            "impact_category": methods,
+        }
+        # results of previous calls with the same settings are extended,
+        # and their cells are not computed again
+        extended = self.lca_results is not None and settings == self._results_settings
+        if extended:
+            coords = {
+                dim: list(
+                    dict.fromkeys(
+                        [*self.lca_results.coords[dim].values.tolist(), *values]
+                    )
                 )
+                for dim, values in coords.items()
+            }
+        dims = {
+            "act_category": (
+                len(set(self.classifications.values()))
+                if "act_category" in breakdown
+                else 1
+            ),
+            **{dim: len(values) for dim, values in coords.items()},
+        }
+        if use_distributions > 0:
+            dims["quantile"] = 3
 
-                self.lca_results.loc[
-                    dict(
-                        model=model,
-                        scenario=scenario,
-                        year=year,
+        workers = cpu_count() if multiprocessing else 1
+        items, runtime, parallel = [], 0.0, 1
+        for model in models:
+            for scenario in scenarios:
+                demand_tensor = create_demand_tensor(
+                    scenarios=scenario_data,
+                    model=model,
+                    scenario=scenario,
+                    regions=regions,
+                    years=years,
+                    variables=variables,
+                    mapping=mapping,
+                    units_map=self.units,
+                )
+                skip = flag_demands_below_cutoff(demand_tensor["demand"], demand_cutoff)
+
+                scenario_items = []
+                for y, year in enumerate(years):
+                    year_regions, year_methods = regions, methods
+                    if extended:
+                        year_regions, year_methods = self._get_pending_cells(
+                            model, scenario, year, regions, coords["variable"], methods
+                        )
+                    regions_idx = [regions.index(r) for r in year_regions]
+                    demanded = ~skip[:, regions_idx, y]
+                    if not demanded.any():
+                        continue
+
+                    try:
+                        sizes = get_matrix_sizes(self.filepaths, model, scenario, year)
+                    except FileNotFoundError:
+                        # skipped by `calculate` as well
+                        continue
+
+                    scenario_items.append(
+                        {
+                            "model": model,
+                            "scenario": scenario,
+                            "year": year,
+                            "regions": len(year_regions),
+                            "methods": len(year_methods),
+                            **sizes,
+                            **estimate_work_item(
+                                sizes,
+                                # one adjoint solve per method, with totals
+                                n_activities_solved=(
+                                    len(year_methods)
+                                    if totals
+                                    else min(int(demanded.sum()), sizes["activities"])
+                                ),
+                                n_regions=len(year_regions),
+                                n_variables=dims["variable"],
+                                n_methods=len(year_methods),
+                                n_categories=dims["act_category"],
+                                n_locations=dims["location"],
+                                use_distributions=use_distributions,
+                            ),
+                        }
                     )
-                ] = _fill_in_result_array(
-                    coords,
-                    values,
-                    use_distributions,
-                    shares,
-                    methods,
+
+                # the years of a scenario are calculated in parallel
+                if scenario_items:
+                    runtimes = [item["runtime"] for item in scenario_items]
+                    runtime += max(sum(runtimes) / workers, max(runtimes))
+                    parallel = max(parallel, min(workers, len(scenario_items)))
+                items.extend(scenario_items)
+
+        results_array = get_results_array_size(dims)
+        largest = max(
+            items, key=lambda item: item["technosphere exchanges"], default={}
+        )
+
+        return {
+            "work items": pd.DataFrame(items),
+            "workers": parallel,
+            "results dims": dims,
+            "matrices": {
+                key: largest.get(key, 0)
+                for key in (
+                    "activities",
+                    "biosphere flows",
+                    "technosphere exchanges",
+                    "biosphere exchanges",
                 )
+            },
+            "memory": {
+                "results array": results_array,
+                "monte carlo buffers": max(
+                    (item["monte carlo buffers"] for item in items), default=0
+                ),
+                **get_peak_memory(results_array, items, parallel),
+            },
+            "runtime": runtime,
+        }
+
+    def _check_memory(self, plan: dict, max_memory: float, out_of_memory: str) -> bool:
+        """
+        Check that the estimated peak memory of a calculation fits in `max_memory` (in MB).
+        :return: True if the results array has to be stored on disk.
+        :raises MemoryError: if the calculation does not fit, even with the results on disk.
+        """
+        if out_of_memory not in ("disk", "raise"):
+            raise ValueError(
+                f"out_of_memory must be 'disk' or 'raise', not {out_of_memory}."
+            )
+
+        peak = plan["memory"]["peak"] / 1024**2
+        if peak <= max_memory:
+            return False
+
+        without_results = peak - plan["memory"]["results array"] / 1024**2
+        if out_of_memory == "disk" and without_results <= max_memory:
+            logger.warning(
+                "The calculation needs an estimated %s MB, more than max_memory (%s MB): "
+                "the results are stored on disk.",
+                f"{peak:,.0f}",
+                f"{max_memory:,.0f}",
+            )
+            return True
+
+        raise MemoryError(
+            f"The calculation needs an estimated {peak:,.0f} MB (see Pathways.plan), "
+            f"more than max_memory ({max_memory:,.0f} MB). Consider calculating fewer "
+            f"scenarios, years or regions at once, or without multiprocessing."
+        )
+
+    def _get_locations(self, model: str, scenario: str, year: int) -> list:
+        """
+        Locations of the results: those of the inventories of a given
+        model, scenario and year, or those of the geography mapping.
+        """
+        if self.geography_mapping is not None and not self._identity_geography_mapping:
+            return sorted(set(self.geography_mapping.values()))
+
+        fps = get_matrix_filepaths(self.filepaths, model, scenario, year)
+        return fetch_inventories_locations(read_indices_csv(fps["technosphere_index"]))
+
+    def _update_lca_results(
+        self,
+        methods: list,
+        models: list,
+        scenarios: list,
+        regions: list,
+        years: list,
+        locations: list,
+        variables: list,
+        settings: _Settings,
+        disk: bool = False,
+    ) -> None:
+        """
+        Create `lca_results`, or extend it with the coordinates
+        of a new `calculate()` call. The cells computed by previous calls
+        are tracked in `_computed`. If the calculation settings change,
+        previous results are discarded, rather than mixed with the new ones.
+        If `disk` is True, or if the results are already on disk, the results
+        are stored in a memory-mapped file of the cache directory.
+        """
+        previous = self.lca_results
+
+        if self.lca_results is not None and settings != self._results_settings:
+            logger.info(
+                "The calculation settings changed: previous results are discarded."
+            )
+            self.lca_results = None
 
-    def display_results(self, cutoff: float = 0.001) -> xr.DataArray:
-        return display_results(self.lca_results, cutoff=cutoff)
+        filepath = None
+        if disk or self._results_filepath is not None:
+            filepath = DIR_CACHED_DB / f"lca_results_{uuid.uuid4()}.dat"
+
+        if self.lca_results is None:
+            self.lca_results = create_lca_results_array(
+                methods=methods,
+                years=years,
+                regions=regions,
+                locations=locations,
+                models=models,
+                scenarios=scenarios,
+                classifications=self.classifications,
+                mapping={v: None for v in variables},
+                use_distributions=settings.use_distributions > 0,
+                filepath=filepath,
+                breakdown=settings.breakdown,
+            )
+            self._computed = None
+        else:
+            self.lca_results = extend_lca_results(
+                self.lca_results,
+                {
+                    "impact_category": methods,
+                    "model": models,
+                    "scenario": scenarios,
+                    "region": regions,
+                    "year": years,
+                    "location": (
+                        locations if "location" in settings.breakdown else [TOTAL]
+                    ),
+                    "variable": variables,
+                },
+                filepath=filepath,
+            )
+
+        if self.lca_results is not previous:
+            # the previous file is not needed anymore
+            if self._results_filepath is not None:
+                try:
+                    self._results_filepath.unlink(missing_ok=True)
+                except OSError:  # still mapped, on Windows
+                    pass
+            self._results_filepath = filepath
+            if filepath is not None:
+                logger.info("LCA results are stored on disk, in %s.", filepath)
+
+        coords = {
+            dim: self.lca_results.coords[dim].values
+            for dim in (
+                "model",
+                "scenario",
+                "year",
+                "region",
+                "variable",
+                "impact_category",
+            )
+        }
+
+        if self._computed is None:
+            self._computed = xr.DataArray(
+                np.zeros([len(v) for v in coords.values()], dtype=bool),
+                coords=coords,
+                dims=list(coords),
+            )
+        else:
+            self._computed = extend_lca_results(self._computed, coords, False)
+
+        self._results_settings = settings
+
+    def _get_pending_cells(
+        self,
+        model: str,
+        scenario: str,
+        year: int,
+        regions: list,
+        variables: list,
+        methods: list,
+    ) -> tuple:
+        """
+        Find the regions and methods for which the given model, scenario
+        and year still have cells to compute.
+        Cells which are not in `_computed` yet are to compute.
+        :return: tuple of (regions, methods), both empty if there is nothing to compute.
+        """
+        if self._computed is None:
+            return list(regions), list(methods)
+
+        pending = (
+            ~self._computed.reindex(
+                dict(
+                    model=[model],
+                    scenario=[scenario],
+                    year=[year],
+                    region=regions,
+                    variable=variables,
+                    impact_category=methods,
+                ),
+                fill_value=False,
+            )
+            .isel(model=0, scenario=0, year=0)
+            .transpose("region", "variable", "impact_category")
+            .values
+        )
+
+        pending_methods = [m for i, m in enumerate(methods) if pending[:, :, i].any()]
+        if not pending_methods:
+            return [], []
+
+        methods_idx = [methods.index(m) for m in pending_methods]
+        pending_regions = [
+            r for i, r in enumerate(regions) if pending[i][:, methods_idx].any()
+        ]
+
+        return pending_regions, pending_methods
+
+    def display_results(
+        self,
+        cutoff: float = 0.001,
+        interpolate: bool = False,
+        top_n: int = None,
+        selection: dict = None,
+    ) -> xr.DataArray:
+        """
+        Display the LCA results, aggregating small contributions
+        into an "other" activity category.
+        :param cutoff: float. Contributions below this value go to "other".
+        :param interpolate: bool. Whether to interpolate the selection to every year.
+        :param top_n: int. If given, only display the `top_n` largest activity categories of each cell.
+        :param selection: dict. Dimensions and coordinates to display, e.g. {"region": ["CH"]}.
+        :return: xr.DataArray
+        """
+        return display_results(
+            self.lca_results,
+            cutoff=cutoff,
+            interpolate=interpolate,
+            top_n=top_n,
+            selection=selection,
+        )
+
+    @_record_timings
+    def export_results(
+        self, filename: str = None, format: str = "parquet", **kwargs
+    ) -> str:
+        """
+        Export the LCA results.
+        By default, the non-zero results are written to a compressed parquet file
+        (or to a Hive-partitioned parquet dataset with `partitioned=True`).
+        Other formats are "zarr", "netcdf" and "arrow".
+        :param filename: str. The name of the file to save the results, without extension.
+        :param format: str. The export format.
+        :param kwargs: Additional arguments passed to the format-specific exporter.
+        :return: str. The path to the exported file.
+        """
+        with stage("export"):
+            return export_results(self.lca_results, filename, format=format, **kwargs)
+
+    @property
+    def timings(self) -> pd.DataFrame:
+        """
+        Wall time (s), CPU time (s) and peak RSS (MB) of each stage run so far,
+        with the model, scenario, year and region it applies to.
+        :return: pd.DataFrame
+        """
+        return pd.DataFrame(self._timings, columns=COLUMNS)
+
+    def export_timings(self, filepath: str = "pathways_trace.json") -> Path:
+        """
+        Export the timings as a JSON trace, which can be opened
+        with chrome://tracing or https://ui.perfetto.dev.
+        :param filepath: str. The path to the JSON file.
+        :return: Path to the JSON file.
+        """
+        return export_trace(self._timings, filepath)
 
-    def export_results(self, filename: str = None) -> str:
+    def load_results(self, filepath: str):
         """
-        Export the non-zero LCA results to a compressed parquet file.
-        :param filename: str. The name of the file to save the results.
-        :return: None
+        Open LCA results previously exported with `export_results`, lazily.
+        Zarr and NetCDF results are opened as an xarray DataArray,
+        which replaces `lca_results`. Arrow and parquet results are
+        returned as a memory-mapped pyarrow Table or Dataset.
+        :param filepath: str. The path to the exported results.
+        :return: xr.DataArray, pyarrow.Table or pyarrow.dataset.Dataset
         """
-        return export_results_to_parquet(self.lca_results, filename)
+        results = load_results(filepath)
+        if isinstance(results, xr.DataArray):
+            self.lca_results = results
+        return results
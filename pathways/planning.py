@@ -0,0 +1,268 @@
+"""
+This module contains functions to estimate, before running it, the memory
+and the time a calculation needs (see `Pathways.plan`).
+
+Matrix sizes are read from the number of lines of the matrix and index files,
+without loading the matrices. The runtime is extrapolated from a micro-benchmark
+of the sparse solver on a synthetic technosphere matrix.
+"""
+
+import math
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+
+import bw_processing as bwp
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from .lca import get_matrix_filepaths
+
+FLOAT_SIZE = np.dtype(float).itemsize
+
+# bytes per non-zero exchange, once loaded by `load_matrix_and_index`:
+# value, (row, col) indices, flip flag and distribution parameters
+MATRIX_BYTES_PER_NNZ = (
+    FLOAT_SIZE
+    + np.dtype(bwp.INDICES_DTYPE).itemsize
+    + 1
+    + np.dtype(bwp.UNCERTAINTY_DTYPE).itemsize
+)
+# bytes per non-zero value of a CSR matrix (value and column index)
+CSR_BYTES_PER_NNZ = FLOAT_SIZE + 4
+
+# size of the synthetic matrix of the solver micro-benchmark,
+# and share of its exchanges forming loops in the supply chains
+CALIBRATION_SIZE = 2000
+CYCLIC_SHARE = 0.05
+
+
+def count_lines(filepath: [str, Path]) -> int:
+    """
+    Count the lines of a file, without parsing it.
+    :param filepath: Path to the file.
+    :return: Number of lines.
+    """
+    lines, last = 0, b"\n"
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    # the last line may not end with a newline
+    return lines + (last != b"\n")
+
+
+@lru_cache(maxsize=None)
+def _get_matrix_sizes(filepaths: tuple) -> Dict[str, int]:
+    technosphere_matrix, technosphere_index, biosphere_matrix, biosphere_index = (
+        filepaths
+    )
+    return {
+        "activities": count_lines(technosphere_index),
+        "biosphere flows": count_lines(biosphere_index),
+        # the matrix files have a header
+        "technosphere exchanges": count_lines(technosphere_matrix) - 1,
+        "biosphere exchanges": count_lines(biosphere_matrix) - 1,
+    }
+
+
+def get_matrix_sizes(
+    filepaths: list, model: str, scenario: str, year: int
+) -> Dict[str, int]:
+    """
+    Number of activities, biosphere flows and exchanges
+    of the matrices of a given model, scenario and year.
+
+    :param filepaths: A list of filepaths containing the LCA matrices.
+    :param model: The name of the model.
+    :param scenario: The name of the scenario.
+    :param year: The year of the scenario.
+    :return: A dictionary with the number of "activities", "biosphere flows",
+        "technosphere exchanges" and "biosphere exchanges".
+    """
+    fps = get_matrix_filepaths(filepaths, model, scenario, year)
+    return _get_matrix_sizes(
+        tuple(
+            fps[name]
+            for name in (
+                "technosphere_matrix",
+                "technosphere_index",
+                "biosphere_matrix",
+                "biosphere_index",
+            )
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def calibrate_solver(exchanges_per_activity: int = 10) -> Dict[str, float]:
+    """
+    Time the factorization of a synthetic technosphere matrix,
+    and a solve for one functional unit, on this machine.
+
+    :param exchanges_per_activity: Average number of non-zero exchanges per activity.
+    :return: A dictionary with the "factorization" and "solve" time per
+        non-zero value of the matrix, in seconds, and the "fill-in" ratio
+        of the non-zero values of the factors to those of the matrix.
+    """
+    rng = np.random.default_rng(0)
+    n = CALIBRATION_SIZE
+    n_inputs = n * max(exchanges_per_activity - 1, 1)
+    rows, cols = rng.integers(0, n, n_inputs), rng.integers(0, n, n_inputs)
+    # supply chains are mostly acyclic: most inputs come from upstream activities
+    rows = np.where(rng.random(n_inputs) < CYCLIC_SHARE, rows, np.minimum(rows, cols))
+    diagonal = np.arange(n)
+    matrix = sparse.coo_matrix(
+        (
+            np.concatenate(
+                [np.ones(n), -rng.uniform(0, 1 / exchanges_per_activity, n_inputs)]
+            ),
+            (np.concatenate([diagonal, rows]), np.concatenate([diagonal, cols])),
+        ),
+        shape=(n, n),
+    ).tocsc()
+
+    start = time.perf_counter()
+    factors = splu(matrix)
+    factorization = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(10):
+        demand = np.zeros(n)
+        demand[i] = 1
+        factors.solve(demand)
+    solve = (time.perf_counter() - start) / 10
+
+    return {
+        "factorization": factorization / matrix.nnz,
+        "solve": solve / matrix.nnz,
+        "fill-in": (factors.L.nnz + factors.U.nnz) / matrix.nnz,
+    }
+
+
+def get_results_array_size(dims: Dict[str, int]) -> int:
+    """
+    Size of the results array, in bytes (see `create_lca_results_array`).
+    :param dims: Number of coordinates of each dimension of the array.
+    :return: Size in bytes.
+    """
+    return math.prod(dims.values()) * FLOAT_SIZE
+
+
+def estimate_work_item(
+    sizes: Dict[str, int],
+    n_activities_solved: int,
+    n_regions: int,
+    n_variables: int,
+    n_methods: int,
+    n_categories: int,
+    n_locations: int,
+    use_distributions: int = 0,
+    calibration: Dict[str, float] = None,
+) -> Dict[str, float]:
+    """
+    Estimate the memory (in bytes) and the time (in seconds) needed
+    to calculate the results of one model, scenario and year.
+
+    :param sizes: Matrix sizes (see `get_matrix_sizes`).
+    :param n_activities_solved: Number of distinct activities to solve for.
+    :param n_regions: Number of regions.
+    :param n_variables: Number of variables.
+    :param n_methods: Number of LCIA methods.
+    :param n_categories: Number of activity categories.
+    :param n_locations: Number of locations.
+    :param use_distributions: Number of Monte Carlo iterations.
+    :param calibration: Solver timings (see `calibrate_solver`).
+    :return: A dictionary with the memory of the "matrices", "inventories",
+        "monte carlo buffers" and "aggregation" steps, and the "runtime".
+    """
+    iterations = max(use_distributions, 1)
+    tech_nnz = sizes["technosphere exchanges"]
+    bio_nnz = sizes["biosphere exchanges"]
+    calibration = calibration or calibrate_solver(
+        max(round(tech_nnz / max(sizes["activities"], 1)), 1)
+    )
+
+    unit_results = n_activities_solved * n_methods * n_categories * n_locations
+    region_results = n_regions * n_variables * n_methods * n_categories * n_locations
+
+    estimate = {
+        # parsed exchanges, their CSR matrices and the factors of the technosphere
+        "matrices": (tech_nnz + bio_nnz) * (MATRIX_BYTES_PER_NNZ + CSR_BYTES_PER_NNZ)
+        + tech_nnz * calibration["fill-in"] * CSR_BYTES_PER_NNZ,
+        # supply and inventory of each activity solved for
+        "inventories": n_activities_solved
+        * (sizes["activities"] * FLOAT_SIZE + bio_nnz * CSR_BYTES_PER_NNZ)
+        + unit_results * FLOAT_SIZE,
+        # sampled values of the uncertain exchanges (at most, all of them)
+        "monte carlo buffers": (
+            tech_nnz * use_distributions * FLOAT_SIZE if use_distributions > 0 else 0
+        ),
+        # results of all iterations, loaded and stacked, of all regions
+        "aggregation": 2 * region_results * iterations * FLOAT_SIZE,
+        "runtime": iterations
+        * tech_nnz
+        * (calibration["factorization"] + n_activities_solved * calibration["solve"]),
+    }
+
+    return estimate
+
+
+def summarize_plan(plan: dict) -> str:
+    """
+    Format a plan (see `Pathways.plan`) as a human-readable summary.
+    """
+
+    def _mb(size):
+        return f"{size / 1024 ** 2:,.1f} MB"
+
+    memory = plan["memory"]
+    lines = [
+        f"{len(plan['work items'])} (model, scenario, year) combinations to calculate, "
+        f"with up to {plan['workers']} worker(s).",
+        f"Results array: {_mb(memory['results array'])} "
+        f"({' x '.join(str(v) for v in plan['results dims'].values())}).",
+        f"Largest matrices: {plan['matrices']['activities']:,} activities, "
+        f"{plan['matrices']['technosphere exchanges']:,} technosphere and "
+        f"{plan['matrices']['biosphere exchanges']:,} biosphere exchanges.",
+        f"Memory per worker: {_mb(memory['per worker'])}, "
+        f"of which Monte Carlo buffers: {_mb(memory['monte carlo buffers'])}.",
+        f"Estimated peak memory: {_mb(memory['peak'])}.",
+        f"Estimated runtime: {plan['runtime'] / 60:,.1f} minutes.",
+    ]
+    return "\n".join(lines)
+
+
+def get_peak_memory(
+    results_array: int, per_item: List[Dict[str, float]], workers: int
+) -> Dict[str, float]:
+    """
+    Estimate the peak memory of a calculation: the results array, held by the main
+    process, and the largest work items run at the same time by the workers.
+
+    :param results_array: Size of the results array, in bytes.
+    :param per_item: Estimates of each work item (see `estimate_work_item`).
+    :param workers: Number of work items run at the same time.
+    :return: A dictionary with the memory "per worker" and the "peak" memory, in bytes.
+    """
+    if not per_item:
+        return {"per worker": 0, "peak": results_array}
+
+    # each work item is solved, then aggregated, by the same worker
+    footprints = sorted(
+        (
+            max(
+                item["matrices"] + item["inventories"] + item["monte carlo buffers"],
+                item["aggregation"],
+            )
+            for item in per_item
+        ),
+        reverse=True,
+    )
+
+    return {
+        "per worker": footprints[0],
+        "peak": results_array + sum(footprints[:workers]),
+    }
@@ -0,0 +1,243 @@
+"""
+This module contains the scheduling of the tasks run by worker processes.
+
+Each worker loads its own copy of the LCA matrices and of their factorization,
+so the number of tasks run at the same time is limited by a memory budget rather
+than by the number of cores only: a task is started once the predicted footprints
+of the running tasks and its own fit in the budget. Footprints are predicted from
+the estimates of `pathways.planning`, scaled by the ratio of the footprints
+measured in the workers to their estimates, as tasks complete.
+
+Failing tasks can be run again, and their errors returned rather than raised,
+so that one failing task does not abort the others. The tasks can also be
+cancelled from another thread, e.g., by an asyncio event loop.
+
+The threads of the BLAS and OpenMP libraries used by the workers are limited,
+so that the workers do not compete for the same cores (see `limit_threads`).
+"""
+
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .instrumentation import track_peak_memory
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+logger = logging.getLogger(__name__)
+
+# environment variables read by the BLAS and OpenMP libraries when they load
+THREADS_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def limit_threads(threads: int = 1):
+    """
+    Limit the number of threads of the BLAS and OpenMP libraries of the current process.
+    Libraries which are already loaded are limited with threadpoolctl, if installed,
+    and those loaded later through environment variables.
+    :param threads: Maximum number of threads.
+    """
+    for variable in THREADS_VARIABLES:
+        os.environ[variable] = str(threads)
+    if threadpool_limits is not None:
+        threadpool_limits(limits=threads)
+
+
+def get_memory_budget(max_memory: Optional[float] = None) -> Optional[float]:
+    """
+    Memory available to the tasks of the workers, in MB: the memory
+    available on the machine (if psutil is installed), within `max_memory`.
+    :param max_memory: Memory available to the calculation, in MB.
+    :return: Memory budget in MB, or None if there is no known limit.
+    """
+    budgets = [max_memory]
+    if psutil is not None:
+        budgets.append(psutil.virtual_memory().available / 1024**2)
+    budgets = [budget for budget in budgets if budget is not None]
+
+    return max(min(budgets), 0) if budgets else None
+
+
+def _run_measured(func: Callable, arg, star: bool) -> tuple:
+    """
+    Run a task in a worker, and measure the memory it needs, in MB
+    (None if it cannot be measured, e.g., on Windows without psutil).
+    """
+    with track_peak_memory() as memory:
+        output = func(*arg) if star else func(arg)
+
+    if memory["peak"] is None or memory["baseline"] is None:
+        return output, None
+    return output, memory["peak"] - memory["baseline"]
+
+
+def _get_outcome(future: Future) -> tuple:
+    """
+    Output and error of a completed future.
+    """
+    if future.cancelled():
+        return None, RuntimeError("The task was cancelled.")
+    error = future.exception()
+    return (None, error) if error is not None else (future.result(), None)
+
+
+def budgeted_imap(
+    pool,
+    func: Callable,
+    args: List,
+    workers: int = 1,
+    footprints: Optional[List[float]] = None,
+    memory_budget: Optional[float] = None,
+    star: bool = False,
+    retries: int = 0,
+    errors: str = "raise",
+    cancel: Optional[threading.Event] = None,
+) -> Iterator[Tuple[int, object]]:
+    """
+    Run `func` on each of `args` in a pool of workers, as many at a time as the
+    memory budget allows. At least one task is run at a time, whatever its footprint.
+
+    :param pool: multiprocessing.Pool or concurrent.futures.Executor,
+        or None to run the tasks one by one in this process.
+    :param func: Function run by the workers.
+    :param args: Arguments of each task.
+    :param workers: Maximum number of tasks run at the same time.
+    :param footprints: Estimated memory of each task, in MB. Without estimates,
+        the largest footprint measured so far is used, and a single task is run
+        until one is measured (or at all times, with a budget, if memory cannot be measured).
+    :param memory_budget: Memory available to the tasks, in MB (see `get_memory_budget`).
+        Without budget, `workers` tasks are run at a time.
+    :param star: If True, the arguments of each task are unpacked (as with `Pool.starmap`).
+    :param retries: Number of times a failing task is run again.
+    :param errors: "raise" to raise the error of a task which failed all its attempts,
+        or "return" to return the error as its output, and go on with the other tasks.
+    :param cancel: Event which, once set, stops the iteration: no task is started
+        anymore, and the outputs of the running tasks are discarded.
+    :return: Iterator of (index in `args`, output), in the order tasks complete.
+    """
+    attempts = [0] * len(args)
+
+    def retry(i: int, error: Exception) -> bool:
+        attempts[i] += 1
+        if attempts[i] <= retries:
+            logger.warning(
+                "Task %s failed (%r), attempt %s of %s.", i, error, attempts[i], retries
+            )
+            return True
+        logger.error("Task %s failed (%r).", i, error)
+        if errors == "raise":
+            raise error
+        return False
+
+    def cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    if pool is None:
+        for i, arg in enumerate(args):
+            while True:
+                if cancelled():
+                    return
+                try:
+                    output = func(*arg) if star else func(arg)
+                except Exception as error:
+                    if retry(i, error):
+                        continue
+                    output = error
+                break
+            yield i, output
+        return
+
+    completed = queue.Queue()
+    pending = deque(range(len(args)))
+    # predicted footprint of the running tasks
+    running: Dict[int, float] = {}
+    measured, ratios = [], []
+
+    def predict(i: int) -> float:
+        if footprints is not None:
+            return footprints[i] * (max(ratios) if ratios else 1)
+        return max(measured) if measured else float("inf")
+
+    while pending or running:
+        while pending and len(running) < workers:
+            footprint = predict(pending[0])
+            if (
+                running
+                and memory_budget is not None
+                and sum(running.values()) + footprint > memory_budget
+            ):
+                break
+
+            i = pending.popleft()
+            running[i] = footprint
+            if isinstance(pool, Executor):
+                pool.submit(_run_measured, func, args[i], star).add_done_callback(
+                    lambda future, i=i: completed.put((i, *_get_outcome(future)))
+                )
+            else:
+                pool.apply_async(
+                    _run_measured,
+                    (func, args[i], star),
+                    callback=lambda output, i=i: completed.put((i, output, None)),
+                    error_callback=lambda error, i=i: completed.put((i, None, error)),
+                )
+            logger.debug(
+                "Task %s started, %s running (predicted footprint: %.1f MB).",
+                i,
+                len(running),
+                footprint,
+            )
+
+        try:
+            # the queue is polled to notice a cancellation
+            i, output, error = completed.get(timeout=None if cancel is None else 0.1)
+        except queue.Empty:
+            if cancelled():
+                return
+            continue
+        if cancelled():
+            return
+        del running[i]
+        if error is not None:
+            if retry(i, error):
+                pending.append(i)
+            else:
+                yield i, error
+            continue
+
+        output, footprint = output
+        if footprint is None and footprints is not None:
+            # without measures, the estimates are trusted as they are
+            footprint = footprints[i]
+        if footprint is not None:
+            measured.append(footprint)
+            if footprints is not None and footprints[i] > 0:
+                ratios.append(footprint / footprints[i])
+
+        yield i, output
+
+
+def budgeted_map(*args, **kwargs) -> list:
+    """
+    Same as `budgeted_imap`, but return the outputs in the order of the arguments.
+    """
+    outputs = dict(budgeted_imap(*args, **kwargs))
+    return [outputs[i] for i in range(len(outputs))]
@@ -0,0 +1,262 @@
+"""
+This module contains a long-running calculation server, started with `pathways serve`.
+
+Creating a `Pathways` object validates the datapackage and reads its scenario data,
+mapping and classifications. The server keeps the `Pathways` objects of the last
+datapackages used in memory, along with their results: a query only calculates the
+cells which previous queries did not, and the results of unit demands of
+`evaluate_demand` are reused. The factorized technosphere matrix and the
+characterization matrices of the last (model, scenario, year) calculated are kept
+in memory too (see `pathways.lca.keep_matrices`), so that a query for other
+regions or methods does not load and factorize them again. This holds for the
+deterministic calculations run in the server process, i.e., without `multiprocessing`.
+
+Queries are JSON objects sent over HTTP on the local machine:
+
+    POST /calculate  {"datapackage": ..., "arguments": {...}}  (see `Pathways.calculate`)
+    POST /results    {"datapackage": ..., "select": {"year": [2030], ...}}
+    GET  /status
+
+Only one calculation runs at a time for a given datapackage, and results
+of more than MAX_RESULT_VALUES values are to be queried in several slices.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from .cache import get_cache
+from .lca import keep_matrices
+from .pathways import Pathways
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# largest number of values returned by a /results query
+MAX_RESULT_VALUES = 1_000_000
+
+
+class Server:
+    """
+    Calculation server, keeping the `Pathways` objects of the
+    `max_datapackages` datapackages used last in memory, and the matrices
+    of the `max_matrices` (model, scenario, year) calculated last.
+
+    :param max_datapackages: Number of datapackages kept in memory.
+    :type max_datapackages: int
+    :param max_matrices: Number of (model, scenario, year) whose matrices are kept in memory.
+    :type max_matrices: int
+    """
+
+    def __init__(self, max_datapackages: int = 4, max_matrices: int = 8):
+        self.max_datapackages = max_datapackages
+        self.max_matrices = max_matrices
+        self._pathways = OrderedDict()
+        self._matrices = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_pathways(self, datapackage: str) -> Tuple[Pathways, threading.Lock]:
+        """
+        Return the `Pathways` object of a datapackage, loading it if needed,
+        and the lock to hold while using it. The datapackage used
+        least recently is evicted if there are too many.
+        """
+        datapackage = str(Path(datapackage).resolve())
+        with self._lock:
+            if datapackage not in self._locks:
+                self._locks[datapackage] = threading.Lock()
+            lock = self._locks[datapackage]
+
+        with lock:
+            with self._lock:
+                pathways = self._pathways.get(datapackage)
+                if pathways is not None:
+                    self._pathways.move_to_end(datapackage)
+                    return pathways, lock
+
+            pathways = Pathways(datapackage)
+            logger.info("Datapackage loaded: %s", datapackage)
+
+            with self._lock:
+                self._pathways[datapackage] = pathways
+                while len(self._pathways) > self.max_datapackages:
+                    evicted, _ = self._pathways.popitem(last=False)
+                    logger.info("Datapackage evicted: %s", evicted)
+
+        return pathways, lock
+
+    def calculate(self, datapackage: str, arguments: Optional[dict] = None) -> dict:
+        """
+        Calculate LCA results, which extend those of previous queries
+        (see `Pathways.calculate`). Calculations run in the server process,
+        unless `multiprocessing` is set in the arguments.
+        :return: dict with the "dims" and "shape" of the results, and the "time" it took in seconds.
+        """
+        arguments = {"multiprocessing": False, **(arguments or {})}
+
+        pathways, lock = self.get_pathways(datapackage)
+        start = time.perf_counter()
+        with lock, keep_matrices(self._matrices, self.max_matrices):
+            pathways.calculate(**arguments)
+            results = pathways.lca_results
+            if results is None:
+                raise ValueError("No results could be calculated.")
+
+            return {
+                "dims": list(results.dims),
+                "shape": list(results.shape),
+                "time": time.perf_counter() - start,
+            }
+
+    def results(self, datapackage: str, select: Optional[dict] = None) -> dict:
+        """
+        Return a slice of the LCA results calculated so far.
+        :param select: Coordinates to select, per dimension. Dimensions left out are kept whole.
+        :return: dict with the "dims", "coords" and "data" of the slice.
+        :raises ValueError: if the slice has more than MAX_RESULT_VALUES values.
+        """
+        pathways, lock = self.get_pathways(datapackage)
+        with lock:
+            if pathways.lca_results is None:
+                raise ValueError(f"No results were calculated for {datapackage}.")
+
+            unknown = set(select or {}) - set(pathways.lca_results.dims)
+            if unknown:
+                raise ValueError(f"Unknown dimensions: {sorted(unknown)}.")
+
+            selection = pathways.lca_results.sel(
+                {
+                    dim: values if isinstance(values, list) else [values]
+                    for dim, values in (select or {}).items()
+                }
+            )
+            if selection.size > MAX_RESULT_VALUES:
+                raise ValueError(
+                    f"The selection has {selection.size:,} values, more than "
+                    f"{MAX_RESULT_VALUES:,}: select fewer coordinates."
+                )
+            return {
+                "dims": list(selection.dims),
+                "coords": {
+                    dim: selection.coords[dim].values.tolist() for dim in selection.dims
+                },
+                "data": selection.values.tolist(),
+            }
+
+    def status(self) -> dict:
+        """
+        Return the datapackages loaded, from the least to the most recently used,
+        the number of (model, scenario, year) whose matrices are kept,
+        and the statistics of the cache.
+        """
+        with self._lock:
+            datapackages = list(self._pathways)
+
+        return {
+            "datapackages": datapackages,
+            "max_datapackages": self.max_datapackages,
+            "matrices": len(self._matrices),
+            "max_matrices": self.max_matrices,
+            "cache": get_cache().stats(),
+        }
+
+
+def _get_handler(server: Server):
+    """
+    Handler of the HTTP requests, answering them with `server`.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._reply(200, server.status())
+            else:
+                self._reply(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            routes = {"/calculate": server.calculate, "/results": server.results}
+            if self.path not in routes:
+                self._reply(404, {"error": f"Unknown path: {self.path}"})
+                return
+
+            try:
+                query = json.loads(
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                )
+                self._reply(200, routes[self.path](**query))
+            except (
+                json.JSONDecodeError,
+                TypeError,
+                KeyError,
+                ValueError,
+                FileNotFoundError,
+            ) as e:
+                self._reply(400, {"error": repr(e)})
+            except Exception as e:
+                logger.exception("Query failed: %s", self.path)
+                self._reply(500, {"error": repr(e)})
+
+        def log_message(self, format, *args):
+            logger.info("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    max_datapackages: int = 4,
+    datapackages: Iterable[str] = (),
+    max_matrices: int = 8,
+) -> ThreadingHTTPServer:
+    """
+    Create a calculation server, without starting it (see `serve`).
+    :param host: Address to listen on. Keep the default to only accept local queries.
+    :param port: Port to listen on, or 0 for any free port.
+    :param max_datapackages: Number of datapackages kept in memory.
+    :param datapackages: Datapackages to load right away.
+    :param max_matrices: Number of (model, scenario, year) whose matrices are kept in memory.
+    :return: http.server.ThreadingHTTPServer, whose `server` attribute is the `Server`.
+    """
+    server = Server(max_datapackages=max_datapackages, max_matrices=max_matrices)
+    for datapackage in datapackages:
+        server.get_pathways(datapackage)
+
+    httpd = ThreadingHTTPServer((host, port), _get_handler(server))
+    httpd.server = server
+    return httpd
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    max_datapackages: int = 4,
+    datapackages: Iterable[str] = (),
+    max_matrices: int = 8,
+):
+    """
+    Run a calculation server until interrupted. The arguments are those of `make_server`.
+    """
+    httpd = make_server(host, port, max_datapackages, datapackages, max_matrices)
+    print(f"Pathways server listening on http://{host}:{httpd.server_address[1]}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
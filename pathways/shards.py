@@ -0,0 +1,175 @@
+"""
+This module contains the sharding of a calculation across several processes or nodes,
+without a scheduler: each shard calculates a deterministic part of the
+(model, scenario, year, region) work list (see `calculate(shard=..., num_shards=...)`),
+and writes its results to a shared directory. Once all shards are done,
+`merge_shards` assembles the full results array and the Monte Carlo statistics.
+
+The results of a shard are written as checkpoints (see `pathways.checkpoints`)
+in a `shard-<i>-of-<n>` subdirectory, with a `shard.json` manifest listing the
+coordinates of the results array, and its Monte Carlo statistics in a `stats` folder.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .checkpoints import iter_checkpoints
+from .filesystem_constants import STATS_DIR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "shard.json"
+
+
+def get_shard(work: List[Tuple], shard: int, num_shards: int) -> List[Tuple]:
+    """
+    Part of a work list calculated by a shard. The work list is split in
+    `num_shards` contiguous parts of (almost) equal size, so that the regions
+    of a (model, scenario, year), which share their matrices, stay mostly together.
+    :param work: Work list, e.g. (model, scenario, year, region) tuples, in a fixed order.
+    :param shard: Index of the shard, from 0 to `num_shards` - 1.
+    :param num_shards: Number of shards.
+    :return: Part of the work list.
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(
+            f"shard must be between 0 and num_shards - 1 ({num_shards - 1}), not {shard}."
+        )
+    size, rest = divmod(len(work), num_shards)
+    start = shard * size + min(shard, rest)
+    return work[start : start + size + (shard < rest)]
+
+
+def get_shard_directory(directory: [str, Path], shard: int, num_shards: int) -> Path:
+    """
+    Directory of the results of a shard, within the shared directory.
+    """
+    return Path(directory) / f"shard-{shard}-of-{num_shards}"
+
+
+def write_manifest(
+    shard_directory: [str, Path],
+    shard: int,
+    num_shards: int,
+    lca_results: xr.DataArray,
+    complete: bool,
+):
+    """
+    Write the manifest of a shard, once its calculation is over.
+    :param shard_directory: Directory of the shard (see `get_shard_directory`).
+    :param shard: Index of the shard.
+    :param num_shards: Number of shards.
+    :param lca_results: Results array of the shard, whose coordinates are those of the merged array.
+    :param complete: Whether all the work of the shard succeeded.
+    """
+    manifest = {
+        "shard": shard,
+        "num_shards": num_shards,
+        "complete": complete,
+        "coords": {
+            dim: lca_results.coords[dim].values.tolist() for dim in lca_results.dims
+        },
+    }
+    with open(Path(shard_directory) / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def merge_shards(
+    directory: [str, Path], stats_directory: [str, Path] = STATS_DIR
+) -> xr.DataArray:
+    """
+    Assemble the results of all the shards of a calculation.
+    :param directory: Shared directory the shards wrote their results to.
+    :param stats_directory: Directory to write the merged Monte Carlo statistics to.
+    :return: xr.DataArray of the LCA results.
+    :raises ValueError: if some shards are missing or did not complete.
+    """
+    manifests = []
+    for filepath in sorted(Path(directory).glob(f"shard-*/{MANIFEST}")):
+        with open(filepath) as f:
+            manifests.append((filepath.parent, json.load(f)))
+    if not manifests:
+        raise FileNotFoundError(f"No shard results found in {directory}.")
+
+    num_shards = {manifest["num_shards"] for _, manifest in manifests}
+    if len(num_shards) > 1:
+        raise ValueError(
+            f"{directory} contains the shards of several calculations "
+            f"(with {sorted(num_shards)} shards)."
+        )
+    num_shards = num_shards.pop()
+    missing = set(range(num_shards)) - {manifest["shard"] for _, manifest in manifests}
+    if missing:
+        raise ValueError(
+            f"Shards {sorted(missing)} of {num_shards} have no results in {directory}."
+        )
+    incomplete = [
+        manifest["shard"] for _, manifest in manifests if not manifest["complete"]
+    ]
+    if incomplete:
+        raise ValueError(
+            f"Shards {incomplete} did not complete: "
+            f"run them again with resume=True before merging."
+        )
+
+    coords = manifests[0][1]["coords"]
+    lca_results = xr.DataArray(
+        np.zeros(tuple(len(values) for values in coords.values())),
+        coords=coords,
+        dims=list(coords),
+    )
+    for shard_directory, _ in manifests:
+        for model, scenario, year, results in iter_checkpoints(shard_directory):
+            lca_results.loc[
+                dict(
+                    model=model,
+                    scenario=scenario,
+                    year=year,
+                    **{
+                        dim: results.coords[dim].values
+                        for dim in ("region", "variable", "impact_category")
+                    },
+                )
+            ] = results.values
+
+    merge_stats(
+        [shard_directory / "stats" for shard_directory, _ in manifests],
+        stats_directory,
+    )
+
+    return lca_results
+
+
+def merge_stats(directories: List[Path], stats_directory: [str, Path] = STATS_DIR):
+    """
+    Merge the Monte Carlo statistics of each (model, scenario, year), split
+    by region across several directories, into `stats_directory`
+    (see `pathways.stats.log_mc_parameters_to_excel`).
+    """
+    filepaths = {}
+    for directory in directories:
+        for filepath in sorted(Path(directory).glob("*.xlsx")):
+            filepaths.setdefault(filepath.name, []).append(filepath)
+
+    for name, parts in filepaths.items():
+        sheets = {}
+        for filepath in parts:
+            for sheet, df in pd.read_excel(filepath, sheet_name=None).items():
+                sheets.setdefault(sheet, []).append(df)
+
+        export_path = Path(stats_directory) / name
+        export_path.parent.mkdir(parents=True, exist_ok=True)
+        with pd.ExcelWriter(export_path, engine="openpyxl") as writer:
+            for sheet, dfs in sheets.items():
+                df = pd.concat(dfs)
+                # the indices mapping is the same for all regions
+                if sheet == "Indices mapping":
+                    df = df.drop_duplicates()
+                df.to_excel(writer, sheet_name=sheet, index=False)
+        logger.info("Monte Carlo parameters merged in: %s", export_path.resolve())
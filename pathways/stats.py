@@ -267,8 +267,10 @@ def log_mc_parameters_to_excel(
     tehnosphere_indices: dict,
     iteration_results: dict,
     shares: dict = None,
+    directory: [str, Path] = STATS_DIR,
 ):
-    export_path = STATS_DIR / f"{model}_{scenario}_{year}.xlsx"
+    export_path = Path(directory) / f"{model}_{scenario}_{year}.xlsx"
+    export_path.parent.mkdir(parents=True, exist_ok=True)
 
     # create Excel workbook using openpyxl
     with pd.ExcelWriter(export_path, engine="openpyxl") as writer:
@@ -9,18 +9,12 @@ from premise.geomap import Geomap
 from scipy.interpolate import interp1d
 from stats_arrays import *
 
-from pathways.filesystem_constants import DATA_DIR, USER_LOGS_DIR
+from pathways.filesystem_constants import DATA_DIR
 from pathways.utils import get_activity_indices
 
 SUBSHARES = DATA_DIR / "technologies_shares.yaml"
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename=USER_LOGS_DIR / "pathways.log",  # Log file to save the entries
-    filemode="a",  # Append to the log file if it exists, 'w' to overwrite
-    format="%(asctime)s - %(levelname)s - %(module)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+logger = logging.getLogger(__name__)
 
 
 def load_subshares(filepath) -> dict:
@@ -80,11 +74,14 @@ def check_uncertainty_params(data):
                             params["uncertainty_type"]
                         ]
                     ):
-                        logging.warning(
-                            f"Missing mandatory uncertainty parameters for '{year}' in '{group}'"
+                        logger.warning(
+                            "Missing mandatory uncertainty parameters for '%s' in '%s'",
+                            year,
+                            group,
                         )
     return data
 
+
 def get_central_value(params):
     """
     Get central value of a distribution.
@@ -113,8 +110,11 @@ def check_subshares(data: dict) -> dict:
         for technology, params in technologies.items():
             name = params.get("name")
             if name in {"null", "Null", None} or not name.strip():
-                logging.warning(
-                    f"Technology '{technology}' in category '{category}' is being removed due to invalid name '{name}'."
+                logger.warning(
+                    "Technology '%s' in category '%s' is being removed due to invalid name '%s'.",
+                    technology,
+                    category,
+                    name,
                 )
                 technologies_to_remove.append(technology)
                 continue
@@ -123,8 +123,10 @@ def check_subshares(data: dict) -> dict:
                     if "loc" in share:
                         totals[year] += share["loc"]
             else:
-                logging.warning(
-                    f"Technology '{technology}' in category '{category}' does not have a 'share' key"
+                logger.warning(
+                    "Technology '%s' in category '%s' does not have a 'share' key",
+                    technology,
+                    category,
                 )
 
         for tech in technologies_to_remove:
@@ -132,8 +134,11 @@ def check_subshares(data: dict) -> dict:
 
         for year, total_value in totals.items():
             if not np.isclose(total_value, 1.00, rtol=1e-3):
-                logging.warning(
-                    f"Total of '{year}' values in category '{category}' does not add up to 1.00 (Total: {total_value}). Adjusting values."
+                logger.warning(
+                    "Total of '%s' values in category '%s' does not add up to 1.00 (Total: %s). Adjusting values.",
+                    year,
+                    category,
+                    total_value,
                 )
                 for technology, params in technologies.items():
                     if (
@@ -288,9 +293,14 @@ def adjust_matrix_based_on_shares(
         list_indices.append((tech_idx, consumer_idx))
         list_amounts.append(tuple(total_amount))
 
-        logging.info(
-            f"Final combined amount for tech index {tech_idx} to consumer index {consumer_idx}: {total_amount}"
-        )
+    if logger.isEnabledFor(logging.DEBUG):
+        for (tech_idx, consumer_idx), total_amount in final_amounts.items():
+            logger.debug(
+                "Final combined amount for tech index %s to consumer index %s: %s",
+                tech_idx,
+                consumer_idx,
+                total_amount,
+            )
 
     indices = np.array(list_indices, dtype=bwp.INDICES_DTYPE)
     data = np.array(list_amounts)
@@ -320,7 +330,9 @@ def load_and_normalize_shares(
         for technology, params in technologies.items():
             for y, share in params["share"].items():
                 if iterations == 0:
-                    shares[technology_group][y][technology] = np.array([get_central_value(share)])
+                    shares[technology_group][y][technology] = np.array(
+                        [get_central_value(share)]
+                    )
                 else:
                     uncertainty_base = UncertaintyBase.from_dicts(share)
                     random_generator = MCRandomNumberGenerator(
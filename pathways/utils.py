@@ -9,32 +9,49 @@ dictionary, checking unclassified activities, and getting activity indices.
 """
 
 import csv
+import json
 import logging
+import os
+import time
 import warnings
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from datetime import datetime
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from itertools import product
 from pathlib import Path
 from typing import Any, Dict, List, Set, Tuple, Union
+from urllib.parse import quote
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import sparse as sp
 import xarray as xr
 import yaml
 from datapackage import DataPackage, DataPackageException
 from premise.geomap import Geomap
 
-from .filesystem_constants import DATA_DIR, DIR_CACHED_DB, USER_LOGS_DIR
+from .filesystem_constants import DATA_DIR, DIR_CACHED_DB, DIR_GEOMAP
 
 CLASSIFICATIONS = DATA_DIR / "activities_classifications.yaml"
 UNITS_CONVERSION = DATA_DIR / "units_conversion.yaml"
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    filename=USER_LOGS_DIR / "pathways.log",  # Log file to save the entries
-    filemode="a",  # Append to the log file if it exists, 'w' to overwrite
-    format="%(asctime)s - %(levelname)s - %(module)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+# ecoinvent locations to fall back on, in order,
+# when an activity is not available for a given region
+DEFAULT_LOCATIONS = ["RoW", "GLO", "RER", "CH"]
+
+# IAM region -> candidate ecoinvent locations, per model
+_LOCATION_FALLBACKS = {}
+
+# dimensions of the results which can be summed over (see `resolve_breakdown`),
+# which then have the single coordinate TOTAL
+BREAKDOWN_DIMS = ["act_category", "location", "variable"]
+TOTAL = "total"
+
+logger = logging.getLogger(__name__)
 
 
 def read_indices_csv(file_path: Path) -> dict[tuple[str, str, str, str], int]:
@@ -59,9 +76,12 @@ def read_indices_csv(file_path: Path) -> dict[tuple[str, str, str, str], int]:
             try:
                 indices[(row[0], row[1], row[2], row[3])] = int(row[4])
             except IndexError as err:
-                logging.error(
-                    f"Error reading row {row} from {file_path}: {err}. "
-                    f"Could it be that the file uses commas instead of semicolons?"
+                logger.error(
+                    "Error reading row %s from %s: %s. "
+                    "Could it be that the file uses commas instead of semicolons?",
+                    row,
+                    file_path,
+                    err,
                 )
     # remove any unicode characters
     indices = {tuple([str(x) for x in k]): v for k, v in indices.items()}
@@ -98,10 +118,46 @@ def load_classifications():
     return data
 
 
+def is_sparse(data: xr.DataArray) -> bool:
+    """
+    Check if a DataArray is backed by a sparse array.
+    :param data: xr.DataArray
+    :return: bool
+    """
+    return isinstance(data.data, sp.SparseArray)
+
+
+def get_dense_values(data: xr.DataArray) -> np.ndarray:
+    """
+    Return the values of a DataArray as a numpy array,
+    whether it is backed by a dense or a sparse array.
+    Sparse arrays should be sliced down before calling this.
+    :param data: xr.DataArray
+    :return: np.ndarray
+    """
+    if is_sparse(data):
+        return data.data.todense()
+    return data.values
+
+
+def get_harmonization_factors(units: list) -> np.ndarray:
+    """
+    Factors converting values in the given units to the units they are harmonized to
+    (see `harmonize_units`): if not all of them are the same, PJ/yr and EJ/yr are converted to EJ/yr.
+    :param units: list of units
+    :return: np.ndarray of conversion factors, of ones if no conversion is needed
+    """
+    if len(set(units)) > 1 and all(x in ["PJ/yr", "EJ/yr", "PJ/yr."] for x in units):
+        return np.array([1e-3 if u in ("PJ/yr", "PJ/yr.") else 1 for u in units])
+
+    return np.ones(len(units))
+
+
 def harmonize_units(scenario: xr.DataArray, variables: list) -> xr.DataArray:
     """
     Harmonize the units of a scenario. Some units are in PJ/yr, while others are in EJ/yr
     We want to convert everything to the same unit - preferably the largest one.
+    Sparse-backed scenarios are converted without being densified.
     :param scenario: xr.DataArray
     :param variables: list of variables
     :return: xr.DataArray
@@ -122,16 +178,35 @@ def harmonize_units(scenario: xr.DataArray, variables: list) -> xr.DataArray:
     if len(set(units)) > 1:
         if all(x in ["PJ/yr", "EJ/yr", "PJ/yr."] for x in units):
             # convert to EJ/yr
-            # create vector of conversion factors
-            conversion_factors = np.array(
-                [1e-3 if u in ("PJ/yr", "PJ/yr.") else 1 for u in units]
-            )
-            # multiply scenario by conversion factors
-            scenario.loc[dict(variables=variables)] *= conversion_factors[
-                :, np.newaxis, np.newaxis
-            ]
-            # update units
-            scenario.attrs["units"] = {var: "EJ/yr" for var in variables}
+            conversion_factors = get_harmonization_factors(units)
+            if is_sparse(scenario):
+                # sparse arrays do not support in-place assignment,
+                # so we broadcast a factor for every variable instead
+                factors = dict(zip(variables, conversion_factors))
+                attrs = scenario.attrs
+                scenario = scenario * xr.DataArray(
+                    [
+                        factors.get(var, 1.0)
+                        for var in scenario.coords["variables"].values
+                    ],
+                    coords={"variables": scenario.coords["variables"]},
+                    dims="variables",
+                )
+                scenario.attrs = attrs
+            else:
+                # multiply scenario by conversion factors
+                scenario.loc[dict(variables=variables)] *= conversion_factors[
+                    :, np.newaxis, np.newaxis
+                ]
+            # update units, without altering the attributes
+            # of the array the scenario was selected from
+            scenario.attrs = {
+                **scenario.attrs,
+                "units": {
+                    **scenario.attrs["units"],
+                    **{var: "EJ/yr" for var in variables},
+                },
+            }
 
     return scenario
 
@@ -161,6 +236,31 @@ def load_units_conversion() -> dict:
     return data
 
 
+def resolve_breakdown(breakdown: Union[str, List[str]]) -> tuple:
+    """
+    Dimensions the results are broken down by, in the order of BREAKDOWN_DIMS.
+    The results are summed over the others.
+
+    :param breakdown: "full" for all of them, "totals" for the variables only,
+        or a list of dimensions among BREAKDOWN_DIMS.
+    :type breakdown: Union[str, List[str]]
+    :return: A tuple of dimensions.
+    :rtype: tuple
+    :raises ValueError: If the breakdown is unknown.
+    """
+    if breakdown == "full":
+        return tuple(BREAKDOWN_DIMS)
+    if breakdown == "totals":
+        return ("variable",)
+    if isinstance(breakdown, str) or not set(breakdown) <= set(BREAKDOWN_DIMS):
+        raise ValueError(
+            f"breakdown must be 'full', 'totals' or a list of dimensions "
+            f"among {BREAKDOWN_DIMS}, not {breakdown!r}."
+        )
+
+    return tuple(dim for dim in BREAKDOWN_DIMS if dim in breakdown)
+
+
 def create_lca_results_array(
     methods: List[str],
     years: List[int],
@@ -171,6 +271,8 @@ def create_lca_results_array(
     classifications: dict,
     mapping: dict,
     use_distributions: bool = False,
+    filepath: Union[str, Path] = None,
+    breakdown: Union[str, List[str]] = "full",
 ) -> xr.DataArray:
     """
     Create an xarray DataArray to store Life Cycle Assessment (LCA) results.
@@ -195,6 +297,11 @@ def create_lca_results_array(
     :type mapping: dict
     :param use_distributions: A boolean indicating whether to use distributions.
     :type use_distributions: bool
+    :param filepath: If given, the array is stored in this memory-mapped file rather than in memory.
+    :type filepath: Union[str, Path]
+    :param breakdown: Dimensions the results are broken down by (see `resolve_breakdown`).
+        The others have the single coordinate TOTAL.
+    :type breakdown: Union[str, List[str]]
 
     :return: An xarray DataArray with the appropriate coordinates and dimensions to store LCA results.
     :rtype: xr.DataArray
@@ -214,13 +321,19 @@ def create_lca_results_array(
     if len(scenarios) == 0:
         raise ValueError("Empty list of scenarios")
 
+    breakdown = resolve_breakdown(breakdown)
+
     # Define the coordinates for the xarray DataArray
     coords = {
-        "act_category": list(set(list(classifications.values()))),
-        "variable": list(mapping.keys()),
+        "act_category": (
+            sorted(set(classifications.values()))
+            if "act_category" in breakdown
+            else [TOTAL]
+        ),
+        "variable": list(mapping.keys()) if "variable" in breakdown else [TOTAL],
         "year": years,
         "region": regions,
-        "location": locations,
+        "location": locations if "location" in breakdown else [TOTAL],
         "model": models,
         "scenario": scenarios,
         "impact_category": methods,
@@ -230,111 +343,512 @@ def create_lca_results_array(
         # we calculate the 5th, 50th, and 95th percentiles
         coords.update({"quantile": [0.05, 0.5, 0.95]})
 
-    dims = (
-        len(coords["act_category"]),
-        len(coords["variable"]),
-        len(years),
-        len(regions),
-        len(locations),
-        len(models),
-        len(scenarios),
-        len(methods),
-    )
-
-    if use_distributions is True:
-        dims += (3,)
+    dims = tuple(len(values) for values in coords.values())
 
     # Create the xarray DataArray with the defined coordinates and dimensions.
     # The array is initialized with zeros.
-    return xr.DataArray(np.zeros(dims), coords=coords, dims=list(coords.keys()))
+    if filepath is not None:
+        data = np.memmap(filepath, dtype=float, mode="w+", shape=dims)
+    else:
+        data = np.zeros(dims)
+
+    return xr.DataArray(data, coords=coords, dims=list(coords.keys()))
+
+
+def extend_lca_results(
+    lca_results: xr.DataArray,
+    coords: dict,
+    fill_value: Any = 0,
+    filepath: Union[str, Path] = None,
+) -> xr.DataArray:
+    """
+    Extend an array with new coordinates, appended after the existing ones.
+    Cells of the new coordinates are set to `fill_value`.
+    The array is returned as is if all the coordinates already exist.
+    :param lca_results: Xarray DataArray to extend.
+    :param coords: Dictionary of {dimension: coordinates} the array should cover.
+    :param fill_value: Value of the new cells.
+    :param filepath: If given, the extended array is stored in this memory-mapped file.
+    :return: xr.DataArray
+    """
+    extended = {}
+    for dim, values in coords.items():
+        existing = lca_results.coords[dim].values.tolist()
+        existing_set = set(existing)
+        new = [v for v in values if v not in existing_set]
+        if new:
+            extended[dim] = existing + new
+
+    if not extended:
+        return lca_results
+
+    if filepath is None:
+        return lca_results.reindex(extended, fill_value=fill_value)
+
+    new_coords = {
+        dim: extended.get(dim, lca_results.coords[dim].values.tolist())
+        for dim in lca_results.dims
+    }
+    data = np.memmap(
+        filepath,
+        dtype=lca_results.dtype,
+        mode="w+",
+        shape=tuple(len(v) for v in new_coords.values()),
+    )
+    if fill_value != 0:
+        data[:] = fill_value
+    # existing coordinates come first
+    data[tuple(slice(0, n) for n in lca_results.shape)] = lca_results.values
+
+    return xr.DataArray(
+        data, coords=new_coords, dims=lca_results.dims, attrs=lca_results.attrs
+    )
+
 
+def get_results_template(
+    lca_results: xr.DataArray, dims: Tuple[str, ...] = ("act_category", "location")
+) -> xr.DataArray:
+    """
+    Return an empty selection of the results array which only keeps the coordinates
+    of `dims`, to send the layout of the results to worker processes
+    without copying the results themselves.
+    :param lca_results: Xarray DataArray of LCA results.
+    :param dims: Dimensions whose coordinates are kept.
+    :return: xr.DataArray of size zero.
+    """
+    return lca_results.isel(
+        {dim: slice(0, 0) for dim in lca_results.dims if dim not in dims}
+    )
+
+
+def iter_results_blocks(
+    lca_results: xr.DataArray, dims: Tuple[str, ...] = ("model", "scenario", "year")
+):
+    """
+    Iterate over the LCA results, one block per combination of `dims` coordinates.
+    Only one block is copied in memory at a time.
+    :param lca_results: Xarray DataArray with LCA results.
+    :param dims: Dimensions to split the results along.
+    :return: Generator of (dictionary of coordinates, block) tuples.
+    """
+    for positions in product(*[range(lca_results.sizes[dim]) for dim in dims]):
+        block = lca_results.isel(dict(zip(dims, positions)))
+        yield {dim: block.coords[dim].item() for dim in dims}, block
+
+
+def _results_block_to_table(
+    block: xr.DataArray, constants: Dict[str, Tuple[int, np.ndarray]] = None
+) -> pa.Table:
+    """
+    Convert the non-zero values of a block of LCA results to an Arrow table in long format.
+    Coordinate columns are dictionary-encoded, with the full coordinate as dictionary,
+    so that all the blocks of a given array share the same dictionaries.
+    :param block: Block of LCA results (see `iter_results_blocks`).
+    :param constants: Dimensions of the block to add as constant columns,
+    given as {dimension: (position, full coordinate)}.
+    :return: pyarrow.Table
+    """
+    values = block.values
+    non_zero = np.nonzero(values)
+
+    columns = {}
+    for dim, (position, coordinate) in (constants or {}).items():
+        columns[dim] = pa.DictionaryArray.from_arrays(
+            pa.array(np.full(len(non_zero[0]), position, dtype=np.int32)),
+            pa.array(coordinate),
+        )
+    for i, dim in enumerate(block.dims):
+        columns[dim] = pa.DictionaryArray.from_arrays(
+            pa.array(non_zero[i].astype(np.int32)),
+            pa.array(block.coords[dim].values),
+        )
+    columns["value"] = pa.array(values[non_zero])
 
-def export_results_to_parquet(lca_results: xr.DataArray, filepath: str) -> str:
+    return pa.table(columns)
+
+
+def _iter_results_tables(lca_results: xr.DataArray):
     """
-    Export the LCA results to a parquet file.
+    Iterate over the LCA results as Arrow tables, one per (model, scenario, year) block.
     :param lca_results: Xarray DataArray with LCA results.
-    :param filepath: The path to the parquet file.
-    :return: None
+    :return: Generator of pyarrow.Table
+    """
+    dims = ("model", "scenario", "year")
+    for coords, block in iter_results_blocks(lca_results, dims):
+        constants = {
+            dim: (
+                lca_results.indexes[dim].get_loc(value),
+                lca_results.coords[dim].values,
+            )
+            for dim, value in coords.items()
+        }
+        yield _results_block_to_table(block.drop_vars(dims), constants)
+
+
+def export_results_to_parquet(
+    lca_results: xr.DataArray,
+    filepath: str,
+    partitioned: bool = False,
+    row_group_size: int = 1_000_000,
+) -> str:
+    """
+    Export the non-zero LCA results to parquet.
+
+    The results are written one (model, scenario, year) block at a time,
+    so that memory use stays bounded by the size of one block.
+
+    By default, they are written to a single gzip-compressed file.
+    If `partitioned` is True, they are written to a Hive-partitioned
+    dataset (`model=.../scenario=.../year=.../part-0.parquet`),
+    compressed with zstd, which can be read back with
+    `pyarrow.dataset.dataset(filepath, partitioning="hive")`.
+
+    :param lca_results: Xarray DataArray with LCA results.
+    :param filepath: The path to the parquet file, without extension.
+    :param partitioned: Whether to write a partitioned dataset.
+    :param row_group_size: Maximum number of rows per row group.
+    :return: The path to the parquet file, or to the dataset directory.
     """
     if filepath is None:
-        filepath = f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.gzip"
+        filepath = f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    dims = ("model", "scenario", "year")
+
+    if partitioned:
+        Path(filepath).mkdir(parents=True, exist_ok=True)
+        for coords, block in iter_results_blocks(lca_results, dims):
+            table = _results_block_to_table(block.drop_vars(dims))
+            if table.num_rows == 0:
+                continue
+
+            directory = Path(filepath).joinpath(
+                *[
+                    f"{dim}={quote(str(value), safe='')}"
+                    for dim, value in coords.items()
+                ]
+            )
+            directory.mkdir(parents=True, exist_ok=True)
+            pq.write_table(
+                table,
+                directory / "part-0.parquet",
+                compression="zstd",
+                row_group_size=row_group_size,
+            )
     else:
         filepath = f"{filepath}.gzip"
+        writer = None
+        try:
+            for table in _iter_results_tables(lca_results):
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        filepath, table.schema, compression="gzip"
+                    )
+                writer.write_table(table, row_group_size=row_group_size)
+        finally:
+            if writer is not None:
+                writer.close()
 
-    flattened_data = lca_results.values.flatten()
+    print(f"Results exported to {filepath}")
 
-    # Step 2: Find the indices of non-zero values
-    non_zero_indices = np.nonzero(flattened_data)[0]
+    return filepath
 
-    # Step 3: Extract non-zero values
-    non_zero_values = flattened_data[non_zero_indices]
 
-    # Step 4: Get the shape of the original DataArray
-    original_shape = lca_results.shape
+def _results_chunks(lca_results: xr.DataArray) -> Tuple[int, ...]:
+    """
+    Chunk shape used when writing LCA results to Zarr or NetCDF:
+    one chunk per (model, scenario, year), whole along the other dimensions.
+    :param lca_results: Xarray DataArray with LCA results.
+    :return: Tuple of chunk sizes, in the order of the dimensions.
+    """
+    return tuple(
+        1 if dim in ("model", "scenario", "year") else size
+        for dim, size in lca_results.sizes.items()
+    )
 
-    # Step 5: Find the coordinates corresponding to the non-zero indices
-    coords = np.array(np.unravel_index(non_zero_indices, original_shape)).T
 
-    # Step 6: Create a pandas DataFrame with non-zero values and corresponding coordinates
-    coord_names = list(lca_results.dims)
-    coord_values = {
-        dim: lca_results.coords[dim].values[coords[:, i]]
-        for i, dim in enumerate(coord_names)
-    }
+def _results_to_dataset(lca_results: xr.DataArray) -> xr.Dataset:
+    """
+    Wrap the LCA results in a Dataset that can be written by the Zarr and NetCDF backends.
+    :param lca_results: Xarray DataArray with LCA results.
+    :return: xr.Dataset with a single `lca_results` variable.
+    """
+    dataset = lca_results.to_dataset(name="lca_results")
+    # string coordinates are stored as variable-length strings
+    for dim in dataset.dims:
+        if dataset[dim].dtype == object:
+            dataset[dim] = dataset[dim].astype(str)
+    return dataset
 
-    df = pd.DataFrame(coord_values)
-    df["value"] = non_zero_values
-    df.to_parquet(path=filepath, compression="gzip")
 
+def export_results_to_zarr(
+    lca_results: xr.DataArray, filepath: str, compression_level: int = 5
+) -> str:
+    """
+    Export the LCA results to a chunked, zstd-compressed Zarr store.
+    :param lca_results: Xarray DataArray with LCA results.
+    :param filepath: The path to the Zarr store, without extension.
+    :param compression_level: zstd compression level.
+    :return: The path to the Zarr store.
+    """
+    try:
+        from numcodecs import Blosc
+    except ImportError as err:
+        raise ImportError(
+            "Exporting to Zarr requires `zarr`. Install it with `pip install zarr`."
+        ) from err
+
+    filepath = f"{filepath}.zarr"
+    _results_to_dataset(lca_results).to_zarr(
+        filepath,
+        mode="w",
+        encoding={
+            "lca_results": {
+                "chunks": _results_chunks(lca_results),
+                "compressor": Blosc(
+                    cname="zstd", clevel=compression_level, shuffle=Blosc.SHUFFLE
+                ),
+            }
+        },
+    )
     print(f"Results exported to {filepath}")
 
     return filepath
 
 
+def export_results_to_netcdf(
+    lca_results: xr.DataArray, filepath: str, compression_level: int = 4
+) -> str:
+    """
+    Export the LCA results to a chunked, zlib-compressed NetCDF4 file.
+    :param lca_results: Xarray DataArray with LCA results.
+    :param filepath: The path to the NetCDF file, without extension.
+    :param compression_level: zlib compression level.
+    :return: The path to the NetCDF file.
+    """
+    try:
+        import netCDF4  # noqa: F401
+    except ImportError as err:
+        raise ImportError(
+            "Exporting to NetCDF requires `netCDF4`. "
+            "Install it with `pip install netCDF4`."
+        ) from err
+
+    filepath = f"{filepath}.nc"
+    _results_to_dataset(lca_results).to_netcdf(
+        filepath,
+        engine="netcdf4",
+        encoding={
+            "lca_results": {
+                "zlib": True,
+                "complevel": compression_level,
+                "chunksizes": _results_chunks(lca_results),
+            }
+        },
+    )
+    print(f"Results exported to {filepath}")
+
+    return filepath
+
+
+def export_results_to_arrow(lca_results: xr.DataArray, filepath: str) -> str:
+    """
+    Export the non-zero LCA results to an Arrow IPC file, in long format.
+    The file is written one (model, scenario, year) record batch at a time
+    and can be memory-mapped for zero-copy reads.
+    :param lca_results: Xarray DataArray with LCA results.
+    :param filepath: The path to the Arrow file, without extension.
+    :return: The path to the Arrow file.
+    """
+    filepath = f"{filepath}.arrow"
+    writer = None
+    try:
+        for table in _iter_results_tables(lca_results):
+            if writer is None:
+                writer = pa.ipc.new_file(filepath, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"Results exported to {filepath}")
+
+    return filepath
+
+
+def export_results(
+    lca_results: xr.DataArray,
+    filepath: str = None,
+    format: str = "parquet",
+    **kwargs,
+) -> str:
+    """
+    Export the LCA results to one of the supported formats:
+
+    - "parquet": non-zero values in long format (see `export_results_to_parquet`).
+    - "zarr": chunked and compressed array (requires `zarr`).
+    - "netcdf": chunked and compressed array (requires `netCDF4`).
+    - "arrow": non-zero values in long format, as an Arrow IPC file.
+
+    :param lca_results: Xarray DataArray with LCA results.
+    :param filepath: The path to the file, without extension.
+    :param format: The export format.
+    :param kwargs: Additional arguments passed to the format-specific exporter.
+    :return: The path to the exported file.
+    """
+    exporters = {
+        "parquet": export_results_to_parquet,
+        "zarr": export_results_to_zarr,
+        "netcdf": export_results_to_netcdf,
+        "arrow": export_results_to_arrow,
+    }
+    if format not in exporters:
+        raise ValueError(
+            f"Format {format} is not supported. Choose one of {list(exporters)}."
+        )
+
+    if filepath is None:
+        filepath = f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    return exporters[format](lca_results, filepath, **kwargs)
+
+
+def load_results(filepath: str) -> Union[xr.DataArray, pa.Table, ds.Dataset]:
+    """
+    Open LCA results exported with `export_results`, without loading them in memory.
+
+    Zarr stores and NetCDF files are returned as a lazily-loaded xarray DataArray.
+    Arrow IPC files are memory-mapped and returned as a pyarrow Table.
+    Parquet files and partitioned datasets are returned as a pyarrow Dataset.
+
+    :param filepath: The path to the exported results.
+    :return: xr.DataArray, pyarrow.Table or pyarrow.dataset.Dataset
+    """
+    filepath = Path(filepath)
+    if not filepath.exists():
+        raise FileNotFoundError(f"File {filepath} does not exist.")
+
+    if filepath.suffix == ".zarr":
+        return xr.open_dataarray(filepath, engine="zarr", chunks=None)
+    if filepath.suffix == ".nc":
+        return xr.open_dataarray(filepath)
+    if filepath.suffix == ".arrow":
+        return pa.ipc.open_file(pa.memory_map(str(filepath))).read_all()
+    if filepath.is_dir():
+        return ds.dataset(filepath, format="parquet", partitioning="hive")
+    return ds.dataset(filepath, format="parquet")
+
+
+def _split_contributions(
+    values: np.ndarray, cutoff: float, top_n: int = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split contributions into those to display and those to aggregate into "other".
+    :param values: Array of contributions, with `act_category` along the first axis.
+    :param cutoff: Contributions below or equal to the cutoff go to "other".
+    :param top_n: If given, only the `top_n` largest contributions of each cell are displayed.
+    :return: Tuple of (mask of displayed contributions, sum of the other contributions).
+    """
+    keep = values > cutoff
+
+    if top_n is not None and top_n < values.shape[0]:
+        largest = np.argpartition(
+            -np.where(np.isnan(values), -np.inf, values), top_n - 1, axis=0
+        )[:top_n]
+        in_top = np.zeros(values.shape, dtype=bool)
+        np.put_along_axis(in_top, largest, True, axis=0)
+        keep &= in_top
+
+    other = np.where(keep | np.isnan(values), 0, values).sum(axis=0)
+
+    return keep, other
+
+
 def display_results(
     lca_results: Union[xr.DataArray, None],
     cutoff: float = 0.001,
     interpolate: bool = False,
+    top_n: int = None,
+    selection: dict = None,
 ) -> xr.DataArray:
     """
     Display the LCA results.
     Remove results below a cutoff value and aggregate them into a single category.
+
+    The results are processed one (model, scenario, region) block at a time,
+    so that lazily-opened results (see `load_results`) are only read block by block.
+
     :param lca_results: The LCA results.
     :param cutoff: The cutoff value.
-    :param interpolate: A boolean indicating whether to interpolate the results.
+    :param interpolate: A boolean indicating whether to interpolate the results
+    to every year of the selection.
+    :param top_n: If given, only display the `top_n` largest activity categories
+    of each cell, and aggregate the rest into the "other" category.
+    :param selection: Dictionary of {dimension: coordinate(s)} to display.
     :return: The LCA results.
     :rtype: xr.DataArray
     """
     if lca_results is None:
         raise ValueError("No results to display")
 
-    if len(lca_results.year) > 1 and interpolate:
-        lca_results = lca_results.interp(
-            year=np.arange(lca_results.year.min(), lca_results.year.max() + 1),
-            kwargs={"fill_value": "extrapolate"},
-            method="linear",
+    if top_n is not None and top_n < 1:
+        raise ValueError("top_n must be a positive integer.")
+
+    if selection:
+        lca_results = lca_results.sel(
+            {
+                dim: [value] if np.isscalar(value) else value
+                for dim, value in selection.items()
+            }
         )
 
-    above_cutoff = lca_results.where(lca_results > cutoff)
+    years = lca_results.coords["year"].values
+    interpolate = interpolate and len(years) > 1
+    if interpolate:
+        years = np.arange(years.min(), years.max() + 1)
 
-    # Step 2: Aggregate values below the cutoff across the 'act_category' dimension
-    # Summing all values below the cutoff for each combination of other dimensions
-    below_cutoff = lca_results.where(lca_results <= cutoff).sum(dim="act_category")
+    coords = {dim: lca_results.coords[dim].values for dim in lca_results.dims}
+    coords["act_category"] = np.append(coords["act_category"], "other")
+    coords["year"] = years
 
-    # Since summing removes the 'act_category', we need to add it back
-    # Create a new coordinate for 'act_category' that includes 'other'
-    new_act_category = np.append(lca_results.act_category.values, "other")
+    combined = xr.DataArray(
+        np.zeros([len(v) for v in coords.values()]),
+        coords=coords,
+        dims=lca_results.dims,
+    )
 
-    # Create a new DataArray for below-cutoff values with 'act_category' as 'other'
-    # This involves broadcasting below_cutoff to match the original array's dimensions but with 'act_category' replaced
-    other_data = below_cutoff.expand_dims({"act_category": ["other"]}, axis=0)
+    block_dims = tuple(
+        dim for dim in ("model", "scenario", "region") if dim in lca_results.dims
+    )
+    block_shape = [dim for dim in combined.dims if dim not in block_dims]
+    displayed = np.zeros(len(coords["act_category"]) - 1, dtype=bool)
+
+    for block_coords, block in iter_results_blocks(lca_results, block_dims):
+        if interpolate:
+            block = block.interp(
+                year=years,
+                kwargs={"fill_value": "extrapolate"},
+                method="linear",
+            )
 
-    # Step 3: Combine the above-cutoff data with the new 'other' data
-    # Concatenate along the 'act_category' dimension
-    combined = xr.concat([above_cutoff, other_data], dim="act_category")
+        block = block.transpose("act_category", ...)
+        values = block.values
+        keep, other = _split_contributions(values, cutoff, top_n)
+        displayed |= keep.reshape(len(keep), -1).any(axis=1)
 
-    # Ensure the 'act_category' coordinate is updated to include 'other'
-    combined = combined.assign_coords({"act_category": new_act_category})
+        combined.loc[block_coords] = (
+            xr.DataArray(
+                np.concatenate([np.where(keep, values, np.nan), other[None]]),
+                dims=block.dims,
+            )
+            .transpose(*block_shape)
+            .values
+        )
+
+    if top_n is not None:
+        # only keep the activity categories displayed in at least one cell
+        combined = combined.isel(
+            act_category=np.append(np.flatnonzero(displayed), len(displayed))
+        )
 
     return combined
 
@@ -358,10 +872,19 @@ def get_visible_files(path: str) -> list[Path]:
     return [file for file in Path(path).iterdir() if not file.name.startswith(".")]
 
 
-def clean_cache_directory():
-    # clean up the cache directory
+def clean_cache_directory(max_age: float = None):
+    """
+    Remove the temporary files left in the cache directory.
+    The cache store (see `pathways.cache`), which lives in a subdirectory, is kept.
+    :param max_age: If given, only remove files older than `max_age` seconds,
+    so that the files of concurrent runs are left untouched.
+    """
+    now = time.time()
     for file in get_visible_files(DIR_CACHED_DB):
-        file.unlink()
+        if not file.is_file():
+            continue
+        if max_age is None or now - file.stat().st_mtime > max_age:
+            file.unlink(missing_ok=True)
 
 
 def resize_scenario_data(
@@ -396,8 +919,7 @@ def resize_scenario_data(
         scenario_data.coords["variables"].values.tolist().index(x) for x in variables
     ]
 
-    # Resize the scenario data
-    scenario_data = scenario_data.isel(
+    indexers = dict(
         model=model_idx,
         pathway=scenario_idx,
         year=year_idx,
@@ -405,9 +927,116 @@ def resize_scenario_data(
         variables=variable_idx,
     )
 
+    # Resize the scenario data
+    if is_sparse(scenario_data):
+        # sparse arrays only support indexing
+        # along one dimension at a time
+        for dim, idx in indexers.items():
+            scenario_data = scenario_data.isel({dim: idx})
+    else:
+        scenario_data = scenario_data.isel(**indexers)
+
     return scenario_data
 
 
+@lru_cache(maxsize=None)
+def get_geomap(model: str) -> Geomap:
+    """
+    Return the Geomap object of a given IAM model.
+    Geomap objects are created once per model and process.
+    If the model is not known to premise, a Geomatcher object is returned instead.
+
+    :param model: The name of the IAM model.
+    :return: Geomap object.
+    """
+    try:
+        return Geomap(model=model)
+    except FileNotFoundError:
+        from constructive_geometries import Geomatcher
+
+        geo = Geomatcher()
+        geo.model = model
+        geo.geo = geo
+        return geo
+
+
+def _location_fallbacks_filepath(model: str) -> Path:
+    """
+    Path to the file storing the location fallbacks of a model.
+    The file is specific to the installed version of premise,
+    which provides the IAM to ecoinvent location mappings.
+    """
+    try:
+        premise_version = version("premise")
+    except PackageNotFoundError:
+        premise_version = "unknown"
+    return DIR_GEOMAP / f"{model.lower()}_premise_{premise_version}.json"
+
+
+def get_location_fallbacks(
+    model: str, regions: List[str], geo: Geomap = None
+) -> Dict[str, List[str]]:
+    """
+    Get, for each region, the ordered list of locations to look
+    activities up for: the region itself, the ecoinvent locations
+    the region maps to, and `DEFAULT_LOCATIONS`.
+
+    Results are cached per model in memory and on disk (in `DIR_GEOMAP`),
+    so that they are shared across years, workers and runs.
+
+    :param model: The name of the IAM model.
+    :param regions: List of regions.
+    :param geo: Geomap object. If None, it is fetched with `get_geomap`.
+    :return: A dictionary mapping regions to lists of locations.
+    """
+    fallbacks = _LOCATION_FALLBACKS.setdefault(model, {})
+    filepath = _location_fallbacks_filepath(model)
+
+    missing = [r for r in regions if r not in fallbacks]
+    if missing and filepath.exists():
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                fallbacks.update(json.load(f))
+        except (OSError, ValueError) as err:
+            logger.warning("Could not read location fallbacks %s: %s", filepath, err)
+        missing = [r for r in regions if r not in fallbacks]
+
+    if missing:
+        geo = geo or get_geomap(model)
+        for region in missing:
+            locations = [region]
+            if (geo.model.upper(), region) in geo.geo:
+                locations.extend(geo.iam_to_ecoinvent_location(region))
+            locations.extend(DEFAULT_LOCATIONS)
+            # remove duplicates, but keep the order
+            fallbacks[region] = list(dict.fromkeys(locations))
+
+        # write to a temporary file first, so that
+        # concurrent processes never read a partial file
+        tmp_filepath = filepath.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_filepath, "w", encoding="utf-8") as f:
+            json.dump(fallbacks, f)
+        os.replace(tmp_filepath, filepath)
+
+    return {region: fallbacks[region] for region in regions}
+
+
+def build_activity_location_index(
+    technosphere_index: Dict[Tuple, int],
+) -> Dict[Tuple[str, str, str], Dict[str, int]]:
+    """
+    Re-arrange the technosphere index as a
+    (name, reference product, unit) -> {location: index} mapping.
+
+    :param technosphere_index: Technosphere index.
+    :return: A dictionary mapping activities to their indices per location.
+    """
+    index = defaultdict(dict)
+    for (name, reference_product, unit, location), idx in technosphere_index.items():
+        index[(name, reference_product, unit)][location] = int(idx)
+    return dict(index)
+
+
 def get_activity_indices(
     activities: List[Tuple],
     technosphere_index: Dict[Tuple, Any],
@@ -416,31 +1045,18 @@ def get_activity_indices(
 ) -> List[int]:
     """
     Fetch the indices of activities in the technosphere matrix, optimized for efficiency.
+    Locations are tried in the order given by `get_location_fallbacks`.
     """
 
-    # Cache for previously computed IAM to Ecoinvent mappings
-    location_cache = {}
+    location_fallbacks = get_location_fallbacks(
+        geo.model, list({activity[-1] for activity in activities}), geo
+    )
 
     indices = []  # Output list of indices
 
     for activity in activities:
-        possible_locations = [activity[-1]]  # Start with the activity's own region
-
-        # Extend possible locations with IAM mappings, if applicable
-        if (geo.model.upper(), activity[-1]) in geo.geo:
-            # Use cached result if available
-            if activity[-1] in location_cache:
-                possible_locations.extend(location_cache[activity[-1]])
-            else:
-                mappings = geo.iam_to_ecoinvent_location(activity[-1])
-                location_cache[activity[-1]] = mappings
-                possible_locations.extend(mappings)
-
-        # Add default locations to the end of the search list
-        possible_locations.extend(["RoW", "GLO", "RER", "CH"])
-
         # Attempt to find the index in technosphere_index
-        for loc in possible_locations:
+        for loc in location_fallbacks[activity[-1]]:
             idx = technosphere_index.get((activity[0], activity[1], activity[2], loc))
             if idx is not None:
                 indices.append(int(idx))
@@ -450,18 +1066,25 @@ def get_activity_indices(
             indices.append(None)
 
             if debug:
-                logging.warning(
-                    f"Activity {activity} not found in the technosphere matrix."
+                logger.warning(
+                    "Activity %s not found in the technosphere matrix.", activity
                 )
 
     return indices
 
 
 def fetch_indices(
-    mapping: dict, regions: list, variables: list, technosphere_index: dict, geo: Geomap
+    mapping: dict,
+    regions: list,
+    variables: list,
+    technosphere_index: dict,
+    geo: Geomap = None,
+    location_fallbacks: Dict[str, List[str]] = None,
 ) -> dict:
     """
     Fetch the indices for the given activities in the technosphere matrix.
+    All regions and variables are resolved in one pass over an index of
+    the technosphere built once, using cached location fallbacks.
 
     :param mapping: Mapping of scenario variables to LCA datasets.
     :type mapping: dict
@@ -471,12 +1094,17 @@ def fetch_indices(
     :type variables: list
     :param technosphere_index: Technosphere index.
     :type technosphere_index: dict
-    :param geo: Geomap object.
+    :param geo: Geomap object. Only used if `location_fallbacks` is not given.
     :type geo: Geomap
+    :param location_fallbacks: Locations to try for each region (see `get_location_fallbacks`).
+    :type location_fallbacks: dict
     :return: Dictionary of indices.
     :rtype: dict
     """
 
+    if location_fallbacks is None:
+        location_fallbacks = get_location_fallbacks(geo.model, regions, geo)
+
     # Pre-process mapping data to minimize repetitive data access
     activities_info = {
         variable: (
@@ -487,30 +1115,33 @@ def fetch_indices(
         for variable in variables
     }
 
+    location_index = build_activity_location_index(technosphere_index)
+    activities_locations = {
+        variable: location_index.get(activity, {})
+        for variable, activity in activities_info.items()
+    }
+
     # Initialize dictionary to hold indices
     vars_idx = {}
 
     for region in regions:
-        # Construct activities list for the current region
-        activities = [
-            (name, ref_product, unit, region)
-            for name, ref_product, unit in activities_info.values()
-        ]
-
-        # Use _get_activity_indices to fetch indices
-        idxs = get_activity_indices(activities, technosphere_index, geo)
-
-        # Map variables to their indices and associated dataset information
-        vars_idx[region] = {
-            variable: {
+        candidates = location_fallbacks[region]
+        vars_idx[region] = {}
+
+        for variable, activity in activities_info.items():
+            locations = activities_locations[variable]
+            idx = next((locations[loc] for loc in candidates if loc in locations), None)
+
+            if idx is None:
+                logger.warning(
+                    "Could not find activity %s for region %s.", activity, region
+                )
+
+            # Map variables to their indices and associated dataset information
+            vars_idx[region][variable] = {
                 "idx": idx,
-                "dataset": activities[i],
+                "dataset": (*activity, region),
             }
-            for i, (variable, idx) in enumerate(zip(variables, idxs))
-        }
-
-        if len(variables) != len(idxs):
-            logging.warning(f"Could not find all activities for region {region}.")
 
     return vars_idx
 
@@ -538,8 +1169,8 @@ def fetch_inventories_locations(technosphere_indices: dict) -> List[str]:
     :return: List of locations.
     """
 
-    locations = list(set([act[3] for act in technosphere_indices]))
-    logging.info(f"Unique locations in LCA database: {locations}")
+    locations = sorted(set([act[3] for act in technosphere_indices]))
+    logger.debug("Unique locations in LCA database: %s", locations)
 
     return locations
 
@@ -562,7 +1193,7 @@ def csv_to_dict(filename: str) -> dict[int, tuple[str, ...]]:
                 value = row[4]
                 output_dict[int(value)] = key
             else:
-                logging.warning(f"Row {row} has less than 5 items.")
+                logger.warning("Row %s has less than 5 items.", row)
 
     return output_dict
 
@@ -61,6 +61,7 @@ setup(
         "pyarrow",
         "fastparquet",
     ],
+    entry_points={"console_scripts": ["pathways = pathways.cli:main"]},
     url="https://github.com/polca/pathways",
     description="Scenario-level LCA of energy systems and transition pathways",
     long_description_content_type="text/markdown",
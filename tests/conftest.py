@@ -0,0 +1,42 @@
+import pytest
+
+import pathways.cache
+import pathways.checkpoints
+import pathways.lca
+import pathways.lcia
+import pathways.pathways
+import pathways.utils
+from benchmarks.synthetic import generate_datapackage
+
+
+@pytest.fixture
+def synthetic(request, tmp_path, monkeypatch):
+    """
+    Path to a synthetic datapackage, calculated with a cache, checkpoints
+    and Monte Carlo statistics of its own, so that the user's are left untouched.
+    Parametrize it indirectly to change the arguments of `generate_datapackage`.
+    """
+    filepath = generate_datapackage(
+        tmp_path / "datapackage",
+        **{
+            "n_activities": 30,
+            "technosphere_nnz": 120,
+            "n_regions": 2,
+            "n_variables": 3,
+            **getattr(request, "param", {}),
+        },
+    )
+    monkeypatch.setattr(pathways.lcia, "LCIA_METHODS", filepath.parent / "lcia.json")
+
+    cache_directory = tmp_path / "cache"
+    cache_directory.mkdir()
+    for module in (pathways.cache, pathways.lca, pathways.pathways, pathways.utils):
+        monkeypatch.setattr(module, "DIR_CACHED_DB", cache_directory)
+    monkeypatch.setattr(
+        pathways.checkpoints, "DIR_CHECKPOINTS", tmp_path / "checkpoints"
+    )
+    monkeypatch.setattr(pathways.pathways, "STATS_DIR", tmp_path / "stats")
+
+    pathways.cache.get_cache.cache_clear()
+    yield str(filepath)
+    pathways.cache.get_cache.cache_clear()
@@ -0,0 +1,59 @@
+import inspect
+
+import pytest
+
+import pathways.lcia
+from benchmarks import bench_lca, bench_pathways
+from benchmarks.bench_memory import COMPONENTS, check_thresholds, measure
+from pathways import Pathways
+
+
+@pytest.fixture(autouse=True)
+def restore_lcia_methods(monkeypatch):
+    monkeypatch.setattr(pathways.lcia, "LCIA_METHODS", pathways.lcia.LCIA_METHODS)
+
+
+def _run_benchmarks(module, size="small"):
+    """
+    Run each benchmark of a module once, for the first value of its parameters.
+    """
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__ != module.__name__:
+            continue
+        bench = cls()
+        params = [p[0] for p in getattr(cls, "params", [])]
+        if getattr(cls, "param_names", [None])[0] == "size":
+            params[0] = size
+        bench.setup(*params)
+        try:
+            for name, method in inspect.getmembers(bench, inspect.ismethod):
+                if name.startswith("time_"):
+                    method(*params)
+        finally:
+            if hasattr(bench, "teardown"):
+                bench.teardown(*params)
+
+
+def test_generate_datapackage(synthetic):
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+
+    assert p.lca_results.sizes["region"] == 2
+    assert p.lca_results.sizes["variable"] == 3
+    assert p.lca_results.sum() > 0
+
+
+def test_benchmarks_run():
+    for module in (bench_lca, bench_pathways):
+        _run_benchmarks(module)
+
+
+def test_memory_measurements():
+    measurements = measure("small-monte-carlo", multiprocessing=False)
+
+    assert measurements["peak rss"] >= measurements["rss increase"] > 0
+    assert all(measurements[component] > 0 for component in COMPONENTS)
+
+    thresholds = {"small-monte-carlo": {"results array": 0, "peak rss": 1e6}}
+    exceeded = check_thresholds({"small-monte-carlo": measurements}, thresholds)
+    assert [metric for _, metric, _, _ in exceeded] == ["results array"]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from pathways import Pathways
+from pathways.utils import BREAKDOWN_DIMS, TOTAL
+
+
+def test_totals_are_the_sum_of_the_full_breakdown(synthetic):
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+    full = p.lca_results.sum(["act_category", "location"])
+
+    q = Pathways(synthetic)
+    q.calculate(demand_cutoff=0, multiprocessing=False, breakdown="totals")
+
+    assert q.lca_results.coords["act_category"].values.tolist() == [TOTAL]
+    assert q.lca_results.coords["location"].values.tolist() == [TOTAL]
+    assert q.plan(breakdown="totals")["results dims"]["location"] == 1
+    np.testing.assert_allclose(
+        q.lca_results.sum(["act_category", "location"]).values,
+        full.values,
+        rtol=1e-9,
+    )
+
+    # switching the breakdown discards the previous results
+    p.calculate(demand_cutoff=0, multiprocessing=False, breakdown="totals")
+    np.testing.assert_allclose(p.lca_results.values, q.lca_results.values)
+
+
+@pytest.mark.parametrize("breakdown", [[], ["act_category"], ["location", "variable"]])
+def test_dimensions_left_out_are_summed(synthetic, breakdown):
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+    summed = [dim for dim in BREAKDOWN_DIMS if dim not in breakdown]
+    expected = p.lca_results.sum(summed)
+
+    q = Pathways(synthetic)
+    q.calculate(demand_cutoff=0, multiprocessing=False, breakdown=breakdown)
+
+    for dim in summed:
+        assert q.lca_results.coords[dim].values.tolist() == [TOTAL]
+    for dim in breakdown:
+        assert q.lca_results.sizes[dim] == p.lca_results.sizes[dim]
+    np.testing.assert_allclose(
+        q.lca_results.squeeze(summed, drop=True).transpose(*expected.dims).values,
+        expected.values,
+        rtol=1e-9,
+    )
+
+
+def test_summed_variables_are_recalculated(synthetic):
+    p = Pathways(synthetic)
+    variables = p.scenarios.coords["variables"].values.tolist()
+    p.calculate(
+        variables=variables[:1],
+        demand_cutoff=0,
+        multiprocessing=False,
+        breakdown=["act_category"],
+    )
+    p.calculate(demand_cutoff=0, multiprocessing=False, breakdown=["act_category"])
+
+    q = Pathways(synthetic)
+    q.calculate(demand_cutoff=0, multiprocessing=False, breakdown=["act_category"])
+
+    np.testing.assert_allclose(p.lca_results.values, q.lca_results.values)
+
+
+def test_totals_with_distributions(synthetic):
+    p = Pathways(synthetic)
+    blocks = list(
+        p.iter_calculate(
+            demand_cutoff=0,
+            use_distributions=3,
+            multiprocessing=False,
+            breakdown="totals",
+        )
+    )
+
+    assert blocks
+    for block in blocks:
+        assert block.sizes["act_category"] == block.sizes["location"] == 1
+        assert block.sizes["quantile"] == 3
+        assert np.isfinite(block.values).all()
+
+
+def test_unknown_breakdown(synthetic):
+    with pytest.raises(ValueError, match="breakdown"):
+        Pathways(synthetic).calculate(breakdown="partial")
+    with pytest.raises(ValueError, match="breakdown"):
+        Pathways(synthetic).calculate(breakdown=["region"])
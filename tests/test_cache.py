@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+from pathways.cache import Cache, make_key
+
+
+def test_make_key_depends_on_file_content_and_params(tmp_path):
+    filepath = tmp_path / "A_matrix.csv"
+    filepath.write_text("1;2;3")
+    key = make_key("load", files=[filepath])
+
+    assert make_key("load", files=[filepath]) == key
+    assert make_key("other", files=[filepath]) != key
+
+    filepath.write_text("1;2;4")
+    os.utime(filepath, ns=(0, 1))
+    assert make_key("load", files=[filepath]) != key
+
+
+def test_cache_get_or_compute_records_hits_and_misses(tmp_path):
+    cache = Cache(tmp_path)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.arange(3)
+
+    for _ in range(2):
+        value = cache.get_or_compute("abcd", compute)
+        np.testing.assert_array_equal(value, np.arange(3))
+
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = Cache(tmp_path, max_size=2500)
+    value = np.zeros(100)  # ~ 1 kB once pickled
+
+    cache.set("aa01", value)
+    cache.set("aa02", value)
+    # mark the first entry as the oldest one
+    os.utime(cache._path("aa01"), (0, 0))
+    cache.set("aa03", value)
+
+    assert "aa01" not in cache
+    assert "aa02" in cache
+    assert "aa03" in cache
+    assert cache.stats()["size"] <= 2500
+
+
+def test_cache_counts_are_flushed_once(tmp_path):
+    cache = Cache(tmp_path)
+    cache.set("abcd", 1)
+    for _ in range(3):
+        cache.get("abcd")
+    cache.get("efgh")
+
+    # hits and misses are only shared once flushed
+    assert not (tmp_path / "stats.json").exists()
+    cache.flush()
+    other = Cache(tmp_path)
+    other.get("abcd")
+    assert other.stats()["hits"] == 4
+    assert other.stats()["misses"] == 1
+
+
+def test_cache_only_scans_entries_over_budget(tmp_path, monkeypatch):
+    cache = Cache(tmp_path, max_size=2500)
+    value = np.zeros(100)  # ~ 1 kB once pickled
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    cache.set("aa01", value)
+    cache.set("aa02", value)
+    cache.set("aa02", value)
+    assert len(scans) == 1
+
+    cache.set("aa03", value)
+    assert len(scans) == 2
+    assert cache.stats()["size"] <= 2500
@@ -0,0 +1,70 @@
+import numpy as np
+import xarray as xr
+
+import pathways.checkpoints
+import pathways.pathways
+from pathways import Pathways
+from pathways.checkpoints import load_checkpoint, save_checkpoint
+from pathways.lca import _calculate_year_with_timings
+
+
+def test_save_and_load_checkpoint(tmp_path):
+    results = xr.DataArray(
+        np.arange(6.0).reshape(1, 1, 2, 1, 3),
+        dims=["act_category", "variable", "region", "location", "impact_category"],
+        coords={
+            "act_category": ["cat"],
+            "variable": ["var"],
+            "region": ["R1", "R2"],
+            "location": ["GLO"],
+            "impact_category": ["m1", "m2", "m3"],
+        },
+    )
+    assert load_checkpoint(tmp_path, "model", "scenario/1", 2030) is None
+
+    save_checkpoint(tmp_path, "model", "scenario/1", 2030, results)
+    loaded = load_checkpoint(tmp_path, "model", "scenario/1", 2030)
+
+    xr.testing.assert_equal(loaded, results)
+    assert load_checkpoint(tmp_path, "model", "scenario/1", 2040) is None
+
+
+def test_failures_are_isolated_and_resumed(synthetic, monkeypatch):
+    reference = Pathways(synthetic)
+    reference.calculate(demand_cutoff=0, multiprocessing=False)
+    years = reference.lca_results.coords["year"].values.tolist()
+    # checkpoints are only saved to be resumed
+    assert not pathways.checkpoints.DIR_CHECKPOINTS.exists()
+
+    calls = []
+
+    def failing(args):
+        calls.append(args[2])
+        if args[2] == years[-1]:
+            raise RuntimeError("worker crashed")
+        return _calculate_year_with_timings(args)
+
+    monkeypatch.setattr(pathways.pathways, "_calculate_year_with_timings", failing)
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False, retries=2, resume=True)
+
+    # the failing year is tried three times, and the others are calculated
+    assert calls.count(years[-1]) == 3
+    assert p.lca_results.sel(year=years[-1]).sum() == 0
+    np.testing.assert_allclose(
+        p.lca_results.sel(year=years[0]).values,
+        reference.lca_results.sel(year=years[0]).values,
+    )
+
+    def counting(args):
+        calls.append(args[2])
+        return _calculate_year_with_timings(args)
+
+    calls.clear()
+    monkeypatch.setattr(pathways.pathways, "_calculate_year_with_timings", counting)
+    q = Pathways(synthetic)
+    q.calculate(demand_cutoff=0, multiprocessing=False, resume=True)
+
+    # completed years are loaded from the checkpoints
+    assert calls == [years[-1]]
+    np.testing.assert_allclose(q.lca_results.values, reference.lca_results.values)
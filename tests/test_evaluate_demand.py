@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pytest
+
+import pathways.pathways
+from pathways import Pathways
+
+
+def test_evaluate_demand(synthetic, monkeypatch):
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+    cells = {
+        dim: p.lca_results.coords[dim].values[-1].item()
+        for dim in ("model", "scenario", "year", "region")
+    }
+    reference = p.lca_results.sel(cells)
+
+    results = p.evaluate_demand(**cells)
+    np.testing.assert_allclose(
+        results.values, reference.transpose(*results.dims).values
+    )
+
+    # later evaluations only use the impacts kept in memory
+    def fail(*args):
+        raise AssertionError("calculated again")
+
+    monkeypatch.setattr(pathways.pathways, "_calculate_block", fail)
+    variable = results.coords["variable"].values[0]
+    demand = p.scenarios.sel(
+        model=cells["model"],
+        pathway=cells["scenario"],
+        region=cells["region"],
+        year=cells["year"],
+        variables=variable,
+    ).item()
+    assert reference.sel(variable=variable).sum() != 0
+
+    start = time.time()
+    results = p.evaluate_demand(**cells, demand_overrides={variable: 1.1 * demand})
+    assert time.time() - start < 1
+
+    expected = reference.transpose(*results.dims).values.copy()
+    expected[:, 0] *= 1.1
+    np.testing.assert_allclose(results.values, expected)
+
+    with pytest.raises(ValueError):
+        p.evaluate_demand(**cells, demand_overrides={"unknown": 1})
+
+
+def test_evaluate_demand_with_harmonized_units(synthetic):
+    p = Pathways(synthetic)
+    variables = p.scenarios.coords["variables"].values.tolist()
+    # variables in PJ/yr and EJ/yr are harmonized to EJ/yr
+    p.scenarios.attrs["units"] = {
+        variable: "PJ/yr" if v == 0 else "EJ/yr" for v, variable in enumerate(variables)
+    }
+    p.units = {"PJ/yr": {"kilogram": 1e9}, "EJ/yr": {"kilogram": 1e12}}
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+    cells = {
+        dim: p.lca_results.coords[dim].values[0].item()
+        for dim in ("model", "scenario", "year", "region")
+    }
+    reference = p.lca_results.sel(cells)
+
+    # overrides are in the units of the scenario data, before harmonization
+    demand = p.scenarios.sel(
+        model=cells["model"],
+        pathway=cells["scenario"],
+        region=cells["region"],
+        year=cells["year"],
+        variables=variables[0],
+    ).item()
+    results = p.evaluate_demand(**cells, demand_overrides={variables[0]: 1.1 * demand})
+
+    expected = reference.transpose(*results.dims).values.copy()
+    expected[:, 0] *= 1.1
+    np.testing.assert_allclose(results.values, expected)
+
+
+def test_evaluate_demand_keeps_the_last_intensities(synthetic, monkeypatch):
+    monkeypatch.setattr(pathways.pathways, "MAX_INTENSITIES", 1)
+    p = Pathways(synthetic)
+    cells = {
+        dim: p.scenarios.coords[coord].values[0]
+        for dim, coord in (
+            ("model", "model"),
+            ("scenario", "pathway"),
+            ("year", "year"),
+        )
+    }
+
+    for region in p.scenarios.coords["region"].values.tolist():
+        p.evaluate_demand(**cells, region=region)
+        assert len(p._intensities) == 1
+        assert next(iter(p._intensities))[3] == region
@@ -0,0 +1,108 @@
+import json
+import threading
+from multiprocessing import Pool
+
+import pytest
+
+from pathways.instrumentation import (
+    COLUMNS,
+    add_hook,
+    collect_timings,
+    emit,
+    export_trace,
+    remove_hook,
+    stage,
+    track_peak_memory,
+)
+
+
+def test_stage_records_context_and_measures():
+    with collect_timings() as records:
+        with stage("solve", model="model", scenario="scen", year=2030):
+            sum(range(1000))
+
+    assert len(records) == 1
+    record = records[0]
+    assert set(record) == set(COLUMNS)
+    assert record["stage"] == "solve"
+    assert (record["model"], record["scenario"], record["year"]) == (
+        "model",
+        "scen",
+        2030,
+    )
+    assert record["region"] is None
+    assert record["wall"] >= 0 and record["cpu"] >= 0
+
+
+def test_worker_records_reach_hooks_once():
+    seen = []
+    add_hook(seen.append)
+    try:
+        with collect_timings() as records:
+            # records of a worker are not passed to the hooks...
+            with collect_timings(call_hooks=False) as worker_records:
+                with stage("aggregation", region="EUR"):
+                    pass
+            assert seen == []
+            assert records == []
+
+            # ... until the main process emits them again
+            for record in worker_records:
+                emit(record)
+    finally:
+        remove_hook(seen.append)
+
+    assert [r["region"] for r in seen] == ["EUR"]
+    assert records == seen
+
+
+def test_collectors_are_specific_to_each_thread():
+    barrier = threading.Barrier(2)
+    collected = {}
+
+    def run(name):
+        with collect_timings() as records:
+            # both collectors are active when the stages complete
+            barrier.wait()
+            with stage(name):
+                pass
+            barrier.wait()
+        collected[name] = [record["stage"] for record in records]
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in "AB"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert collected == {"A": ["A"], "B": ["B"]}
+
+
+def test_export_trace(tmp_path):
+    with collect_timings() as records:
+        with stage("export"):
+            pass
+
+    filepath = export_trace(records, tmp_path / "trace.json")
+
+    with open(filepath) as f:
+        events = json.load(f)["traceEvents"]
+    assert events[0]["name"] == "export"
+    assert events[0]["ph"] == "X"
+
+
+def _allocate(n_bytes):
+    import numpy as np
+
+    return int(np.ones(n_bytes // 8).sum())
+
+
+def test_track_peak_memory_includes_workers():
+    pytest.importorskip("psutil")
+
+    with track_peak_memory() as memory:
+        with Pool(2) as pool:
+            pool.map(_allocate, [100 * 1024**2] * 2)
+
+    # two workers holding 100 MB each
+    assert memory["peak"] - memory["baseline"] > 150
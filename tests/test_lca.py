@@ -1,10 +1,22 @@
 from pathlib import Path
 from unittest.mock import mock_open, patch
 
+import bw2calc as bc
 import numpy as np
 import pytest
+import xarray as xr
 
-from pathways.lca import load_matrix_and_index, read_indices_csv
+import pathways.lca
+import pathways.pathways
+from pathways import Pathways
+from pathways.lca import (
+    create_demand_tensor,
+    flag_demands_below_cutoff,
+    get_lca_matrices,
+    load_matrix_and_index,
+    read_indices_csv,
+)
+from pathways.lcia import fill_characterization_factors_matrices
 
 
 def test_read_indices_csv_success():
@@ -58,3 +70,175 @@ def test_load_matrix_and_index(tmp_path):
     assert np.array_equal(indices_array, expected_output[1])
     assert np.array_equal(flip_array, expected_output[2])
     assert np.array_equal(distributions_array, expected_output[3])
+
+
+def test_create_demand_tensor():
+    scenarios = xr.DataArray(
+        np.array([[[[[1.0, 2.0], [0.0, 0.0]], [[3.0, np.nan], [0.0, 0.0]]]]]),
+        dims=["model", "pathway", "variables", "region", "year"],
+        coords={
+            "model": ["model1"],
+            "pathway": ["scenario1"],
+            "variables": ["var1", "var2"],
+            "region": ["region1", "region2"],
+            "year": [2020, 2030],
+        },
+    )
+    scenarios.attrs["units"] = {"var1": "EJ/yr", "var2": "kilogram"}
+    mapping = {
+        "var1": {"dataset": [{"unit": "kilowatt hour"}]},
+        "var2": {"dataset": [{"unit": "kilogram"}]},
+    }
+    units_map = {"EJ/yr": {"kilowatt hour": 2.0}}
+
+    demands = create_demand_tensor(
+        scenarios,
+        model="model1",
+        scenario="scenario1",
+        regions=["region1", "region2"],
+        years=[2020, 2030],
+        variables=["var1", "var2"],
+        mapping=mapping,
+        units_map=units_map,
+    )
+
+    assert demands["demand"].shape == (2, 2, 2)
+    np.testing.assert_array_equal(demands["unit vector"], [2.0, 1.0])
+    np.testing.assert_array_equal(demands["demand"][:, 0, 0], [2.0, 3.0])
+    np.testing.assert_array_equal(demands["demand"][:, 0, 1], [4.0, 0.0])
+    # missing values are no demand
+    assert not demands["demand"][:, 1].any()
+
+
+def test_flag_demands_below_cutoff():
+    demand = np.array([[0.0, 1e-4], [-2.0, 5.0]])
+    skip = flag_demands_below_cutoff(demand, demand_cutoff=1e-3)
+    np.testing.assert_array_equal(skip, [[True, True], [False, False]])
+
+    skip = flag_demands_below_cutoff(demand, demand_cutoff=0)
+    np.testing.assert_array_equal(skip, [[True, False], [False, False]])
+
+
+def test_shared_activities_are_solved_once(synthetic, monkeypatch):
+    # all the regions fall back on the same global activities
+    def get_location_fallbacks(model, regions):
+        return {region: ["GLO"] for region in regions}
+
+    monkeypatch.setattr(
+        pathways.pathways, "get_location_fallbacks", get_location_fallbacks
+    )
+    solved = []
+
+    class MultiLCA(bc.MultiLCA):
+        def __init__(self, demands, *args, **kwargs):
+            solved.append(demands)
+            super().__init__(demands, *args, **kwargs)
+
+    monkeypatch.setattr(pathways.lca.bc, "MultiLCA", MultiLCA)
+
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+    results = p.lca_results.isel(model=0, scenario=0, year=0)
+    model, scenario, year = (
+        results.coords[dim].item() for dim in ("model", "scenario", "year")
+    )
+    regions = results.coords["region"].values.tolist()
+    variables = results.coords["variable"].values.tolist()
+    methods = results.coords["impact_category"].values.tolist()
+    assert len(regions) >= 2 and results.any()
+
+    # each distinct activity is solved once, whatever the number of regions
+    assert len(solved[0]) == len(variables)
+
+    # compared to a solve of the demand of each region and variable
+    bw_datapackage, _, biosphere_indices, _, vars_info = get_lca_matrices(
+        p.filepaths,
+        model,
+        scenario,
+        year,
+        mapping=p.mapping,
+        regions=regions,
+        variables=variables,
+        location_fallbacks=get_location_fallbacks(model, regions),
+    )
+    fus = {
+        f"{region}|{variable}": {
+            vars_info[region][variable]["idx"]: p.scenarios.sel(
+                model=model,
+                pathway=scenario,
+                region=region,
+                year=year,
+                variables=variable,
+            ).item()
+        }
+        for region in regions
+        for variable in variables
+    }
+    lca = bc.MultiLCA(
+        demands=fus,
+        method_config={"impact_categories": []},
+        data_objs=[bw_datapackage],
+    )
+    lca.lci()
+    characterization_matrix = fill_characterization_factors_matrices(
+        methods, lca.dicts.biosphere, biosphere_indices
+    )
+    for region in regions:
+        for variable in variables:
+            np.testing.assert_allclose(
+                results.sel(region=region, variable=variable)
+                .sum(["act_category", "location"])
+                .values,
+                (characterization_matrix @ lca.inventories[f"{region}|{variable}"])
+                .sum(axis=1)
+                .A1,
+                rtol=1e-9,
+            )
+
+
+def test_variables_without_activity_have_no_results(synthetic):
+    p = Pathways(synthetic)
+    variable = p.scenarios.coords["variables"].values[0]
+    p.mapping[variable]["dataset"][0]["name"] = "missing activity"
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+
+    assert not p.lca_results.sel(variable=variable).any()
+    assert p.lca_results.drop_sel(variable=variable).any()
+
+
+def test_unit_results_are_cached_per_method(synthetic, monkeypatch):
+    solved = []
+    characterize_inventories = pathways.lca.characterize_inventories
+
+    def counting(lca, characterization_matrix, *args):
+        # number of methods solved for
+        solved.append(characterization_matrix.shape[0])
+        return characterize_inventories(lca, characterization_matrix, *args)
+
+    monkeypatch.setattr(pathways.lca, "characterize_inventories", counting)
+
+    def calculate(p, methods):
+        solved.clear()
+        p.calculate(methods=methods, demand_cutoff=0, multiprocessing=False)
+        return solved
+
+    p = Pathways(synthetic)
+    methods = p.lcia_methods
+    years = p.scenarios.coords["year"].values.tolist()
+    assert calculate(p, methods[:-1]) == [len(methods) - 1] * len(years)
+    locations = p.lca_results.coords["location"].values.tolist()
+
+    # adding a method only solves for that method
+    assert calculate(Pathways(synthetic), methods) == [1] * len(years)
+    # and a repeated calculation solves nothing
+    assert calculate(Pathways(synthetic), methods) == []
+
+    # results depend on the classifications and on the geography mapping
+    p = Pathways(synthetic)
+    p.classifications = {k: "other category" for k in p.classifications}
+    assert calculate(p, methods) == [len(methods)] * len(years)
+
+    p = Pathways(
+        synthetic, geography_mapping={location: "World" for location in locations}
+    )
+    assert calculate(p, methods) == [len(methods)] * len(years)
@@ -0,0 +1,53 @@
+import logging
+from multiprocessing import Pool
+
+import pytest
+
+from pathways.logs import configure_logging, logger, worker_logging
+
+
+def _log_from_worker(message):
+    logging.getLogger("pathways.lca").info("worker says %s", message)
+
+
+@pytest.fixture
+def restore_logger():
+    handlers, level = logger.handlers[:], logger.level
+    yield
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+    for handler in handlers:
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def test_nothing_forwarded_if_not_configured():
+    with worker_logging() as (initializer, initargs):
+        assert initializer is None
+        assert initargs == ()
+
+
+def test_configure_logging_writes_module_records(tmp_path, restore_logger):
+    filepath = tmp_path / "pathways.log"
+    configure_logging(level="DEBUG", filename=filepath)
+
+    logging.getLogger("pathways.utils").debug("value: %s", 42)
+
+    for handler in logger.handlers:
+        handler.flush()
+    assert "pathways.utils" in filepath.read_text()
+    assert "value: 42" in filepath.read_text()
+
+
+def test_worker_records_are_handled_by_main_process(tmp_path, restore_logger):
+    filepath = tmp_path / "pathways.log"
+    configure_logging(level="INFO", filename=filepath)
+
+    with worker_logging() as (initializer, initargs):
+        with Pool(2, initializer=initializer, initargs=initargs) as pool:
+            pool.map(_log_from_worker, ["a", "b"])
+
+    content = filepath.read_text()
+    assert "worker says a" in content
+    assert "worker says b" in content
@@ -1,7 +1,9 @@
 from unittest.mock import Mock
 
+import numpy as np
 import pytest
 
+from pathways import Pathways
 from pathways.utils import _get_mapping, _group_technosphere_indices
 
 
@@ -24,3 +26,19 @@ def test_get_mapping():
     assert (
         _get_mapping(mock_data) == expected_mapping
     ), "Mapping does not match expected dictionary"
+
+
+def test_calculate_discards_results_of_other_settings(synthetic):
+    p = Pathways(synthetic)
+    regions = p.scenarios.coords["region"].values.tolist()
+    p.calculate(regions=regions[:1], demand_cutoff=0, multiprocessing=False)
+    p.calculate(regions=regions, demand_cutoff=0, multiprocessing=False)
+    # results of the same settings are extended
+    assert p.lca_results.coords["region"].values.tolist() == regions
+
+    p.calculate(regions=regions[1:], demand_cutoff=0.5, multiprocessing=False)
+    assert p.lca_results.coords["region"].values.tolist() == regions[1:]
+
+    q = Pathways(synthetic)
+    q.calculate(regions=regions[1:], demand_cutoff=0.5, multiprocessing=False)
+    np.testing.assert_allclose(p.lca_results.values, q.lca_results.values)
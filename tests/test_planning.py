@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import pathways.pathways
+from pathways import Pathways
+from pathways.planning import count_lines, get_results_array_size
+
+
+def test_count_lines(tmp_path):
+    filepath = tmp_path / "file.csv"
+    filepath.write_text("a;b\n1;2\n3;4")
+    assert count_lines(filepath) == 3
+    filepath.write_text("a;b\n1;2\n")
+    assert count_lines(filepath) == 2
+
+
+def test_get_results_array_size():
+    assert get_results_array_size({"a": 2, "b": 3}) == 48
+
+
+def test_plan(synthetic):
+    p = Pathways(synthetic)
+    plan = p.plan(demand_cutoff=0, multiprocessing=False)
+
+    n_years = len(p.scenarios.coords["year"])
+    assert len(plan["work items"]) == n_years
+    assert plan["workers"] == 1
+    assert plan["matrices"]["activities"] == 30
+    assert plan["matrices"]["technosphere exchanges"] > 0
+    assert plan["memory"]["results array"] == get_results_array_size(
+        plan["results dims"]
+    )
+    assert plan["memory"]["peak"] > plan["memory"]["results array"]
+    assert plan["memory"]["monte carlo buffers"] == 0
+    assert plan["runtime"] > 0
+    # nothing is calculated
+    assert p.lca_results is None
+
+    mc_plan = p.plan(demand_cutoff=0, use_distributions=5, multiprocessing=False)
+    assert mc_plan["results dims"]["quantile"] == 3
+    assert mc_plan["memory"]["monte carlo buffers"] > 0
+
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+    # computed cells are not planned again
+    assert len(p.plan(demand_cutoff=0, multiprocessing=False)["work items"]) == 0
+
+
+def test_calculate_max_memory(synthetic):
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0, multiprocessing=False)
+
+    plan = Pathways(synthetic).plan(demand_cutoff=0, multiprocessing=False)
+    peak = plan["memory"]["peak"] / 1024**2
+    without_results = peak - plan["memory"]["results array"] / 1024**2
+
+    q = Pathways(synthetic)
+    with pytest.raises(MemoryError):
+        q.calculate(
+            demand_cutoff=0,
+            multiprocessing=False,
+            max_memory=without_results,
+            out_of_memory="raise",
+        )
+    with pytest.raises(MemoryError):
+        q.calculate(demand_cutoff=0, multiprocessing=False, max_memory=0)
+    assert q.lca_results is None
+
+    # the results array is stored on disk
+    q.calculate(demand_cutoff=0, multiprocessing=False, max_memory=without_results)
+    assert q._results_filepath.exists()
+    np.testing.assert_allclose(q.lca_results.values, p.lca_results.values)
+
+
+def test_calculate_only_plans_with_max_memory(synthetic, monkeypatch):
+    def make_plan(*args, **kwargs):
+        raise AssertionError("planned without max_memory")
+
+    # a memory budget is known whenever psutil is installed
+    monkeypatch.setattr(pathways.pathways, "get_memory_budget", lambda *args: 1e6)
+    monkeypatch.setattr(Pathways, "_make_plan", make_plan)
+
+    p = Pathways(synthetic)
+    p.calculate(demand_cutoff=0)
+    assert p.lca_results.sum() > 0
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+import pytest
+
+import pathways.instrumentation
+import pathways.scheduler
+from pathways.scheduler import budgeted_imap, budgeted_map, limit_threads
+
+
+def _allocate(size):
+    """
+    Hold `size` MB for a while, and return when it ran.
+    """
+    start = time.time()
+    data = bytearray(size * 1024**2)
+    time.sleep(0.3)
+    del data
+    return start, time.time()
+
+
+def _add(a, b):
+    return a + b
+
+
+def _flaky(filepath):
+    """
+    Fail on the first call only.
+    """
+    if not os.path.exists(filepath):
+        open(filepath, "w").close()
+        raise RuntimeError("first call")
+    return filepath
+
+
+def _overlaps(intervals):
+    intervals = sorted(intervals)
+    return any(start < end for (_, end), (start, _) in zip(intervals, intervals[1:]))
+
+
+def test_budgeted_map_order():
+    with Pool(2) as pool:
+        outputs = budgeted_map(
+            pool, _add, [(1, 2), (3, 4), (5, 6)], workers=2, star=True
+        )
+    assert outputs == [3, 7, 11]
+
+
+def test_budgeted_imap_memory_budget():
+    pytest.importorskip("psutil")
+
+    with Pool(3) as pool:
+        # only one task fits in the budget at a time
+        intervals = [
+            output
+            for _, output in budgeted_imap(
+                pool,
+                _allocate,
+                [50] * 3,
+                workers=3,
+                footprints=[50] * 3,
+                memory_budget=80,
+            )
+        ]
+        assert not _overlaps(intervals)
+
+        intervals = [
+            output
+            for _, output in budgeted_imap(
+                pool, _allocate, [50] * 3, workers=3, footprints=[50] * 3
+            )
+        ]
+        assert _overlaps(intervals)
+
+
+def test_budgeted_imap_raises():
+    with Pool(2) as pool:
+        with pytest.raises(TypeError):
+            budgeted_map(pool, _add, [(1, 2), (3, "a")], workers=2, star=True)
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_budgeted_map_retries(tmp_path, processes):
+    args = [str(tmp_path / "a"), str(tmp_path / "b")]
+    pool = Pool(processes) if processes else None
+    try:
+        outputs = budgeted_map(pool, _flaky, args, workers=2, errors="return")
+        assert all(isinstance(output, RuntimeError) for output in outputs)
+
+        for filepath in args:
+            os.remove(filepath)
+        assert budgeted_map(pool, _flaky, args, workers=2, retries=1) == args
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def test_budgeted_imap_executor_and_cancel():
+    cancel = threading.Event()
+    with ThreadPoolExecutor(2) as executor:
+        outputs = budgeted_map(
+            executor, _add, [(1, 2), (3, "a")], workers=2, star=True, errors="return"
+        )
+        assert outputs[0] == 3
+        assert isinstance(outputs[1], TypeError)
+
+        outputs = []
+        for _, output in budgeted_imap(
+            executor, _allocate, [1] * 6, workers=2, cancel=cancel
+        ):
+            outputs.append(output)
+            cancel.set()
+
+    # the running tasks are discarded, and no other task is started
+    assert len(outputs) == 1
+
+
+def test_budgeted_map_without_memory_measures(monkeypatch):
+    # e.g., on Windows without psutil
+    monkeypatch.setattr(pathways.instrumentation, "psutil", None)
+    monkeypatch.setattr(pathways.instrumentation, "resource", None)
+
+    with ThreadPoolExecutor(2) as executor:
+        for footprints in (None, [10, 10, 10]):
+            outputs = budgeted_map(
+                executor,
+                _add,
+                [(1, 2), (3, 4), (5, 6)],
+                workers=2,
+                footprints=footprints,
+                memory_budget=15,
+                star=True,
+            )
+            assert outputs == [3, 7, 11]
+
+
+def test_limit_threads(monkeypatch):
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        monkeypatch.delenv(variable, raising=False)
+    calls = []
+    monkeypatch.setattr(
+        pathways.scheduler,
+        "threadpool_limits",
+        lambda limits=None: calls.append(limits),
+    )
+
+    limit_threads(2)
+    assert calls == [2]
+    assert os.environ["OMP_NUM_THREADS"] == "2"
+    assert os.environ["MKL_NUM_THREADS"] == "2"
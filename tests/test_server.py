@@ -0,0 +1,122 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import pathways.lca
+import pathways.server
+from benchmarks.synthetic import generate_datapackage
+from pathways import Pathways
+from pathways.cache import get_cache
+from pathways.server import Server, make_server
+
+
+@pytest.fixture
+def url(synthetic):
+    httpd = make_server(port=0, datapackages=[synthetic])
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _query(url, path, query=None):
+    data = None if query is None else json.dumps(query).encode()
+    with urllib.request.urlopen(url + path, data=data) as response:
+        return json.loads(response.read())
+
+
+def test_server_queries(synthetic, url, monkeypatch):
+    reference = Pathways(synthetic)
+    reference.calculate(demand_cutoff=0, multiprocessing=False)
+    year = int(reference.lca_results.coords["year"].values[0])
+
+    assert len(_query(url, "/status")["datapackages"]) == 1
+
+    answer = _query(
+        url,
+        "/calculate",
+        {"datapackage": synthetic, "arguments": {"demand_cutoff": 0}},
+    )
+    assert answer["shape"] == list(reference.lca_results.shape)
+
+    answer = _query(
+        url, "/results", {"datapackage": synthetic, "select": {"year": year}}
+    )
+    np.testing.assert_allclose(
+        np.array(answer["data"]),
+        reference.lca_results.sel(year=[year]).transpose(*answer["dims"]).values,
+    )
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _query(url, "/results", {"datapackage": synthetic, "select": {"day": 1}})
+    assert error.value.code == 400
+
+    # large results are to be queried in slices
+    monkeypatch.setattr(
+        pathways.server, "MAX_RESULT_VALUES", np.array(answer["data"]).size
+    )
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _query(url, "/results", {"datapackage": synthetic})
+    assert error.value.code == 400
+
+
+def test_server_evicts_datapackages(synthetic, tmp_path):
+    other = generate_datapackage(
+        tmp_path / "other",
+        n_activities=30,
+        technosphere_nnz=120,
+        n_regions=2,
+        n_variables=3,
+    )
+    server = Server(max_datapackages=1)
+
+    first, _ = server.get_pathways(synthetic)
+    assert server.get_pathways(synthetic)[0] is first
+
+    server.get_pathways(other)
+    assert server.status()["datapackages"] == [str(other.resolve())]
+    assert server.get_pathways(synthetic)[0] is not first
+
+
+@pytest.mark.parametrize("breakdown", ["full", "totals"])
+def test_server_keeps_matrices(synthetic, monkeypatch, breakdown):
+    reference = Pathways(synthetic)
+    reference.calculate(demand_cutoff=0, breakdown=breakdown, multiprocessing=False)
+    methods = reference.lca_results.coords["impact_category"].values.tolist()
+    assert len(methods) > 1
+    # solve the unit demands again
+    get_cache().clear()
+
+    factorized = []
+    splu = pathways.lca.splu
+    monkeypatch.setattr(
+        pathways.lca, "splu", lambda matrix: factorized.append(matrix) or splu(matrix)
+    )
+
+    server = Server(max_matrices=100)
+    server.calculate(
+        synthetic, {"demand_cutoff": 0, "breakdown": breakdown, "methods": methods[:1]}
+    )
+    assert factorized
+    assert server.status()["matrices"] == len(factorized)
+
+    # other methods are calculated with the matrices kept
+    count = len(factorized)
+    server.calculate(
+        synthetic, {"demand_cutoff": 0, "breakdown": breakdown, "methods": methods}
+    )
+    assert len(factorized) == count
+
+    results = server.get_pathways(synthetic)[0].lca_results
+    np.testing.assert_allclose(
+        results.transpose(*reference.lca_results.dims)
+        .sel({dim: reference.lca_results.coords[dim] for dim in results.dims})
+        .values,
+        reference.lca_results.values,
+        rtol=1e-6,
+    )
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pathways import Pathways, merge_shards
+from pathways.cli import main
+from pathways.shards import get_shard
+from pathways.utils import load_results
+
+
+def test_get_shard():
+    work = list(range(10))
+    shards = [get_shard(work, shard, 3) for shard in range(3)]
+
+    assert shards == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert get_shard(work[:2], 2, 3) == []
+    with pytest.raises(ValueError):
+        get_shard(work, 3, 3)
+
+
+@pytest.mark.parametrize("synthetic", [{"n_regions": 3}], indirect=True)
+def test_shards_are_merged(synthetic, tmp_path):
+    reference = Pathways(synthetic)
+    reference.calculate(demand_cutoff=0, multiprocessing=False, use_distributions=3)
+    stats = tmp_path / "stats"
+
+    for shard in range(3):
+        args = [
+            "calculate",
+            synthetic,
+            "--demand-cutoff",
+            "0",
+            "--use-distributions",
+            "3",
+            "--no-multiprocessing",
+            "--shard",
+            str(shard),
+            "--num-shards",
+            "3",
+            "--shard-directory",
+            str(tmp_path / "shared"),
+        ]
+        assert main(args) == 0
+        if shard == 0:
+            # all shards are needed
+            with pytest.raises(ValueError):
+                merge_shards(tmp_path / "shared", stats_directory=stats)
+
+    output = tmp_path / "results"
+    assert (
+        main(
+            [
+                "merge",
+                str(tmp_path / "shared"),
+                "--output",
+                str(output),
+                "--format",
+                "netcdf",
+                "--stats-directory",
+                str(stats),
+            ]
+        )
+        == 0
+    )
+
+    merged = load_results(f"{output}.nc")
+    expected = reference.lca_results.transpose(*merged.dims)
+    np.testing.assert_allclose(
+        merged.sel({dim: expected.coords[dim] for dim in merged.dims}).values,
+        expected.values,
+    )
+
+    # Monte Carlo statistics of all regions are merged
+    statistics = sorted(stats.glob("*.xlsx"))
+    assert len(statistics) == reference.lca_results.sizes["year"]
+    impacts = pd.read_excel(statistics[0], sheet_name="Total impacts")
+    assert impacts["region"].nunique() == 3
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import pathways.pathways
+from pathways import Pathways
+from pathways.lca import _calculate_year_with_timings
+
+
+@pytest.mark.parametrize("use_distributions", [0, 3])
+def test_iter_calculate_yields_the_results_of_calculate(synthetic, use_distributions):
+    reference = Pathways(synthetic)
+    reference.calculate(
+        demand_cutoff=0, use_distributions=use_distributions, multiprocessing=False
+    )
+
+    p = Pathways(synthetic)
+    blocks = list(
+        p.iter_calculate(
+            demand_cutoff=0, use_distributions=use_distributions, multiprocessing=False
+        )
+    )
+
+    assert p.lca_results is None
+    assert len(blocks) == np.prod(
+        [reference.lca_results.sizes[dim] for dim in ("model", "scenario", "year")]
+    )
+    for block in blocks:
+        coords = {
+            dim: block.coords[dim].item() for dim in ("model", "scenario", "year")
+        }
+        expected = reference.lca_results.sel(coords).transpose(*block.dims)
+        xr.testing.assert_allclose(block, expected)
+
+
+def test_iter_calculate_with_workers(synthetic):
+    reference = Pathways(synthetic)
+    reference.calculate(demand_cutoff=0, multiprocessing=False)
+
+    p = Pathways(synthetic)
+    for block in p.iter_calculate(demand_cutoff=0, multiprocessing=True):
+        coords = {
+            dim: block.coords[dim].item() for dim in ("model", "scenario", "year")
+        }
+        np.testing.assert_allclose(
+            block.values,
+            reference.lca_results.sel(coords).transpose(*block.dims).values,
+        )
+
+
+def test_calculate_async(synthetic):
+    reference = Pathways(synthetic)
+    reference.calculate(demand_cutoff=0, multiprocessing=False)
+
+    async def calculate():
+        p = Pathways(synthetic)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            return [
+                block
+                async for block in p.calculate_async(demand_cutoff=0, executor=executor)
+            ]
+
+    blocks = asyncio.run(calculate())
+
+    assert len(blocks) == np.prod(
+        [reference.lca_results.sizes[dim] for dim in ("model", "scenario", "year")]
+    )
+    for block in blocks:
+        coords = {
+            dim: block.coords[dim].item() for dim in ("model", "scenario", "year")
+        }
+        np.testing.assert_allclose(
+            block.values,
+            reference.lca_results.sel(coords).transpose(*block.dims).values,
+        )
+
+
+@pytest.mark.parametrize("synthetic", [{"n_years": 4}], indirect=True)
+def test_calculate_async_is_cancelled(synthetic, monkeypatch):
+    calls, release = [], threading.Event()
+
+    def gated(args):
+        calls.append(args[2])
+        # the calculations after the first one wait
+        if len(calls) > 1:
+            release.wait(timeout=30)
+        return _calculate_year_with_timings(args)
+
+    monkeypatch.setattr(pathways.pathways, "_calculate_year_with_timings", gated)
+    monkeypatch.setattr(pathways.pathways, "cpu_count", lambda: 1)
+
+    async def calculate(executor):
+        p = Pathways(synthetic)
+        async for _ in p.calculate_async(demand_cutoff=0, executor=executor):
+            break
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        start = time.time()
+        asyncio.run(calculate(executor))
+
+        # the running calculation is not waited for, and no other one is started
+        assert time.time() - start < 30
+        assert len(calls) == 2
+    finally:
+        release.set()
+        executor.shutdown()
+    assert len(calls) == 2
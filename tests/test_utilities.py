@@ -1,14 +1,27 @@
-from unittest.mock import mock_open, patch
+from unittest.mock import Mock, mock_open, patch
 
 import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
 import pytest
+import sparse as sp
 import xarray as xr
 
 from pathways.utils import (
+    TOTAL,
     clean_cache_directory,
     create_lca_results_array,
+    display_results,
+    export_results,
+    export_results_to_parquet,
+    extend_lca_results,
+    fetch_indices,
+    get_location_fallbacks,
     harmonize_units,
+    is_sparse,
     load_classifications,
+    load_results,
+    resize_scenario_data,
 )
 
 
@@ -99,7 +112,11 @@ def test_create_lca_results_array_structure_and_initialization():
     locations = ["location1", "location2"]
     models = ["model1", "model2"]
     scenarios = ["scenario1", "scenario2"]
-    classifications = {"activity1": "category1", "activity2": "category2"}
+    classifications = {
+        "activity1": "category2",
+        "activity2": "category1",
+        "activity3": "category2",
+    }
     mapping = {"variable1": "dataset1", "variable2": "dataset2"}
 
     result = create_lca_results_array(
@@ -108,6 +125,9 @@ def test_create_lca_results_array_structure_and_initialization():
 
     # Check dimensions and coordinates
     assert "act_category" in result.coords
+    # the order of activity categories must not change across runs,
+    # as cached results are laid out along it
+    assert list(result.coords["act_category"].values) == ["category1", "category2"]
     assert "impact_category" in result.coords
     assert "year" in result.coords
     assert "region" in result.coords
@@ -146,6 +166,26 @@ def test_create_lca_results_array_with_distributions():
     assert result.coords["quantile"].values.tolist() == [0.05, 0.5, 0.95]
 
 
+def test_create_lca_results_array_with_totals():
+    result = create_lca_results_array(
+        ["method1"],
+        [2020],
+        ["region1"],
+        ["CH", "DE"],
+        ["model1"],
+        ["scenario1"],
+        {"activity1": "category1", "activity2": "category2"},
+        {"variable1": "dataset1", "variable2": "dataset2"},
+        use_distributions=True,
+        breakdown="totals",
+    )
+
+    assert result.coords["act_category"].values.tolist() == [TOTAL]
+    assert result.coords["location"].values.tolist() == [TOTAL]
+    assert result.coords["variable"].values.tolist() == ["variable1", "variable2"]
+    assert result.shape == (1, 2, 1, 1, 1, 1, 1, 1, 3)
+
+
 def test_create_lca_results_array_empty_inputs():
     with pytest.raises(
         Exception
@@ -176,3 +216,241 @@ def test_clean_cache_directory(tmp_path, monkeypatch):
     assert (
         non_cache_dir / "temp_non_cache_file"
     ).exists(), "Non-cache file was incorrectly deleted"
+
+
+def test_harmonize_units_sparse_scenario():
+    dense = xr.DataArray(
+        np.array([[[1.0, 0.0]], [[0.0, 2.0]]]),
+        dims=["variables", "region", "year"],
+        coords={"variables": ["var1", "var2"]},
+    )
+    scenario = dense.copy(data=sp.COO.from_numpy(dense.values))
+    scenario.attrs["units"] = {"var1": "PJ/yr", "var2": "EJ/yr"}
+
+    harmonized_scenario = harmonize_units(scenario, ["var1", "var2"])
+
+    assert is_sparse(harmonized_scenario), "Scenario was densified"
+    assert harmonized_scenario.attrs["units"] == {"var1": "EJ/yr", "var2": "EJ/yr"}
+    np.testing.assert_allclose(
+        harmonized_scenario.data.todense(), [[[1e-3, 0.0]], [[0.0, 2.0]]]
+    )
+
+
+def test_resize_scenario_data_sparse():
+    dims = ["model", "pathway", "variables", "region", "year"]
+    values = np.arange(32, dtype=float).reshape(2, 2, 2, 2, 2)
+    coords = {
+        "model": ["m1", "m2"],
+        "pathway": ["s1", "s2"],
+        "variables": ["var1", "var2"],
+        "region": ["r1", "r2"],
+        "year": [2020, 2030],
+    }
+    dense = xr.DataArray(values, dims=dims, coords=coords)
+    scenario = dense.copy(data=sp.COO.from_numpy(values))
+
+    args = (["m2"], ["s2", "s1"], ["r1"], [2030], ["var2", "var1"])
+    resized = resize_scenario_data(scenario, *args)
+
+    assert is_sparse(resized)
+    np.testing.assert_array_equal(
+        resized.data.todense(), resize_scenario_data(dense, *args).values
+    )
+
+
+def test_fetch_indices_with_location_fallbacks():
+    technosphere_index = {
+        ("activity A", "product A", "kilogram", "FR"): 0,
+        ("activity A", "product A", "kilogram", "RoW"): 1,
+        ("activity B", "product B", "kilogram", "GLO"): 2,
+    }
+    mapping = {
+        "var A": {
+            "dataset": [
+                {
+                    "name": "activity A",
+                    "reference product": "product A",
+                    "unit": "kilogram",
+                }
+            ]
+        },
+        "var B": {
+            "dataset": [
+                {
+                    "name": "activity B",
+                    "reference product": "product B",
+                    "unit": "kilogram",
+                }
+            ]
+        },
+    }
+    location_fallbacks = {
+        "EUR": ["EUR", "FR", "RoW", "GLO"],
+        "USA": ["USA", "RoW", "GLO"],
+    }
+
+    vars_idx = fetch_indices(
+        mapping,
+        ["EUR", "USA"],
+        ["var A", "var B"],
+        technosphere_index,
+        location_fallbacks=location_fallbacks,
+    )
+
+    assert vars_idx["EUR"]["var A"]["idx"] == 0
+    assert vars_idx["USA"]["var A"]["idx"] == 1
+    assert vars_idx["USA"]["var B"]["idx"] == 2
+    assert vars_idx["USA"]["var B"]["dataset"] == (
+        "activity B",
+        "product B",
+        "kilogram",
+        "USA",
+    )
+
+
+def test_get_location_fallbacks_cached_on_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr("pathways.utils.DIR_GEOMAP", tmp_path)
+    monkeypatch.setattr("pathways.utils._LOCATION_FALLBACKS", {})
+
+    geo = Mock()
+    geo.model = "model"
+    geo.geo = {("MODEL", "EUR")}
+    geo.iam_to_ecoinvent_location.return_value = ["FR", "RoW"]
+
+    fallbacks = get_location_fallbacks("model", ["EUR", "USA"], geo)
+    assert fallbacks == {
+        "EUR": ["EUR", "FR", "RoW", "GLO", "RER", "CH"],
+        "USA": ["USA", "RoW", "GLO", "RER", "CH"],
+    }
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    # a new process reads the fallbacks from disk
+    monkeypatch.setattr("pathways.utils._LOCATION_FALLBACKS", {})
+    assert get_location_fallbacks("model", ["EUR"], Mock()) == {"EUR": fallbacks["EUR"]}
+
+
+def _small_lca_results():
+    coords = {
+        "act_category": ["cat A", "cat B"],
+        "variable": ["var A"],
+        "year": [2020, 2030],
+        "region": ["EUR", "USA"],
+        "location": ["FR"],
+        "model": ["model"],
+        "scenario": ["scen A", "scen/B"],
+        "impact_category": ["GWP"],
+    }
+    data = np.zeros([len(v) for v in coords.values()])
+    data[0, 0, 0, 0, 0, 0, 0, 0] = 1.0
+    data[1, 0, 1, 1, 0, 0, 1, 0] = 2.0
+    return xr.DataArray(data, coords=coords, dims=list(coords))
+
+
+def test_export_results_to_parquet_single_file(tmp_path):
+    filepath = export_results_to_parquet(_small_lca_results(), str(tmp_path / "res"))
+
+    df = pd.read_parquet(filepath)
+    assert len(df) == 2
+    assert df["value"].sum() == 3.0
+    assert set(df["scenario"]) == {"scen A", "scen/B"}
+
+
+def test_export_results_to_parquet_partitioned(tmp_path):
+    filepath = export_results_to_parquet(
+        _small_lca_results(), str(tmp_path / "res"), partitioned=True
+    )
+
+    df = ds.dataset(filepath, partitioning="hive").to_table().to_pandas()
+    assert len(df) == 2
+    row = df[df["value"] == 2.0].iloc[0]
+    assert row["act_category"] == "cat B"
+    assert row["year"] == 2030
+    assert row["region"] == "USA"
+    # one partition per non-empty (model, scenario, year) block
+    assert len(list(tmp_path.rglob("*.parquet"))) == 2
+
+
+def test_export_results_to_arrow_and_load(tmp_path):
+    filepath = export_results(
+        _small_lca_results(), str(tmp_path / "res"), format="arrow"
+    )
+
+    table = load_results(filepath)
+    assert table.num_rows == 2
+    assert sorted(table.column("value").to_pylist()) == [1.0, 2.0]
+    assert set(table.column("scenario").to_pylist()) == {"scen A", "scen/B"}
+
+
+@pytest.mark.parametrize("format, module", [("zarr", "zarr"), ("netcdf", "netCDF4")])
+def test_export_results_array_formats_and_load(tmp_path, format, module):
+    pytest.importorskip(module)
+    lca_results = _small_lca_results()
+
+    filepath = export_results(lca_results, str(tmp_path / "res"), format=format)
+
+    loaded = load_results(filepath)
+    assert loaded.dims == lca_results.dims
+    assert list(loaded.coords["scenario"].values) == ["scen A", "scen/B"]
+    np.testing.assert_array_equal(loaded.values, lca_results.values)
+
+
+def test_export_results_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_results(_small_lca_results(), str(tmp_path / "res"), format="csv")
+
+
+def _contributions_lca_results():
+    coords = {
+        "act_category": ["cat A", "cat B", "cat C", "cat D"],
+        "year": [2020, 2030],
+        "region": ["EUR", "USA"],
+        "model": ["model"],
+        "scenario": ["scen"],
+    }
+    data = np.zeros([len(v) for v in coords.values()])
+    data[:, 0, 0, 0, 0] = [4.0, 3.0, 2.0, 0.0001]
+    data[:, 1, 0, 0, 0] = [8.0, 6.0, 4.0, 0.0002]
+    data[:, :, 1, 0, 0] = 1.0
+    return xr.DataArray(data, coords=coords, dims=list(coords))
+
+
+def test_display_results_cutoff():
+    results = display_results(_contributions_lca_results(), cutoff=0.001)
+
+    assert list(results.act_category.values)[-1] == "other"
+    eur = results.sel(region="EUR", year=2020, model="model", scenario="scen")
+    assert np.isnan(eur.sel(act_category="cat D"))
+    assert eur.sel(act_category="other") == pytest.approx(0.0001)
+    assert float(eur.sum()) == pytest.approx(9.0001)
+
+
+def test_display_results_top_n_with_interpolation_on_selection():
+    results = display_results(
+        _contributions_lca_results(),
+        top_n=2,
+        interpolate=True,
+        selection={"region": "EUR"},
+    )
+
+    assert list(results.region.values) == ["EUR"]
+    assert list(results.year.values) == list(range(2020, 2031))
+    assert list(results.act_category.values) == ["cat A", "cat B", "other"]
+    cell = results.sel(region="EUR", year=2025, model="model", scenario="scen")
+    np.testing.assert_allclose(cell.values, [6.0, 4.5, 3.00015])
+
+
+def test_extend_lca_results_keeps_existing_cells():
+    lca_results = xr.DataArray(
+        np.ones((2, 1)),
+        coords={"region": ["EUR", "USA"], "impact_category": ["GWP"]},
+        dims=["region", "impact_category"],
+    )
+
+    assert extend_lca_results(lca_results, {"region": ["USA"]}) is lca_results
+
+    extended = extend_lca_results(
+        lca_results, {"region": ["CHN", "EUR"], "impact_category": ["GWP", "LU"]}
+    )
+    assert list(extended.region.values) == ["EUR", "USA", "CHN"]
+    assert list(extended.impact_category.values) == ["GWP", "LU"]
+    np.testing.assert_array_equal(extended.values, [[1, 0], [1, 0], [0, 0]])